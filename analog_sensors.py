@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import threading
+import time
+import numpy as np
+import hal
+import storage
+
+# pH- und EC-Sonden am ADS1115: Sensorname -> ADC-Kanal
+CHANNELS = {
+    'ph': 0,
+    'ec': 1,
+}
+# Wandlungen pro Sekunde im Dauerbetrieb (ADS1115: 8, 16, 32, 64, 128, 250, 475, 860)
+DATA_RATE = 64
+# Pro Zyklus werden BLOCK_SIZE Wandlungen je Kanal gelesen, danach ruht der Bus bis zum nächsten Zyklus
+BLOCK_SIZE = 16
+# Nach dem Umschalten des Multiplexers ist die erste Wandlung noch vom vorherigen Kanal
+SETTLE_SAMPLES = 1
+CYCLE_PERIOD = 2.0
+RING_SIZE = 256
+MEDIAN_WINDOW = 64
+# Werte weiter als SPIKE_MADS robuste Standardabweichungen vom Median werden gekappt
+SPIKE_MADS = 4.0
+EMA_ALPHA = 0.05
+
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')
+# Kalibrierpunkte (Spannung V, Messwert); ohne Datei typische Werte für pH- und EC-Module
+DEFAULT_CALIBRATION = {
+    'ph': [[1.96, 10.0], [2.50, 7.0], [3.04, 4.0]],
+    'ec': [[0.0, 0.0], [2.0, 2.77]],
+}
+
+def load_calibration(path=CALIBRATION_FILE, defaults=True):
+    # Gespeicherte Punkte ersetzen die Standardwerte einer Sonde vollständig
+    calibration = {name: list(points) for name, points in DEFAULT_CALIBRATION.items()} if defaults else {}
+    if os.path.exists(path):
+        with open(path) as f:
+            calibration.update(json.load(f))
+    return calibration
+
+def save_calibration(calibration, path=CALIBRATION_FILE):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def add_calibration_point(calibration, sensor, voltage, value):
+    # Ein Punkt pro Sollwert: neue Messung für denselben Pufferwert ersetzt die alte
+    points = [point for point in calibration.get(sensor, []) if point[1] != value]
+    points.append([round(voltage, 5), value])
+    calibration[sensor] = sorted(points)
+    return calibration
+
+def default_slope(sensor):
+    points = sorted(DEFAULT_CALIBRATION[sensor])
+    return (points[-1][1] - points[0][1]) / (points[-1][0] - points[0][0])
+
+def apply_calibration(points, voltage, slope=None):
+    # Stückweise linear zwischen den Kalibrierpunkten, außerhalb mit der Steigung des Randsegments.
+    # Bei nur einem Punkt (Ein-Punkt-Kalibrierung) wird die Standardsteigung verschoben.
+    points = sorted(points)
+    volts = np.array([point[0] for point in points])
+    values = np.array([point[1] for point in points])
+    if len(points) == 1:
+        return float(values[0] + (slope or 0.0) * (voltage - volts[0]))
+    if voltage < volts[0]:
+        slope = (values[1] - values[0]) / (volts[1] - volts[0])
+        return float(values[0] + slope * (voltage - volts[0]))
+    if voltage > volts[-1]:
+        slope = (values[-1] - values[-2]) / (volts[-1] - volts[-2])
+        return float(values[-1] + slope * (voltage - volts[-1]))
+    return float(np.interp(voltage, volts, values))
+
+def ema(previous, samples, alpha):
+    # EMA über einen ganzen Block ohne Python-Schleife: y_n = (1-a)^n y_0 + a * sum((1-a)^(n-1-i) x_i)
+    n = len(samples)
+    weights = (1.0 - alpha) ** np.arange(n - 1, -1, -1)
+    start = samples[0] if previous is None else previous
+    return float(start * (1.0 - alpha) ** n + alpha * np.dot(weights, samples))
+
+
+class ChannelFilter:
+    # Ringpuffer der Rohspannungen eines Kanals; Ausreißer werden am Median gekappt, dann geglättet
+    def __init__(self, ring_size=RING_SIZE, median_window=MEDIAN_WINDOW, alpha=EMA_ALPHA):
+        self.ring = np.zeros(ring_size)
+        self.count = 0
+        self.median_window = median_window
+        self.alpha = alpha
+        self.value = None
+
+    def window(self, size):
+        size = min(size, self.count, len(self.ring))
+        end = self.count % len(self.ring)
+        indices = np.arange(end - size, end) % len(self.ring)
+        return self.ring[indices]
+
+    def update(self, block):
+        indices = np.arange(self.count, self.count + len(block)) % len(self.ring)
+        self.ring[indices] = block
+        self.count += len(block)
+
+        recent = self.window(self.median_window)
+        median = np.median(recent)
+        # Median der absoluten Abweichungen als robustes Streumaß (1.4826 -> Standardabweichung)
+        spread = 1.4826 * np.median(np.abs(recent - median))
+        if spread > 0:
+            block = np.clip(block, median - SPIKE_MADS * spread, median + SPIKE_MADS * spread)
+        self.value = ema(self.value, block, self.alpha)
+        return self.value
+
+
+class AnalogAcquisition:
+    # Hintergrund-Thread für pH und EC: liest beide Kanäle blockweise im Dauerbetrieb des ADS1115,
+    # filtert im Speicher und meldet nur alle store_interval Sekunden einen Wert zum Speichern.
+    def __init__(self, adc=None, channels=None, data_rate=DATA_RATE, block_size=BLOCK_SIZE,
+                 period=CYCLE_PERIOD, calibration=None, store_interval=60.0, on_values=None):
+        self.adc = adc or hal.adc()
+        self.channels = channels or CHANNELS
+        self.data_rate = data_rate
+        self.block_size = block_size
+        self.period = period
+        self.calibration = calibration or load_calibration()
+        self.store_interval = store_interval
+        # on_values(Zeitstempel in ms, {Name: kalibrierter Wert})
+        self.on_values = on_values
+        self.filters = {name: ChannelFilter() for name in self.channels}
+        self.cycles = 0
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.adc.configure(self.data_rate, continuous=True)
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def latest(self):
+        with self._lock:
+            return dict(self._latest)
+
+    def cycle(self):
+        results = {}
+        for name, channel in self.channels.items():
+            block = self.adc.read_block(channel, self.block_size + SETTLE_SAMPLES)[SETTLE_SAMPLES:]
+            voltage = self.filters[name].update(block)
+            if name in self.calibration:
+                slope = default_slope(name) if name in DEFAULT_CALIBRATION else None
+                value = apply_calibration(self.calibration[name], voltage, slope)
+            else:
+                value = voltage
+            results[name] = {'voltage': round(voltage, 5), 'value': round(value, 3), 'timestamp': time.time()}
+        with self._lock:
+            self._latest.update(results)
+        self.cycles += 1
+        return results
+
+    def _worker(self):
+        next_store = time.monotonic() + self.store_interval
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                results = self.cycle()
+                if self.on_values and started >= next_store:
+                    next_store = started + self.store_interval
+                    self.on_values(storage.now_ms(), {name: result['value'] for name, result in results.items()})
+            except Exception as e:
+                print(f"Fehler beim Lesen von pH/EC: {e}")
+            self._stop.wait(max(self.period - (time.monotonic() - started), 0))
+
+
+def measure_voltage(acquisition, sensor, seconds):
+    # Gefilterte Spannung nach einer Einschwingzeit, für die Kalibrierung
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        acquisition.cycle()
+    return acquisition.filters[sensor].value
+
+def main():
+    parser = argparse.ArgumentParser(description="pH-/EC-Messung am ADS1115 anzeigen und kalibrieren.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('show', help="Aktuelle Spannungen und kalibrierte Werte anzeigen")
+    calibrate = subparsers.add_parser('calibrate', help="Sonde in Pufferlösung: Kalibrierpunkt speichern")
+    calibrate.add_argument('sensor', choices=sorted(CHANNELS))
+    calibrate.add_argument('value', type=float, help="Sollwert der Pufferlösung, z.B. 7.0 oder 1.413")
+    calibrate.add_argument('--seconds', type=float, default=30.0, help="Einschwingzeit vor der Messung")
+    subparsers.add_parser('reset', help="Gespeicherte Kalibrierung löschen")
+    args = parser.parse_args()
+
+    if args.command == 'reset':
+        if os.path.exists(CALIBRATION_FILE):
+            os.remove(CALIBRATION_FILE)
+        print("Kalibrierung zurückgesetzt.")
+        return
+
+    acquisition = AnalogAcquisition(period=0)
+    acquisition.adc.configure(acquisition.data_rate, continuous=True)
+    if args.command == 'calibrate':
+        print(f"Messe {args.sensor} für {args.seconds:g} s...")
+        voltage = measure_voltage(acquisition, args.sensor, args.seconds)
+        calibration = add_calibration_point(load_calibration(defaults=False), args.sensor, voltage, args.value)
+        save_calibration(calibration)
+        print(f"Kalibrierpunkt {args.sensor}: {voltage:.4f} V = {args.value:g} gespeichert.")
+        print(f"Punkte: {calibration[args.sensor]}")
+    else:
+        for i in range(10):
+            results = acquisition.cycle()
+        for name, result in results.items():
+            print(f"{name}: {result['voltage']:.4f} V -> {result['value']:.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -1,278 +1,593 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify, Response
+from flask import Flask, render_template, request, url_for, send_from_directory, send_file, jsonify, Response, g
 import datetime
+import json
 import os
-import glob
-import subprocess
 import time
 import sqlite3
-from picamera2 import Picamera2, MappedArray # Neu: Picamera2 Import
-import cv2 # Neu: OpenCV für JPEG-Komprimierung
-import numpy as np # Neu: Für Bildbearbeitung
+import tempfile
 import threading # Neu: Für Hintergrund-Kamera-Thread
-import io # Neu: Für In-Memory-Bildverarbeitung
-
+import storage
+from cooperative import run_blocking
+import timeseries
+import hal
+from frame_broadcaster import FrameBroadcaster
+from h264_stream import PLAYLIST_NAME, HLS_DIR as DEFAULT_HLS_DIR
+from camera_service import CameraService, PHOTO_INTERVAL
+from plant_analytics import ANALYTICS_INTERVAL
+from timelapse_jobs import TimelapseJobRunner
+from timelapse_render import parse_options as parse_timelapse_options
+import photo_catalog
+import live_events
+import response_cache
+import export_data
+import retention
+import plant_analytics
+import metrics
+import camera_stream
+from sampling_profiler import profiler
+from ds18b20 import TemperatureSampler
+from thumbnails import ThumbnailCache, Thumbnailer, THUMBNAIL_SIZES, best_format, format_info
+
+# Beim Import werden weder Hardware noch Threads angefasst; start_services() startet alles
+# beim ersten Request (oder direkt unter __main__). Kamera, 1-Wire und ADC kommen aus hal.py.
 app = Flask(__name__)
 
-# --- Datenbank Konfiguration ---
-DB_NAME = 'growbox_data.db'
-
-# --- DS18B20 Temperatursensor Konfiguration (wie gehabt) ---
-base_dir = '/sys/bus/w1/devices/'
-device_folder = ''
-device_file = ''
-
-def find_ds18b20():
-    try:
-        folders = [f for f in os.listdir(base_dir) if f.startswith('28-')]
-        if folders:
-            global device_folder, device_file
-            device_folder = os.path.join(base_dir, folders[0])
-            device_file = os.path.join(device_folder, 'w1_slave')
-            print(f"DS18B20 sensor found at: {device_folder}")
-            return True
-        else:
-            print("No DS18B20 sensor found.")
-            return False
-    except FileNotFoundError:
-        print("1-Wire directory not found. Is 1-Wire enabled?")
-        return False
-    except Exception as e:
-        print(f"Error finding DS18B20: {e}")
-        return False
-
-def read_temp_raw():
-    try:
-        if not device_file:
-            if not find_ds18b20():
-                return None
-        with open(device_file, 'r') as f:
-            lines = f.readlines()
-        return lines
-    except Exception as e:
-        print(f"Error reading raw temp: {e}")
-        return None
-
-def read_temp():
-    lines = read_temp_raw()
-    if lines is None:
-        return "N/A"
-
-    while lines[0].strip()[-3:] != 'YES':
-        time.sleep(0.2)
-        lines = read_temp_raw()
-        if lines is None:
-            return "N/A"
-
-    equals_pos = lines[1].find('t=')
-    if equals_pos != -1:
-        temp_string = lines[1][equals_pos+2:]
-        temp_c = float(temp_string) / 1000.0
-        return round(temp_c, 2)
-    return "N/A"
+# --- Datenbank Konfiguration (Verbindungen, Pragmas und Schema in storage.py) ---
+DB_NAME = storage.DB_NAME
 
 # --- Kamera- und Zeitraffer-Konfiguration ---
 PHOTO_DIR = "/home/pi/growbox_photos"
 TIMELAPSE_DIR = "/home/pi/growbox_timelapses"
+# Segmente und Playlist des H.264-Live-Modus; jede Instanz braucht ein eigenes Verzeichnis, es wird beim Start geleert
+HLS_DIR = DEFAULT_HLS_DIR
+
+# --- Vorschaubilder für den Foto-Browser ---
+THUMBNAIL_DIR = "/home/pi/growbox_thumbnails"
+PHOTO_PAGE_SIZE = 50
+MAX_PHOTO_PAGE_SIZE = 200
+
+# Antwortformate von /api/temperature_data
+DATA_FORMATS = ['json', 'binary']
+BINARY_MIMETYPE = 'application/octet-stream'
+
+# Fertig serialisierte und komprimierte Antworten von /api/temperature_data
+temperature_cache = response_cache.ResponseCache()
 
-os.makedirs(TIMELAPSE_DIR, exist_ok=True)
-os.makedirs(PHOTO_DIR, exist_ok=True)
+# Hintergrunddienste, angelegt in start_services()
+temperature_sampler = None
+timelapse_runner = None
+thumbnail_cache = None
+thumbnailer = None
 
-# --- NEU: Picamera2 Globales Objekt und Lock ---
+# --- NEU: Kamera-Objekt und Frame-Verteiler ---
 picam2_stream = None
-output_frame = None
-lock = threading.Lock() # Lock für den Zugriff auf den Frame-Puffer
+camera_service = None
+streamer = None
+# Der Kamera-Thread veröffentlicht jeden JPEG-Frame genau einmal, die Clients warten auf neue Frames
+broadcaster = FrameBroadcaster()
+
+# Live-Messwerte per Server-Sent Events (live_events.py)
+event_hub = live_events.EventHub()
+reading_watcher = None
+
+# Laufzeiten und Zähler für /metrics (metrics.py); bei Streams (MJPEG, SSE) nur bis zum Beginn der Antwort
+http_request_seconds = metrics.histogram('http_request_seconds', "Bearbeitungszeit je Route", ['endpoint'])
+http_requests_total = metrics.counter('http_requests_total', "Requests je Route und Statuscode", ['endpoint', 'status'])
+metrics.gauge('stream_clients', "Verbundene MJPEG-Clients", function=broadcaster.subscriber_count)
+metrics.gauge('sse_clients', "Offene Dashboards (Server-Sent Events)", function=event_hub.subscriber_count)
+metrics.gauge('h264_viewers', "Zuschauer des H.264-Streams",
+              function=lambda: camera_service.h264.viewer_count() if camera_service else None)
+metrics.gauge('temperature_age_seconds', "Alter des letzten Temperaturwerts",
+              function=lambda: temperature_sampler.latest()['age'] if temperature_sampler else None)
+
+_services_lock = threading.Lock()
+_services_started = False
 
 # Funktion zum Starten des Kamera-Threads
 def start_camera_stream():
-    global picam2_stream, output_frame
-    picam2_stream = Picamera2()
-    # Konfiguriere den Stream für eine Vorschau (LORES für weniger Ressourcen)
-    # Beachte: Die Kamera kann gleichzeitig einen Preview-Stream und einen Still-Stream haben.
-    # Der Preview-Stream ist für den MJPEG-Stream.
-    camera_config = picam2_stream.create_video_configuration(lores={"size": (640, 480)}, display="lores")
-    picam2_stream.configure(camera_config)
-    
-    # Startet den internen Stream der Kamera
-    picam2_stream.start()
-    print("Picamera2 Stream gestartet.")
-
+    global picam2_stream, camera_service, streamer
+    # Prozessweites Kamera-Objekt; ein zweiter Prozess bekommt die Kamera nicht
     try:
-        while True:
-            # Nehmen den Frame aus dem lores Stream
-            buffer = picam2_stream.capture_array("lores")
-            
-            # Konvertiere das Bild (normalerweise RGB/BGR von Picamera2 ist np.array)
-            # und komprimiere es zu JPEG
-            ret, jpeg = cv2.imencode('.jpg', buffer)
-            if not ret:
-                continue
-            
-            with lock:
-                output_frame = jpeg.tobytes() # Speichere den JPEG-Frame als Bytes
-            
-            time.sleep(0.05) # Begrenze die Framerate, z.B. 20 FPS (1/20 = 0.05)
+        picam2_stream = hal.camera()
+    except RuntimeError as e:
+        print(f"Kamera-Stream nicht gestartet: {e}")
+        return
+    # Eine Konfiguration für Stream (lores) und Fotos (main), daher kein camera_picture.py mehr nötig.
+    # Neue Fotos wecken den Vorschau-Thread.
+    camera_service = CameraService(picam2_stream, broadcaster, PHOTO_DIR, PHOTO_INTERVAL,
+                                   on_photo=lambda path: thumbnailer.wake(),
+                                   analytics_interval=ANALYTICS_INTERVAL,
+                                   on_metrics=lambda ts, metrics: event_hub.publish('live', {'ts': ts, 'values': metrics}),
+                                   hls_dir=HLS_DIR)
+    streamer = camera_service.streamer
+    try:
+        # Kodiert nur bei verbundenen Clients, Qualität/Auflösung/FPS passen sich an
+        camera_service.run()
     except Exception as e:
         print(f"Fehler im Kamera-Stream-Thread: {e}")
-    finally:
-        if picam2_stream:
-            picam2_stream.stop()
-            picam2_stream.release()
-            print("Picamera2 Stream beendet.")
 
-# Starte den Kamera-Stream in einem separaten Thread beim App-Start
-camera_thread = threading.Thread(target=start_camera_stream)
-camera_thread.daemon = True # Lässt den Thread sterben, wenn die Hauptanwendung stirbt
-camera_thread.start()
+def start_services():
+    # Sensor-Sampler, Zeitraffer-Warteschlange, Vorschaubilder und Kamera-Thread genau einmal starten
+    global _services_started, temperature_sampler, timelapse_runner, thumbnail_cache, thumbnailer, reading_watcher
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+
+        os.makedirs(TIMELAPSE_DIR, exist_ok=True)
+        os.makedirs(PHOTO_DIR, exist_ok=True)
+
+        # DS18B20: Hintergrund-Sampler, Anfragen lesen nur den letzten Wert
+        # Jede Messung geht auch als 'live'-Ereignis an die offenen Dashboards
+        temperature_sampler = TemperatureSampler(
+            hal.temperature_registry(),
+            on_reading=lambda ts, values: event_hub.publish('live', {'ts': ts, 'values': values}))
+        temperature_sampler.start()
+
+        # Neu gespeicherte Messwerte (sensor_logger.py) als 'reading'-Ereignisse
+        reading_watcher = live_events.ReadingWatcher(event_hub)
+        reading_watcher.start()
+
+        # Hintergrund-Warteschlange für Zeitraffer-Aufträge
+        timelapse_runner = TimelapseJobRunner(PHOTO_DIR, TIMELAPSE_DIR)
+        timelapse_runner.start()
+
+        thumbnail_cache = ThumbnailCache(THUMBNAIL_DIR)
+        thumbnailer = Thumbnailer(thumbnail_cache)
+        thumbnailer.start()
+
+        camera_thread = threading.Thread(target=start_camera_stream)
+        camera_thread.daemon = True # Lässt den Thread sterben, wenn die Hauptanwendung stirbt
+        camera_thread.start()
+
+def create_app(photo_dir=None, timelapse_dir=None, thumbnail_dir=None, db_name=None, photo_interval=None,
+               analytics_interval=None, hls_dir=None):
+    # Einstiegspunkt für den Produktivbetrieb (serve.py oder gunicorn -k gevent -w 1 'app:create_app()'):
+    # übernimmt abweichende Pfade und startet die Dienste, bevor der erste Request kommt
+    global PHOTO_DIR, TIMELAPSE_DIR, THUMBNAIL_DIR, HLS_DIR, DB_NAME, PHOTO_INTERVAL, ANALYTICS_INTERVAL
+    PHOTO_DIR = photo_dir or PHOTO_DIR
+    if photo_interval is not None:
+        PHOTO_INTERVAL = photo_interval
+    if analytics_interval is not None:
+        ANALYTICS_INTERVAL = analytics_interval
+    TIMELAPSE_DIR = timelapse_dir or TIMELAPSE_DIR
+    THUMBNAIL_DIR = thumbnail_dir or THUMBNAIL_DIR
+    HLS_DIR = hls_dir or HLS_DIR
+    if db_name:
+        storage.DB_NAME = DB_NAME = db_name
+    start_services()
+    return app
+
+@app.before_request
+def ensure_services():
+    g.request_started = time.perf_counter()
+    if not _services_started:
+        start_services()
+
+@app.after_request
+def record_request_metrics(response):
+    # Unbekannte Pfade zählen gemeinsam, damit die Zahl der Label-Werte begrenzt bleibt
+    endpoint = request.endpoint or 'unknown'
+    started = g.get('request_started')
+    if started is not None:
+        http_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+    http_requests_total.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+# Prometheus-Textformat, z.B. scrape_configs: [{job_name: growbox, static_configs: [{targets: ['growbox:8000']}]}]
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Sampling-Profiler (sampling_profiler.py) im laufenden Betrieb: POST action=start|stop,
+# optional interval (Sekunden) und seconds; GET ?format=collapsed liefert die Stacks für speedscope/flamegraph.pl
+@app.route('/api/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        action = data.get('action')
+        if action == 'start':
+            try:
+                interval = max(float(data.get('interval') or profiler.interval), 0.001)
+                seconds = float(data['seconds']) if data.get('seconds') else None
+            except ValueError:
+                return jsonify({'error': "interval und seconds müssen Zahlen sein"}), 400
+            profiler.start(interval=interval, duration=seconds)
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            return jsonify({'error': f"Unbekannte Aktion '{action}', erlaubt: start, stop"}), 400
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(request.args.get('limit', type=int)), mimetype='text/plain')
+    stats = profiler.stats()
+    stats['top'] = profiler.top_functions(request.args.get('limit', type=int, default=20))
+    return jsonify(stats)
 
 
 # NEU: Route für den MJPEG-Stream
 @app.route('/video_feed')
 def video_feed():
+    subscriber = broadcaster.subscribe(request.remote_addr or '')
+
     def generate():
-        global output_frame, lock
-        while True:
-            with lock:
-                if output_frame is not None:
-                    frame = output_frame
-                else:
-                    frame = None
-            
-            if frame is not None:
+        try:
+            while True:
+                # Wartet ohne Polling auf den nächsten neuen Frame; ist der Client zu langsam,
+                # bekommt er den jeweils neuesten Frame und überspringt die dazwischen
+                frame = subscriber.wait_frame(timeout=5.0)
+                if frame is None:
+                    if broadcaster.closed:
+                        break
+                    continue
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.05) # Auch hier die Framerate begrenzen
+        finally:
+            subscriber.close()
 
     return Response(generate(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+# H.264-Live-Modus: Playlist und fMP4-Segmente, einmal kodiert für alle Zuschauer (h264_stream.py)
+@app.route('/live/<path:filename>')
+def live_stream(filename):
+    h264 = camera_service.h264 if camera_service else None
+    if h264 is None or not h264.available():
+        return jsonify({'error': "H.264-Stream nicht verfügbar, bitte /video_feed (MJPEG) verwenden"}), 503
+    if filename == PLAYLIST_NAME:
+        # Jeder Abruf der Playlist zählt als Lebenszeichen des Zuschauers; der erste startet den Encoder
+        h264.touch(request.remote_addr or '')
+        if not h264.wait_ready():
+            return jsonify({'error': h264.last_error or "H.264-Stream startet noch"}), 503
+        response = send_from_directory(h264.directory, filename, mimetype='application/vnd.apple.mpegurl')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    # Segmente ändern sich nie, die Playlist verweist immer auf neue Namen
+    response = send_from_directory(h264.directory, filename, max_age=60)
+    if filename.endswith('.m4s'):
+        response.mimetype = 'video/iso.segment'
+    return response
+
+
+# FPS-Zähler des Streams (gesamt und pro Client) und aktuelle Encoder-Einstellungen
+@app.route('/api/stream_stats')
+def stream_stats():
+    stats = broadcaster.stats()
+    stats['encoder'] = streamer.stats() if streamer else None
+    stats['photos'] = camera_service.stats() if camera_service else None
+    stats['analytics'] = camera_service.analyzer.stats() if camera_service and camera_service.analyzer else None
+    stats['h264'] = camera_service.h264.stats() if camera_service else None
+    # Mittelwerte seit dem Start aus den Histogrammen von /metrics: Warten auf die Kamera vs. JPEG-Kodierung
+    stats['timing'] = {
+        'capture_lores': camera_stream.capture_seconds.summary(stream='lores'),
+        'encode_stream': camera_stream.jpeg_encode_seconds.summary(target='stream'),
+        'capture_main': camera_stream.capture_seconds.summary(stream='main'),
+        'encode_photo': camera_stream.jpeg_encode_seconds.summary(target='photo'),
+    }
+    return jsonify(stats)
+
+
+# --- Antworten der Temperatur-API: ETag, Kompression, JSON- und Binärformat ---
+def cached_response(cached):
+    # ETag-Prüfung (304 ohne Body) und gzip/Brotli nach Accept-Encoding; der Browser fragt jedes Mal nach
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        body, encoding = cached.encoded(response_cache.choose_encoding(request.accept_encodings))
+        response = Response(body, mimetype=cached.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers.update(cached.headers)
+    response.set_etag(cached.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def json_body(data):
+    return json.dumps(data, separators=(',', ':')).encode()
+
+def binary_body(cursor, hours, max_points, resolution, sensor, after=None):
+    # Spalten direkt aus der Abfrage, Länge und Stufe stehen in den Headern
+    ts, values, resolution = timeseries.query_temperature_arrays(cursor, hours, max_points, resolution,
+                                                                 sensor=sensor, after_ms=after)
+    headers = {'X-Point-Count': str(len(ts)), 'X-Resolution': resolution}
+    return timeseries.pack_columns(ts, values), headers
+
 # --- API-Endpunkt für Temperaturdaten MIT FALLBACK (wie gehabt) ---
 @app.route('/api/temperature_data')
 def get_temperature_data():
-    conn = None
+    # Ohne type=int prüfen: Flask ersetzt ungültige Werte sonst stillschweigend durch den Standard
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-
-        hours = request.args.get('hours', type=int, default=24)
-        
-        time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
-        time_ago_iso = time_ago.isoformat()
+        hours = int(request.args.get('hours', default=24))
+        # Begrenzt die Antwortgröße unabhängig vom Zeitfenster (Verdichtung + LTTB)
+        max_points = max(int(request.args.get('max_points', default=timeseries.DEFAULT_MAX_POINTS)), 3)
+    except ValueError:
+        return jsonify({'error': "'hours' und 'max_points' müssen ganze Zahlen sein"}), 400
+    if hours < 1:
+        return jsonify({'error': "'hours' muss mindestens 1 sein"}), 400
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in timeseries.TIER_NAMES:
+        return jsonify({'error': f"Unbekannte Auflösung '{resolution}', erlaubt: {', '.join(timeseries.TIER_NAMES)}"}), 400
+    # timestamps=ms liefert Epoch-Millisekunden statt ISO-Strings
+    sensor = request.args.get('sensor', default=storage.DEFAULT_SENSOR)
+    timestamps = request.args.get('timestamps', default='iso')
+    if timestamps not in timeseries.TIMESTAMP_FORMATS:
+        return jsonify({'error': f"Unbekanntes Zeitstempel-Format '{timestamps}', erlaubt: {', '.join(timeseries.TIMESTAMP_FORMATS)}"}), 400
+    # format=binary: n int64-Zeitstempel (ms) und n float32-Werte, little-endian; n im Header X-Point-Count
+    data_format = request.args.get('format', default='json')
+    if data_format not in DATA_FORMATS:
+        return jsonify({'error': f"Unbekanntes Format '{data_format}', erlaubt: {', '.join(DATA_FORMATS)}"}), 400
+    # after=<ms>: nur neuere Punkte (Standard: Rohdaten), damit der Graph nicht alles neu laden muss
+    after = request.args.get('after', type=int)
 
-        cursor.execute("SELECT timestamp, value FROM temperatures WHERE timestamp >= ? ORDER BY timestamp ASC", (time_ago_iso,))
-        data = cursor.fetchall()
-
-        if not data:
+    try:
+        # Verbindung aus dem Pool, kein Verbindungsaufbau pro Request
+        with storage.connection() as conn:
+            cursor = conn.cursor()
+            if data_format == 'binary' and after is not None:
+                body, headers = run_blocking(binary_body, cursor, hours, max_points, resolution, sensor, after)
+                return cached_response(response_cache.CachedBody(body, BINARY_MIMETYPE, headers))
+            if after is not None:
+                series = run_blocking(timeseries.query_series_after, cursor, after, max_points, resolution or 'raw',
+                                      sensor=sensor, timestamps=timestamps)
+                return cached_response(response_cache.CachedBody(json_body(series)))
+
+            # Neue Messwerte ändern den neuesten Zeitstempel und machen den Cache-Eintrag ungültig
+            version = timeseries.latest_ts(cursor, sensor)
+            key = (sensor, hours, max_points, resolution, timestamps, data_format)
+            cached = temperature_cache.get(key, version)
+            if cached is None and version is not None and data_format == 'binary':
+                body, headers = run_blocking(binary_body, cursor, hours, max_points, resolution, sensor)
+                cached = temperature_cache.put(key, version, body, BINARY_MIMETYPE, headers)
+            elif cached is None and version is not None:
+                series = run_blocking(timeseries.query_temperature_series, cursor, hours, max_points, resolution,
+                                      sensor=sensor, timestamps=timestamps)
+                if series['labels']:
+                    cached = temperature_cache.put(key, version, json_body(series))
+
+        if cached is None and data_format == 'binary':
+            return Response(b'', mimetype=BINARY_MIMETYPE, headers={'X-Point-Count': '0'})
+        if cached is None and sensor != storage.DEFAULT_SENSOR:
+            # Sample-Daten nur für die Temperatur, andere Reihen (z.B. Blattfläche) bleiben leer
+            return jsonify({'labels': [], 'values': [], 'resolution': resolution})
+        if cached is None:
             print(f"Keine echten Temperaturdaten für die letzten {hours} Stunden gefunden. Erzeuge Sample-Daten.")
-            labels = []
-            values = []
-            start_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
-            
-            num_points = (hours * 60) // 5
-            
-            for i in range(num_points):
-                point_time = start_time + datetime.timedelta(minutes=i * 5)
-                labels.append(point_time.isoformat())
-                
-                sample_temp = 22.0 + (i % 20 - 10) * 0.2 + (i % 5 - 2.5) * 0.5
-                values.append(round(sample_temp, 2))
-                
-            return jsonify({'labels': labels, 'values': values})
-
-        labels = [row[0] for row in data]
-        values = [row[1] for row in data]
-
-        return jsonify({'labels': labels, 'values': values})
+            return jsonify(timeseries.sample_series(hours, timestamps))
+
+        return cached_response(cached)
 
     except sqlite3.Error as e:
         print(f"API Error: Fehler beim Lesen aus der Datenbank: {e}")
         print("Erzeuge Sample-Daten aufgrund eines Datenbankfehlers.")
-        labels = []
-        values = []
-        hours = request.args.get('hours', type=int, default=24)
-        start_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
-        num_points = (hours * 60) // 5
-        for i in range(num_points):
-            point_time = start_time + datetime.timedelta(minutes=i * 5)
-            labels.append(point_time.isoformat())
-            sample_temp = 22.0 + (i % 20 - 10) * 0.2 + (i % 5 - 2.5) * 0.5
-            values.append(round(sample_temp, 2))
-        return jsonify({'labels': labels, 'values': values}), 500
-
-    finally:
-        if conn:
+        return jsonify(timeseries.sample_series(hours, timestamps)), 500
+
+# --- Massenexport der Messwerte (CSV, Binär, Parquet) ---
+@app.route('/api/temperature_export')
+def export_temperature_data():
+    # Massenexport über Monate: blockweise gestreamt, eigene Verbindung statt eines Pool-Platzes
+    sensor = request.args.get('sensor', default=storage.DEFAULT_SENSOR)
+    export_format = request.args.get('format', default='csv')
+    resolution = request.args.get('resolution', default='raw')
+    if export_format not in export_data.EXPORT_FORMATS:
+        return jsonify({'error': f"Unbekanntes Format '{export_format}', erlaubt: {', '.join(export_data.EXPORT_FORMATS)}"}), 400
+    if resolution not in timeseries.TIER_NAMES:
+        return jsonify({'error': f"Unbekannte Auflösung '{resolution}', erlaubt: {', '.join(timeseries.TIER_NAMES)}"}), 400
+    try:
+        days = request.args.get('days', type=float, default=30.0)
+        since_ms = export_data.parse_time(request.args['since']) if 'since' in request.args \
+            else storage.now_ms() - int(days * 24 * 60 * 60 * 1000)
+        until_ms = export_data.parse_time(request.args['until']) if 'until' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': f"Ungültige Zeitangabe: {e}"}), 400
+    filename = f"{sensor}_{resolution}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+
+    if export_format == 'parquet':
+        if not export_data.parquet_available():
+            return jsonify({'error': "Parquet-Export braucht pyarrow ('pip3 install pyarrow')"}), 400
+        with tempfile.NamedTemporaryFile(suffix='.parquet') as f:
+            with storage.connection() as conn:
+                run_blocking(export_data.export, conn, f.name, export_format, sensor, since_ms, until_ms, resolution)
+            return send_file(open(f.name, 'rb'), mimetype=export_data.MIMETYPES['parquet'],
+                             as_attachment=True, download_name=filename)
+
+    def generate():
+        conn = storage.open_connection()
+        try:
+            chunks = export_data.iter_chunks(conn, sensor, since_ms, until_ms, resolution)
+            writer = export_data.csv_chunks if export_format == 'csv' else export_data.binary_chunks
+            encoded = writer(chunks)
+            # Jeden Block (Zeilen holen und kodieren) über run_blocking, sonst stünde unter gevent
+            # für die Dauer des ganzen Exports jeder andere Stream
+            while True:
+                block = run_blocking(next, encoded, None)
+                if block is None:
+                    break
+                yield block
+        finally:
             conn.close()
 
+    return Response(generate(), mimetype=export_data.MIMETYPES[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/retention')
+def retention_report():
+    # Bericht des letzten Aufräumlaufs (retention.py, täglich per systemd-Timer)
+    return jsonify({'policy': retention.load_policy(), 'last_run': retention.load_report()})
+
+@app.route('/api/temperature_data/cache')
+def temperature_cache_stats():
+    return jsonify(temperature_cache.stats())
+
+@app.route('/api/temperature_latest')
+def get_temperature_latest():
+    # Zuletzt gemessene Werte aus dem Sampler, ohne Zugriff auf den Sensor; ?sensor=<Name> für einen Sensor
+    sensor = request.args.get('sensor')
+    if sensor:
+        return jsonify(temperature_sampler.latest(sensor))
+    return jsonify({'primary': temperature_sampler.latest(), 'sensors': temperature_sampler.latest_all()})
+
+# Server-Sent Events: 'live' (Sampler, alle paar Sekunden) und 'reading' (neu gespeicherte Messwerte).
+# Die Last wächst mit der Zahl der Ereignisse, nicht mit Seitenaufrufen.
+@app.route('/api/events')
+def sensor_events():
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    response = Response(live_events.stream(event_hub, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/events/stats')
+def sensor_event_stats():
+    stats = event_hub.stats()
+    stats['polls'] = reading_watcher.polls if reading_watcher else 0
+    return jsonify(stats)
+
+# pH/EC schreibt sensor_logger.py in die Datenbank; älter als das gilt als veraltet
+ANALOG_STALE_AFTER_MS = 5 * 60 * 1000
+
+def latest_stored(sensor):
+    try:
+        with storage.connection() as conn:
+            row = storage.latest_reading(conn, sensor)
+    except sqlite3.Error as e:
+        print(f"Fehler beim Lesen des letzten Werts von '{sensor}': {e}")
+        return "N/A", True
+    if row is None:
+        return "N/A", True
+    ts, value = row
+    return round(value, 2), storage.now_ms() - ts > ANALOG_STALE_AFTER_MS
+
 # --- Webserver Routen (index, create_timelapse, list_timelapses, download_timelapse) wie gehabt ---
 @app.route('/')
 def index():
     # MJPG_STREAM_URL ist jetzt lokal und zeigt auf unsere Flask-Route
     stream_url = url_for('video_feed')
+    # Die Seite nimmt H.264, wenn Server und Browser es können, sonst MJPEG
+    h264_url = url_for('live_stream', filename=PLAYLIST_NAME) \
+        if camera_service and camera_service.h264.available() else None
     
     current_time = datetime.datetime.now().strftime("%H:%M:%S")
-    temperature_c = read_temp()
+    latest = temperature_sampler.latest()
+    temperature_c = latest['value'] if latest['value'] is not None else "N/A"
+    ph, ph_stale = latest_stored('ph')
+    ec, ec_stale = latest_stored('ec')
+    # Kennzahlen aus dem Kamerabild (plant_analytics.py); Blattfläche gibt es nur bei Licht
+    canopy, canopy_stale = latest_stored(plant_analytics.CANOPY_SENSOR)
+    luminance, luminance_stale = latest_stored(plant_analytics.LUMINANCE_SENSOR)
+    lights, lights_stale = latest_stored(plant_analytics.LIGHTS_SENSOR)
 
     return render_template('index.html',
                            current_time=current_time,
                            temperature=temperature_c,
-                           mjpg_stream_url=stream_url) # Hier url_for verwenden
+                           temperature_stale=latest['stale'],
+                           ph=ph, ph_stale=ph_stale,
+                           ec=ec, ec_stale=ec_stale,
+                           canopy=canopy, canopy_stale=canopy_stale,
+                           luminance=luminance, luminance_stale=luminance_stale,
+                           lights={1.0: 'an', 0.0: 'aus'}.get(lights, lights), lights_stale=lights_stale,
+                           mjpg_stream_url=stream_url, # Hier url_for verwenden
+                           h264_stream_url=h264_url)
 
 @app.route('/create_timelapse', methods=['POST'])
 def create_timelapse():
-    # Lösche alte temporäre Dateien, falls vorhanden (sollte von ffmpeg aufgeräumt werden, aber zur Sicherheit)
-    temp_files = glob.glob(os.path.join(TIMELAPSE_DIR, 'temp_*.jpg'))
-    for f in temp_files:
-        os.remove(f)
-
-    photos = sorted(glob.glob(os.path.join(PHOTO_DIR, '*.jpg')))
-    if not photos:
-        return render_template('timelapse_status.html', message="Keine Fotos gefunden, um einen Zeitraffer zu erstellen.", video_url=None), 404
-
-    # ffmpeg braucht nummerierte Dateien, Symlinks sind eine saubere Lösung
-    for i, photo_path in enumerate(photos):
-        link_path = os.path.join(TIMELAPSE_DIR, f"temp_{i:05d}.jpg")
+    # Das Rendern läuft im Hintergrund (timelapse_jobs.py), der Request kehrt sofort zurück.
+    # Mehrere Aufträge werden nacheinander abgearbeitet.
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    try:
+        # Optional: Zeitraum (start/end oder days), stride oder duration (Sekunden), width (Pixel)
+        options = parse_timelapse_options(request.get_json(silent=True) or request.form)
+    except ValueError as e:
+        message = f"Fehler: Ungültige Zeitraffer-Parameter ({e})"
+        if wants_json:
+            return jsonify({'error': message}), 400
+        return render_template('timelapse_status.html', message=message, video_url=None), 400
+
+    job_id = timelapse_runner.submit(options)
+    job = timelapse_runner.get(job_id)
+    if wants_json:
+        return jsonify(job), 202
+    return render_template('timelapse_status.html',
+                           message=f"Zeitraffer-Auftrag #{job_id} wurde in die Warteschlange gestellt.",
+                           video_url=None, job=job), 202
+
+@app.route('/api/timelapse_jobs')
+def list_timelapse_jobs():
+    return jsonify(timelapse_runner.list(limit=request.args.get('limit', type=int, default=20)))
+
+@app.route('/api/timelapse_jobs/<int:job_id>')
+def get_timelapse_job(job_id):
+    job = timelapse_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Auftrag {job_id} nicht gefunden."}), 404
+    return jsonify(job)
+
+@app.route('/api/timelapse_jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_timelapse_job(job_id):
+    if not timelapse_runner.cancel(job_id):
+        return jsonify({'error': f"Auftrag {job_id} läuft nicht oder ist bereits beendet."}), 409
+    return jsonify(timelapse_runner.get(job_id))
+
+# --- Foto-Browser: seitenweise Liste aus dem Katalog und Auslieferung der Bilder ---
+@app.route('/api/photos')
+def list_photos():
+    limit = min(max(request.args.get('limit', type=int, default=PHOTO_PAGE_SIZE), 1), MAX_PHOTO_PAGE_SIZE)
+    before = None
+    cursor = request.args.get('cursor')
+    if cursor:
         try:
-            os.symlink(photo_path, link_path)
-        except FileExistsError: # Falls symlink schon existiert, überspringen
-            pass
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_video = os.path.join(TIMELAPSE_DIR, f"timelapse_{timestamp}.mp4")
-
-    # ffmpeg Befehl
-    command = [
-        "ffmpeg", "-y",
-        "-framerate", "10", # Du könntest dies auch im Frontend anpassbar machen
-        "-i", os.path.join(TIMELAPSE_DIR, "temp_%05d.jpg"),
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-crf", "23",
-        output_video
-    ]
-    print(f"Starte ffmpeg: {' '.join(command)}")
-
+            taken_at, photo_id = cursor.split(':')
+            before = (int(taken_at), int(photo_id))
+        except ValueError:
+            return jsonify({'error': f"Ungültiger Cursor '{cursor}'"}), 400
+
+    with storage.connection() as conn:
+        rows = photo_catalog.photo_page(conn, limit + 1, before)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    photos = []
+    for row in rows:
+        photos.append({
+            'id': row['id'],
+            'taken_at': row['taken_at'],
+            'size': row['size'],
+            'brightness': row['brightness'],
+            'urls': {size: url_for('photo_image', photo_id=row['id'], size=size)
+                     for size in list(THUMBNAIL_SIZES) + ['original']},
+        })
+    next_cursor = f"{rows[-1]['taken_at']}:{rows[-1]['id']}" if has_more else None
+    return jsonify({'photos': photos, 'next_cursor': next_cursor})
+
+@app.route('/photos/<int:photo_id>/<size>')
+def photo_image(photo_id, size):
+    with storage.connection() as conn:
+        photo = photo_catalog.get_photo(conn, photo_id)
+    if photo is None or not os.path.exists(photo['path']):
+        return jsonify({'error': f"Foto {photo_id} nicht gefunden."}), 404
+
+    if size == 'original':
+        return send_file(photo['path'], mimetype='image/jpeg', conditional=True, max_age=24 * 60 * 60)
+    if size not in THUMBNAIL_SIZES or photo['thumbnail'] == '':
+        return jsonify({'error': f"Keine Vorschau '{size}' für Foto {photo_id}."}), 404
+
+    extension = best_format(request.accept_mimetypes)
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        print(f"ffmpeg stdout: {result.stdout}")
-        print(f"ffmpeg stderr: {result.stderr}")
-        message = f"Zeitraffer '{os.path.basename(output_video)}' erfolgreich erstellt!"
-    except subprocess.CalledProcessError as e:
-        print(f"Fehler beim Erstellen des Zeitraffers: {e}")
-        print(f"ffmpeg stdout: {e.stdout}")
-        print(f"ffmpeg stderr: {e.stderr}")
-        message = f"Fehler beim Erstellen des Zeitraffers: {e.stderr}"
-    except FileNotFoundError:
-        message = "FFmpeg ist nicht installiert. Bitte 'sudo apt-get install ffmpeg' ausführen."
-    finally:
-        # Lösche die temporären Symlinks nach der Erstellung
-        for f in glob.glob(os.path.join(TIMELAPSE_DIR, 'temp_*.jpg')):
-            os.remove(f)
-
-    return render_template('timelapse_status.html', message=message, video_url=os.path.basename(output_video))
+        path, digest = thumbnail_cache.ensure(photo_id, photo['path'], photo['thumbnail'], size, extension)
+    except OSError as e:
+        print(f"Fehler beim Erzeugen der Vorschau: {e}")
+        return jsonify({'error': f"Vorschau für Foto {photo_id} konnte nicht erzeugt werden."}), 500
+
+    # Inhaltsadressiert: der Hash ändert sich nie, also lange cachen und per ETag/Last-Modified prüfen
+    response = send_file(path, mimetype=format_info(extension)[1], conditional=True,
+                         etag=f"{digest}-{size}-{extension}", last_modified=photo['taken_at'] / 1000,
+                         max_age=365 * 24 * 60 * 60)
+    response.headers['Vary'] = 'Accept'
+    return response
 
 @app.route('/timelapses')
 def list_timelapses():
-    timelapses = sorted(os.listdir(TIMELAPSE_DIR), reverse=True)
+    # Nur fertige Videos, nicht die Arbeitsverzeichnisse der Aufträge
+    timelapses = sorted((f for f in os.listdir(TIMELAPSE_DIR) if f.endswith('.mp4')), reverse=True)
     return render_template('timelapse_list.html', timelapses=timelapses)
 
 @app.route('/timelapses/<filename>')
@@ -281,5 +596,8 @@ def download_timelapse(filename):
 
 
 if __name__ == '__main__':
-    find_ds18b20()
+    # Entwicklungsserver; für den Dauerbetrieb serve.py benutzen.
+    # Mit debug=True läuft zusätzlich ein Reloader-Prozess; Kamera und Dienste nur im eigentlichen Server
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,493 @@
+import argparse
+import datetime
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from load_test import LoadTest, percentile
+
+# Reproduzierbare Messungen ohne Pi: Kamera, 1-Wire und ADS1115 kommen aus fake_hardware.py, Messwerte
+# und Fotos werden mit festem Seed erzeugt. Jede Messung läuft in einem eigenen Prozess mit eigener
+# Datenbank, damit sich Caches und Hintergrund-Threads nicht gegenseitig beeinflussen.
+# Ergebnis ist eine JSON-Datei; 'python3 benchmark.py --compare alt.json neu.json' zeigt die Unterschiede.
+RESULT_VERSION = 1
+RESULT_MARKER = 'BENCHMARK_RESULT '
+BENCHMARKS = ['fanout', 'api', 'timelapse', 'startup']
+SEED = 42
+
+# MJPEG-Verteilung: Zuschauerzahlen je Durchlauf gegen serve.py
+FANOUT_CLIENTS = [1, 2, 5, 10, 20]
+FANOUT_DURATION = 10.0
+FANOUT_WARMUP = 2.0
+SERVER_START_TIMEOUT = 60
+# Graph-API: Datenbankgrößen (Tage mit einem Messwert pro Minute, wie sensor_logger.py) und Zeitfenster
+DB_SIZES = {'1_month': 30, '1_year': 365}
+READING_INTERVAL_MS = 60 * 1000
+API_HOURS = [1, 24, 168, 720, 8760]
+API_FORMATS = ['json', 'binary']
+API_REPEATS = 20
+# Zeitraffer: Anzahl Fotos im Abstand des Foto-Zeitplans (5 Minuten), letztes Foto am END_TIME
+PHOTO_COUNTS = [100, 1000, 10000]
+PHOTO_SPACING = datetime.timedelta(minutes=5)
+END_TIME = datetime.datetime(2026, 1, 1, 12, 0)
+STARTUP_RUNS = 5
+CHILD_TIMEOUT = 600
+# --quick für einen schnellen Durchlauf während der Entwicklung
+QUICK = {'clients': [1, 5, 10], 'duration': 4.0, 'repeats': 5, 'photos': [100, 1000], 'startup_runs': 2}
+
+# Abweichungen unterhalb dieser Schwelle zeigt --compare nicht an
+COMPARE_THRESHOLD = 0.05
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+    return f"{revision}-dirty" if revision and dirty else revision or None
+
+def library_versions():
+    from importlib import metadata
+    versions = {}
+    for name in ('numpy', 'opencv-python', 'opencv-python-headless', 'Flask', 'gevent'):
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            pass
+    return versions
+
+def summarize(values_ms):
+    return {
+        'p50_ms': round(percentile(values_ms, 0.5), 3),
+        'p95_ms': round(percentile(values_ms, 0.95), 3),
+        'mean_ms': round(statistics.fmean(values_ms), 3),
+    }
+
+def process_cpu_seconds(pid):
+    # utime + stime aus /proc/<pid>/stat (Linux), für die CPU-Last des Servers pro Durchlauf
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+# --- Kindprozesse: installieren die nachgebaute Hardware, bevor irgendetwas die HAL anfasst ---
+
+def emit(result):
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+
+def generate_readings(days, seed=SEED):
+    # Ein Wert pro Minute bis jetzt: Tagesgang plus Rauschen, die Rollup-Trigger füllen Minute/Stunde/Tag
+    import storage
+    rng = random.Random(seed)
+    count = days * 24 * 60 * 60 * 1000 // READING_INTERVAL_MS
+    end = storage.now_ms() // READING_INTERVAL_MS * READING_INTERVAL_MS
+    started = time.perf_counter()
+    with storage.connection() as conn:
+        storage.ensure_sensor(conn, storage.DEFAULT_SENSOR)
+        sensor_id = conn.execute("SELECT id FROM sensors WHERE name = ?", (storage.DEFAULT_SENSOR,)).fetchone()[0]
+        conn.executemany("INSERT OR IGNORE INTO readings (sensor_id, ts, value) VALUES (?, ?, ?)",
+                         ((sensor_id, end - (count - i) * READING_INTERVAL_MS,
+                           round(23.0 + 3.0 * math.sin(2 * math.pi * i / 1440) + rng.gauss(0, 0.1), 2))
+                          for i in range(count)))
+    return count, time.perf_counter() - started
+
+def child_api(work_dir, days, repeats):
+    import storage
+    storage.DB_NAME = os.path.join(work_dir, 'readings.db')
+    rows, generate_seconds = generate_readings(days)
+    import app
+    import response_cache
+
+    def request_ms(path):
+        # Nur der Handler (SQL, LTTB, Serialisierung, Cache), ohne HTTP und ohne Hintergrunddienste
+        with app.app.test_request_context(path):
+            started = time.perf_counter()
+            response = app.get_temperature_data()
+            body = response.get_data()
+            return (time.perf_counter() - started) * 1000, response, body
+
+    queries = {}
+    for hours in API_HOURS:
+        for data_format in API_FORMATS:
+            path = f"/api/temperature_data?hours={hours}&timestamps=ms&format={data_format}"
+            uncached = []
+            for _ in range(repeats):
+                app.temperature_cache = response_cache.ResponseCache()
+                elapsed, response, body = request_ms(path)
+                uncached.append(elapsed)
+            cached = [request_ms(path)[0] for _ in range(repeats)]
+            if data_format == 'binary':
+                points, resolution = int(response.headers['X-Point-Count']), response.headers['X-Resolution']
+            else:
+                series = json.loads(body)
+                points, resolution = len(series['labels']), series['resolution']
+            queries[f"{hours}h_{data_format}"] = {
+                'points': points,
+                'resolution': resolution,
+                'bytes': len(body),
+                'uncached': summarize(uncached),
+                'cached': summarize(cached),
+            }
+    emit({
+        'days': days,
+        'rows': rows,
+        'generate_seconds': round(generate_seconds, 2),
+        'db_mb': round(os.path.getsize(storage.DB_NAME) / 1e6, 1),
+        'queries': queries,
+    })
+
+def write_photos(photo_dir, count):
+    # Ein echtes JPEG aus der Kamera-Attrappe, als Hardlink unter count Namen; das Muster wie camera_service.py
+    import cv2
+    import hal
+    from camera_service import PHOTO_NAME_FORMAT, PHOTO_QUALITY
+    os.makedirs(photo_dir, exist_ok=True)
+    frame = hal.SimulatedCamera().capture_array('main')
+    # Außerhalb von photo_dir, sonst zählte die Quelle selbst als Foto
+    source = os.path.join(os.path.dirname(photo_dir), 'source.jpg')
+    cv2.imwrite(source, frame, [cv2.IMWRITE_JPEG_QUALITY, PHOTO_QUALITY])
+    for i in range(count):
+        taken = END_TIME - (count - 1 - i) * PHOTO_SPACING
+        os.link(source, os.path.join(photo_dir, taken.strftime(PHOTO_NAME_FORMAT)))
+    return os.path.getsize(source)
+
+def child_timelapse(work_dir, count):
+    import storage
+    storage.DB_NAME = os.path.join(work_dir, 'photos.db')
+    photo_dir = os.path.join(work_dir, 'photos')
+    photo_bytes = write_photos(photo_dir, count)
+    import photo_catalog
+    import timelapse_render
+
+    def fake_ffmpeg(command, total_frames, log_path, on_progress, cancel_event, step='encode'):
+        # Gemessen wird nur die Vorbereitung; statt zu kodieren entsteht eine leere Ausgabedatei
+        open(command[-1], 'wb').close()
+
+    timelapse_render.run_ffmpeg = fake_ffmpeg
+    cache = timelapse_render.SegmentCache(os.path.join(work_dir, 'segments'))
+    results = {'photos': count, 'photo_bytes': photo_bytes}
+
+    def timed(name, function, *args):
+        started = time.perf_counter()
+        value = function(*args)
+        results[name] = round(time.perf_counter() - started, 4)
+        return value
+
+    timed('scan_seconds', timelapse_render.scan_photos, photo_dir, {})
+    timed('catalog_seconds', photo_catalog.backfill, photo_dir, False)
+    photos = timed('select_seconds', timelapse_render.select_photos, photo_dir, {})
+    week = timelapse_render.parse_options({'days': 7}, now=END_TIME)
+    results['selected_7d'] = len(timed('select_7d_seconds', timelapse_render.select_photos, photo_dir, week))
+
+    def render(name):
+        job_dir = os.path.join(work_dir, name)
+        os.makedirs(job_dir)
+        timed(f'{name}_seconds', timelapse_render.render_timelapse, photos, os.path.join(job_dir, 'out.mp4'),
+              job_dir, cache, lambda progress: None, None, {})
+
+    # Erst alle Tages-Segmente neu, dann alle aus dem Segment-Cache
+    render('prepare_new')
+    render('prepare_cached')
+    results['days'] = len(timelapse_render.group_by_day(photos))
+    emit(results)
+
+def child_startup(work_dir):
+    # Phasen ab Beginn des Kindprozesses; die Startzeit des Interpreters misst der Elternprozess
+    started = time.perf_counter()
+    phases = {}
+
+    def mark(name):
+        phases[name] = round(time.perf_counter() - started, 4)
+
+    import app
+    mark('import_seconds')
+    application = app.create_app(os.path.join(work_dir, 'photos'), os.path.join(work_dir, 'timelapses'),
+                                 os.path.join(work_dir, 'thumbnails'), os.path.join(work_dir, 'startup.db'),
+                                 hls_dir=os.path.join(work_dir, 'hls'))
+    mark('create_app_seconds')
+    client = application.test_client()
+    client.get('/')
+    mark('first_page_seconds')
+    stream = client.get('/video_feed')
+    next(iter(stream.response))
+    mark('first_frame_seconds')
+    emit(phases)
+    # Hintergrund-Threads (Kamera, Sampler) nicht abwarten
+    os._exit(0)
+
+def child_serve(work_dir, port, server):
+    import serve
+    sys.argv = ['serve.py', '--server', server, '--host', '127.0.0.1', '--port', str(port),
+                '--photo-dir', os.path.join(work_dir, 'photos'), '--timelapse-dir', os.path.join(work_dir, 'timelapses'),
+                '--thumbnail-dir', os.path.join(work_dir, 'thumbnails'), '--db', os.path.join(work_dir, 'serve.db'),
+                '--hls-dir', os.path.join(work_dir, 'hls'),
+                '--photo-interval', '0', '--analytics-interval', '0']
+    serve.main()
+
+def run_child(name, work_dir, params, log_path):
+    # Startet benchmark.py als Kindprozess und wartet auf die Ergebniszeile; liefert (Ergebnis, Sekunden bis dahin)
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--work-dir', work_dir,
+               '--params', json.dumps(params)]
+    started = time.perf_counter()
+    with open(log_path, 'a') as log:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log, text=True)
+        # Hängt ein Kindprozess ohne Ausgabe, beendet ihn der Timer und die Schleife endet
+        watchdog = threading.Timer(CHILD_TIMEOUT, process.kill)
+        watchdog.start()
+        try:
+            for line in process.stdout:
+                if line.startswith(RESULT_MARKER):
+                    elapsed = time.perf_counter() - started
+                    process.stdout.close()
+                    process.wait(timeout=30)
+                    return json.loads(line[len(RESULT_MARKER):]), elapsed
+                log.write(line)
+        finally:
+            watchdog.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    raise RuntimeError(f"Kindprozess '{name}' ohne Ergebnis beendet, siehe {log_path}")
+
+
+# --- Messungen im Elternprozess ---
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get_json(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return json.loads(response.read()) if response.status == 200 else None
+    finally:
+        conn.close()
+
+def bench_fanout(work_dir, clients_list, duration, server, log_path):
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--child', 'serve', '--work-dir', work_dir,
+               '--params', json.dumps({'port': port, 'server': server})]
+    with open(log_path, 'a') as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                if get_json(port, '/api/stream_stats') is not None:
+                    break
+            except OSError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"Server für den Fan-out-Test nicht gestartet, siehe {log_path}")
+            time.sleep(0.2)
+
+        url = f'http://127.0.0.1:{port}'
+        LoadTest(url, 1, 0, 0, FANOUT_WARMUP).run()
+        results = {}
+        for clients in clients_list:
+            cpu_before = process_cpu_seconds(process.pid)
+            result = LoadTest(url, clients, 0, 0, duration).run()
+            cpu = process_cpu_seconds(process.pid) - cpu_before
+            stats = get_json(port, '/api/stream_stats') or {}
+            encoder = stats.get('encoder') or {}
+            results[str(clients)] = {
+                'clients': clients,
+                'viewer_fps_mean': result['viewer_fps_mean'],
+                'viewer_fps_min': result['viewer_fps_min'],
+                'delivered_fps_total': round(result['viewer_fps_mean'] * clients, 1),
+                'stream_mbit_s': result['stream_mbit_s'],
+                'server_cpu_percent': round(cpu / duration * 100, 1),
+                'encoder_level': encoder.get('level'),
+                'encode_ms': encoder.get('encode_ms'),
+                'errors': result['errors'],
+            }
+            print(f"  {clients} Zuschauer: {result['viewer_fps_mean']} FPS im Mittel, "
+                  f"{result['stream_mbit_s']} Mbit/s, Server-CPU {results[str(clients)]['server_cpu_percent']} %")
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def bench_api(work_dir, repeats, log_path):
+    results = {}
+    for label, days in DB_SIZES.items():
+        child_dir = os.path.join(work_dir, f'api_{label}')
+        os.makedirs(child_dir)
+        results[label], _ = run_child('api', child_dir, {'days': days, 'repeats': repeats}, log_path)
+        for name, query in results[label]['queries'].items():
+            print(f"  {label} {name}: {query['uncached']['p50_ms']} ms ungecacht, {query['cached']['p50_ms']} ms "
+                  f"gecacht, {query['points']} Punkte ({query['resolution']})")
+    return results
+
+def bench_timelapse(work_dir, counts, log_path):
+    results = {}
+    for count in counts:
+        child_dir = os.path.join(work_dir, f'timelapse_{count}')
+        os.makedirs(child_dir)
+        results[str(count)], _ = run_child('timelapse', child_dir, {'count': count}, log_path)
+        result = results[str(count)]
+        print(f"  {count} Fotos: Auswahl {result['select_seconds']} s, Vorbereitung {result['prepare_new_seconds']} s "
+              f"(neu) / {result['prepare_cached_seconds']} s (Segment-Cache)")
+    return results
+
+def bench_startup(work_dir, runs, log_path):
+    # Bis zur Ergebniszeile inklusive Interpreter-Start; die Phasen misst der Kindprozess selbst
+    runs_results = []
+    for run in range(runs):
+        child_dir = os.path.join(work_dir, f'startup_{run}')
+        os.makedirs(child_dir)
+        phases, total = run_child('startup', child_dir, {}, log_path)
+        phases['total_seconds'] = round(total, 4)
+        runs_results.append(phases)
+    result = {name: round(statistics.median(run[name] for run in runs_results), 4) for name in runs_results[0]}
+    result['runs'] = runs
+    print(f"  Start bis erste Seite {result['first_page_seconds']} s, bis erster Frame {result['first_frame_seconds']} s, "
+          f"gesamt {result['total_seconds']} s (Median aus {runs})")
+    return result
+
+
+# --- Vergleich zweier Ergebnisdateien ---
+
+def flatten(value, prefix=''):
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+def compare(old_path, new_path, threshold=COMPARE_THRESHOLD):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['meta'].get('git_revision')} -> {new['meta'].get('git_revision')}")
+    old_values, new_values = flatten(old['results']), flatten(new['results'])
+    changed = 0
+    for key in sorted(old_values.keys() & new_values.keys()):
+        before, after = old_values[key], new_values[key]
+        if before == after or (before and abs(after - before) / abs(before) < threshold):
+            continue
+        change = f"{(after - before) / abs(before) * 100:+.1f} %" if before else "neu"
+        print(f"  {key}: {before} -> {after} ({change})")
+        changed += 1
+    print(f"{changed} von {len(old_values.keys() & new_values.keys())} Werten um mehr als {threshold:.0%} verändert.")
+
+
+def run_child_main(name, work_dir, params):
+    import numpy as np
+    import fake_hardware
+    fake_hardware.install(work_dir)
+    # Auch das Rauschen der Kamera-Attrappe ist damit bei jedem Lauf gleich
+    np.random.seed(SEED)
+    if name == 'api':
+        child_api(work_dir, params['days'], params['repeats'])
+    elif name == 'timelapse':
+        child_timelapse(work_dir, params['count'])
+    elif name == 'startup':
+        child_startup(work_dir)
+    elif name == 'serve':
+        child_serve(work_dir, params['port'], params['server'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des Growbox-Monitors mit nachgebauter Hardware.")
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"Auswahl aus {', '.join(BENCHMARKS)} (Standard: alle)")
+    parser.add_argument('--output', help="Ergebnisdatei (Standard: benchmark_<Datum>_<Revision>.json)")
+    parser.add_argument('--quick', action='store_true', help="Weniger Durchläufe und kleinere Mengen")
+    parser.add_argument('--server', choices=['auto', 'gevent', 'threaded'], default='threaded',
+                        help="Server für den Fan-out-Test (wie serve.py --server)")
+    parser.add_argument('--work-dir', help="Arbeitsverzeichnis (Standard: temporär, wird gelöscht)")
+    parser.add_argument('--compare', nargs=2, metavar=('ALT', 'NEU'), help="Zwei Ergebnisdateien vergleichen")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--params', default='{}', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child_main(args.child, args.work_dir, json.loads(args.params))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unbekannte Benchmarks: {', '.join(sorted(unknown))}, erlaubt: {', '.join(BENCHMARKS)}")
+    selected = args.benchmarks or BENCHMARKS
+    clients = QUICK['clients'] if args.quick else FANOUT_CLIENTS
+    duration = QUICK['duration'] if args.quick else FANOUT_DURATION
+    repeats = QUICK['repeats'] if args.quick else API_REPEATS
+    photo_counts = QUICK['photos'] if args.quick else PHOTO_COUNTS
+    startup_runs = QUICK['startup_runs'] if args.quick else STARTUP_RUNS
+
+    revision = git_revision()
+    started_at = datetime.datetime.now()
+    output = args.output or f"benchmark_{started_at:%Y%m%d_%H%M%S}_{revision or 'unknown'}.json"
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='growbox_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    log_path = os.path.join(work_dir, 'benchmark.log')
+
+    results = {}
+    try:
+        if 'fanout' in selected:
+            print(f"MJPEG-Verteilung ({', '.join(map(str, clients))} Zuschauer, je {duration:g} s)...")
+            fanout_dir = os.path.join(work_dir, 'fanout')
+            os.makedirs(fanout_dir, exist_ok=True)
+            results['fanout'] = bench_fanout(fanout_dir, clients, duration, args.server, log_path)
+        if 'api' in selected:
+            print(f"Graph-API bei {', '.join(DB_SIZES)} Messwerten...")
+            results['api'] = bench_api(work_dir, repeats, log_path)
+        if 'timelapse' in selected:
+            print(f"Zeitraffer-Vorbereitung ({', '.join(map(str, photo_counts))} Fotos)...")
+            results['timelapse'] = bench_timelapse(work_dir, photo_counts, log_path)
+        if 'startup' in selected:
+            print(f"Startzeit ({startup_runs} Durchläufe)...")
+            results['startup'] = bench_startup(work_dir, startup_runs, log_path)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'version': RESULT_VERSION,
+        'meta': {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'seconds': round((datetime.datetime.now() - started_at).total_seconds(), 1),
+            'git_revision': revision,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'libraries': library_versions(),
+            'quick': args.quick,
+            'seed': SEED,
+            'server': args.server,
+        },
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Ergebnisse gespeichert in {output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,24 @@
-import time
-from picamera2 import Picamera2
-import datetime
-import os
+import hal
+from camera_service import CameraService, PHOTO_INTERVAL
+from frame_broadcaster import FrameBroadcaster
 
 # Verzeichnis zum Speichern der Bilder
 PHOTO_DIR = "growbox_photos" # Passe den Pfad bei Bedarf an!
 
-# Erstelle das Verzeichnis, falls es nicht existiert
-os.makedirs(PHOTO_DIR, exist_ok=True)
-
-# Kamera initialisieren
-picam2 = Picamera2()
-camera_config = picam2.create_still_configuration(main={"size": (1280, 720)}, lores={"size": (640, 480)}, display="lores")
-picam2.configure(camera_config)
-picam2.start() # Kamera starten
-
-print(f"Kamera gestartet. Fotos werden alle 5 Minuten in {PHOTO_DIR} gespeichert.")
-
+# Nur Fotos, ohne Web-App. Läuft die Web-App (serve.py), nimmt deren Kamera-Dienst die Fotos
+# selbst auf und dieses Skript bekommt die Kamera nicht.
 try:
-    while True:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{PHOTO_DIR}/growbox_photo_{timestamp}.jpg"
-        picam2.capture_file(filename)
-        print(f"Foto gespeichert: {filename}")
+    camera = hal.camera()
+except RuntimeError as e:
+    # Kamera fehlt oder die Web-App (serve.py) hat sie und nimmt die Fotos selbst auf
+    print(e)
+    raise SystemExit(1)
 
-        time.sleep(5 * 60) # Warte 5 Minuten (5 * 60 Sekunden)
+# Ohne Zuschauer ruht der Stream, es läuft nur der Foto-Zeitplan
+service = CameraService(camera, FrameBroadcaster(), PHOTO_DIR)
+print(f"Fotos werden alle {PHOTO_INTERVAL // 60} Minuten in {PHOTO_DIR} gespeichert.")
 
+try:
+    service.run()
 except KeyboardInterrupt:
     print("Kameraaufnahme beendet.")
-finally:
-    picam2.stop()
-    picam2.release_camera() # Kamera freigeben
\ No newline at end of file
@@ -0,0 +1,173 @@
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import photo_catalog
+import metrics
+from cooperative import run_blocking
+from camera_stream import CameraStreamer, capture_seconds, jpeg_encode_seconds
+from h264_stream import H264Streamer, HLS_DIR
+from plant_analytics import FrameAnalyzer, ANALYTICS_INTERVAL
+
+# Eine Kamera-Konfiguration für alles: 'main' in voller Auflösung für Fotos, 'lores' für den Stream.
+# Fotos kommen per capture_request() aus dem laufenden Stream, ohne Umkonfigurieren oder Neustart.
+MAIN_SIZE = (1280, 720)
+LORES_SIZE = (640, 480)
+PHOTO_INTERVAL = 5 * 60
+PHOTO_QUALITY = 90
+# JPEG-Kodierung und Schreiben auf die SD-Karte laufen hier, nie im Stream- oder Kamera-Thread
+WRITER_THREADS = 2
+PHOTO_NAME_FORMAT = "growbox_photo_%Y%m%d_%H%M%S.jpg"
+# Für die Helligkeit reicht jedes 8. Pixel in jeder Richtung
+BRIGHTNESS_STEP = 8
+
+photos_total = metrics.counter('photos_total', "Aufgenommene Fotos nach Ergebnis", ['result'])
+photo_write_seconds = metrics.histogram('photo_write_seconds', "JPEG-Kodierung, Schreiben und Katalog je Foto")
+
+def next_photo_time(now, interval):
+    # Auf die Uhr ausgerichtet (bei 5 Minuten also :00, :05, ...), damit Fotos verschiedener Tage vergleichbar sind
+    return (now // interval + 1) * interval
+
+def mean_brightness(frame):
+    # Wie photo_catalog.mean_brightness, aber direkt aus dem BGR-Array statt aus der JPEG-Datei
+    sample = frame[::BRIGHTNESS_STEP, ::BRIGHTNESS_STEP, :3]
+    return round(float((sample * [0.114, 0.587, 0.299]).sum(axis=2).mean()), 2)
+
+
+class CameraService:
+    # Besitzt das eine Kamera-Objekt des Prozesses: der CameraStreamer liest 'lores' für den
+    # MJPEG-Stream, ein zweiter Thread holt nach Zeitplan ein Foto aus 'main', der FrameAnalyzer
+    # wertet regelmäßig ein 'lores'-Frame aus (Blattfläche, Helligkeit, Licht). Der H264Streamer
+    # kodiert 'lores' nur bei HLS-Zuschauern einmal für alle.
+    def __init__(self, camera, broadcaster, photo_dir, photo_interval=PHOTO_INTERVAL,
+                 writer_threads=WRITER_THREADS, on_photo=None, analytics_interval=ANALYTICS_INTERVAL,
+                 on_metrics=None, hls_dir=HLS_DIR):
+        self.camera = camera
+        self.broadcaster = broadcaster
+        self.photo_dir = photo_dir
+        self.photo_interval = photo_interval
+        # on_photo(Pfad) nach dem Schreiben und Eintragen in den Katalog
+        self.on_photo = on_photo
+        self.streamer = CameraStreamer(camera, broadcaster)
+        self.h264 = H264Streamer(camera, hls_dir)
+        self.analyzer = FrameAnalyzer(camera, analytics_interval, on_metrics) if analytics_interval else None
+        self.photos_taken = 0
+        self.photos_failed = 0
+        self.last_photo = None
+        self.capture_ms = 0.0
+        self.write_ms = 0.0
+        self._writers = ThreadPoolExecutor(max_workers=writer_threads, thread_name_prefix='photo-writer')
+        self._stop = threading.Event()
+        self._stills_thread = None
+
+    def configure(self):
+        # main als RGB888 (im Speicher BGR, wie OpenCV es erwartet), lores wie bisher für den Stream
+        config = self.camera.create_video_configuration(main={"size": MAIN_SIZE, "format": "RGB888"},
+                                                        lores={"size": LORES_SIZE}, display="lores")
+        self.camera.configure(config)
+
+    def run(self):
+        # Blockiert mit dem Stream im aufrufenden Thread; Fotos laufen im eigenen Thread
+        os.makedirs(self.photo_dir, exist_ok=True)
+        self.configure()
+        self.camera.start()
+        print(f"Kamera gestartet (Stream {LORES_SIZE[0]}x{LORES_SIZE[1]}, Fotos {MAIN_SIZE[0]}x{MAIN_SIZE[1]}).")
+        if self.photo_interval:
+            self._stills_thread = threading.Thread(target=self._stills_worker, daemon=True)
+            self._stills_thread.start()
+        if self.analyzer:
+            self.analyzer.start()
+        try:
+            self.streamer.run()
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self._stop.set()
+        self.streamer.stop()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._stills_thread:
+            self._stills_thread.join()
+        if self.analyzer:
+            self.analyzer.stop()
+        self.h264.stop()
+        # Ausstehende Fotos noch schreiben, bevor die Kamera freigegeben wird
+        self._writers.shutdown(wait=True)
+        self.camera.stop()
+        self.camera.release()
+        print("Kamera beendet.")
+
+    def capture_main(self):
+        request = self.camera.capture_request()
+        try:
+            return request.make_array("main")
+        finally:
+            request.release()
+
+    def take_photo(self):
+        # Nur das Kopieren des Frames hält den Kamera-Puffer fest, alles andere macht der Writer-Pool
+        started = time.perf_counter()
+        taken = datetime.datetime.now()
+        frame = run_blocking(self.capture_main)
+        elapsed = time.perf_counter() - started
+        capture_seconds.observe(elapsed, stream='main')
+        self.capture_ms = round(elapsed * 1000, 1)
+        path = os.path.join(self.photo_dir, taken.strftime(PHOTO_NAME_FORMAT))
+        return self._writers.submit(self._write_photo, frame, path)
+
+    def save_jpeg(self, frame, path):
+        import cv2 # erst beim ersten Foto laden
+        with jpeg_encode_seconds.time(target='photo'):
+            ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, PHOTO_QUALITY])
+        if not ret:
+            raise OSError("JPEG-Kodierung fehlgeschlagen")
+        # Erst temporär schreiben, damit Galerie und Zeitraffer nie halbe Dateien sehen
+        with open(path + '.tmp', 'wb') as f:
+            f.write(jpeg.tobytes())
+        os.replace(path + '.tmp', path)
+        photo_catalog.catalog_photo(path, brightness=mean_brightness(frame))
+
+    def _write_photo(self, frame, path):
+        started = time.perf_counter()
+        try:
+            run_blocking(self.save_jpeg, frame, path)
+        except Exception as e:
+            self.photos_failed += 1
+            photos_total.inc(result='failed')
+            print(f"Fehler beim Speichern von {path}: {e}")
+            return None
+        elapsed = time.perf_counter() - started
+        photo_write_seconds.observe(elapsed)
+        self.write_ms = round(elapsed * 1000, 1)
+        self.photos_taken += 1
+        photos_total.inc(result='saved')
+        self.last_photo = path
+        print(f"Foto gespeichert: {path}")
+        if self.on_photo:
+            self.on_photo(path)
+        return path
+
+    def _stills_worker(self):
+        while not self._stop.is_set():
+            now = time.time()
+            if self._stop.wait(next_photo_time(now, self.photo_interval) - now):
+                break
+            try:
+                self.take_photo()
+            except Exception as e:
+                self.photos_failed += 1
+                photos_total.inc(result='failed')
+                print(f"Fehler bei der Fotoaufnahme: {e}")
+
+    def stats(self):
+        return {
+            'photo_interval': self.photo_interval,
+            'photos_taken': self.photos_taken,
+            'photos_failed': self.photos_failed,
+            'last_photo': os.path.basename(self.last_photo) if self.last_photo else None,
+            'capture_ms': self.capture_ms,
+            'write_ms': self.write_ms,
+        }
@@ -0,0 +1,144 @@
+import threading
+import time
+import metrics
+from cooperative import run_blocking
+
+# Stufen für den MJPEG-Stream: (JPEG-Qualität, Skalierung des lores-Frames, max. FPS).
+# Stufe 0 ist die beste Qualität; höhere Stufen sparen Bandbreite und CPU.
+STREAM_LEVELS = [
+    (85, 1.0, 20),
+    (75, 1.0, 15),
+    (65, 0.75, 12),
+    (55, 0.5, 10),
+    (45, 0.5, 5),
+]
+# Mindeststufe abhängig von der Anzahl Clients: (ab Clients, Stufe)
+CLIENT_LEVELS = [
+    (1, 0),
+    (2, 1),
+    (4, 2),
+    (8, 3),
+]
+# Anteil einer CPU, den das JPEG-Encoding höchstens verbrauchen soll
+ENCODE_BUDGET = 0.5
+# Gewicht der letzten Messung im gleitenden Mittel der Encode-Zeit
+ENCODE_TIME_SMOOTHING = 0.1
+# Ohne Clients wird so lange gewartet, bevor erneut geprüft wird (Sekunden)
+IDLE_POLL_INTERVAL = 1.0
+
+# Kamera und JPEG getrennt gemessen; die Fotos (camera_service.py) landen mit eigenem Label in denselben Histogrammen
+capture_seconds = metrics.histogram('camera_capture_seconds', "Wartezeit auf einen Kamera-Frame", ['stream'])
+jpeg_encode_seconds = metrics.histogram('jpeg_encode_seconds', "Dauer von cv2.imencode", ['target'])
+frames_encoded_total = metrics.counter('stream_frames_encoded_total', "Für den MJPEG-Stream kodierte Frames")
+
+def client_level(clients):
+    level = 0
+    for min_clients, min_level in CLIENT_LEVELS:
+        if clients >= min_clients:
+            level = min_level
+    return level
+
+
+class AdaptiveStreamSettings:
+    # Wählt Qualität, Auflösung und FPS anhand der Client-Zahl und der gemessenen Encode-Zeit.
+    # Mit fixed_level wird die Anpassung abgeschaltet.
+    def __init__(self, fixed_level=None, budget=ENCODE_BUDGET):
+        self.fixed_level = fixed_level
+        self.budget = budget
+        self.level = 0 if fixed_level is None else fixed_level
+        self.load_level = 0
+        self.encode_time = 0.0
+
+    def record_encode_time(self, seconds):
+        if self.encode_time == 0.0:
+            self.encode_time = seconds
+        else:
+            self.encode_time += ENCODE_TIME_SMOOTHING * (seconds - self.encode_time)
+
+    def update(self, clients):
+        if self.fixed_level is not None:
+            return self.current()
+
+        # CPU-Last des Encodings bei der aktuellen Stufe: Encode-Zeit * FPS
+        quality, scale, fps = STREAM_LEVELS[self.level]
+        load = self.encode_time * fps
+        if load > self.budget and self.load_level < len(STREAM_LEVELS) - 1:
+            self.load_level += 1
+        elif load < self.budget / 2 and self.load_level > 0:
+            # Hysterese: erst zurück, wenn deutlich Luft ist
+            self.load_level -= 1
+
+        self.level = max(client_level(clients), self.load_level)
+        return self.current()
+
+    def current(self):
+        quality, scale, fps = STREAM_LEVELS[self.level]
+        return {'level': self.level, 'quality': quality, 'scale': scale, 'fps': fps}
+
+
+class CameraStreamer:
+    # Holt lores-Frames und kodiert sie nur, solange mindestens ein Client zuschaut
+    def __init__(self, camera, broadcaster, settings=None):
+        self.camera = camera
+        self.broadcaster = broadcaster
+        self.settings = settings or AdaptiveStreamSettings()
+        self.paused = True
+        self.frames_encoded = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        self.broadcaster.close()
+
+    def encode(self, buffer, quality, scale):
+        import cv2 # erst beim ersten Frame laden, nicht beim Start der App
+        if scale != 1.0:
+            buffer = cv2.resize(buffer, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        start = time.perf_counter()
+        ret, jpeg = cv2.imencode('.jpg', buffer, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        elapsed = time.perf_counter() - start
+        self.settings.record_encode_time(elapsed)
+        jpeg_encode_seconds.observe(elapsed, target='stream')
+        return jpeg.tobytes() if ret else None
+
+    def run(self):
+        while not self._stop.is_set():
+            # Ohne Zuschauer weder capturen noch kodieren
+            if not self.broadcaster.wait_for_subscribers(timeout=IDLE_POLL_INTERVAL):
+                if self.broadcaster.closed:
+                    break
+                if not self.paused:
+                    print("Keine Clients mehr, Kamera-Stream pausiert.")
+                self.paused = True
+                continue
+            if self.paused:
+                print("Client verbunden, Kamera-Stream läuft.")
+                self.paused = False
+
+            frame_start = time.monotonic()
+            current = self.settings.update(self.broadcaster.subscriber_count())
+
+            # Nehmen den Frame aus dem lores Stream
+            with capture_seconds.time(stream='lores'):
+                buffer = run_blocking(self.camera.capture_array, "lores")
+            frame = run_blocking(self.encode, buffer, current['quality'], current['scale'])
+            if frame is None:
+                continue
+            self.frames_encoded += 1
+            frames_encoded_total.inc()
+            self.broadcaster.publish(frame) # Weckt alle wartenden Clients
+
+            # Framerate der aktuellen Stufe einhalten
+            remaining = 1.0 / current['fps'] - (time.monotonic() - frame_start)
+            if remaining > 0:
+                self._stop.wait(remaining)
+
+    def stats(self):
+        current = self.settings.current()
+        current.update({
+            'paused': self.paused,
+            'adaptive': self.settings.fixed_level is None,
+            'encode_ms': round(self.settings.encode_time * 1000, 2),
+            'frames_encoded': self.frames_encoded,
+        })
+        return current
@@ -0,0 +1,16 @@
+import sys
+
+# Unter 'serve.py --server gevent' sind alle Threads Greenlets in einem einzigen Hub. Blockierende
+# C-Aufrufe (Kamera, cv2, sqlite, 1-Wire) geben den Hub nicht frei und halten damit jeden Stream und
+# jeden Request an. run_blocking() führt sie dort in einem echten Thread aus gevents Threadpool aus,
+# das aufrufende Greenlet wartet kooperativ. Ohne gevent (Thread-Server, Logger, Skripte) ein normaler Aufruf.
+
+def gevent_active():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+def run_blocking(func, *args, **kwargs):
+    if not gevent_active():
+        return func(*args, **kwargs)
+    import gevent # nur vorhanden, wenn serve.py gevent gewählt hat
+    return gevent.get_hub().threadpool.apply(func, args, kwargs)
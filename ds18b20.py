@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import storage
+from cooperative import run_blocking
+
+# 1-Wire-Geräte im sysfs; für Tests kann ein nachgebautes Verzeichnis übergeben werden
+W1_BASE_DIR = '/sys/bus/w1/devices/'
+DS18B20_PREFIX = '28-'
+# Zuordnung Geräte-ID -> Sensorname, z.B. {"28-0316a2795aff": "temperature", "28-0316a27b12ff": "reservoir"}
+SENSOR_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensors.json')
+# Eine Wandlung dauert bei 12 Bit ca. 750 ms, danach sind Wiederholungen meist erfolgreich
+CONVERSION_TIME = 0.75
+BULK_POLL_INTERVAL = 0.05
+MAX_RETRIES = 3
+RETRY_DELAY = 0.2
+# Der Sensor meldet 85 °C, wenn er nach einem Spannungseinbruch noch nicht gewandelt hat
+POWER_ON_RESET_VALUE = 85000
+
+SAMPLE_INTERVAL = 5.0
+MAX_BACKOFF = 300.0
+# Ein Wert gilt als veraltet, wenn so viele Intervalle ohne erfolgreiche Messung vergangen sind
+STALE_INTERVALS = 3
+
+# method: 'w1_slave' (einzeln mit CRC-Zeile) oder 'bulk' (Bus-Wandlung für alle Sensoren)
+read_seconds = metrics.histogram('sensor_read_seconds', "Dauer einer DS18B20-Messung inkl. Wiederholungen", ['method'])
+crc_retries_total = metrics.counter('sensor_crc_retries_total', "Wiederholte Lesungen nach CRC-Fehler oder 85 °C")
+read_errors_total = metrics.counter('sensor_read_errors_total', "DS18B20-Messungen ohne gültigen Wert", ['method'])
+
+class SensorReadError(Exception):
+    pass
+
+def find_sensors(base_dir=W1_BASE_DIR):
+    # IDs aller DS18B20-Sensoren ('28-...'), sortiert
+    try:
+        return sorted(f for f in os.listdir(base_dir) if f.startswith(DS18B20_PREFIX))
+    except FileNotFoundError:
+        print("1-Wire directory not found. Is 1-Wire enabled?")
+        return []
+
+def load_sensor_names(config_path=SENSOR_CONFIG):
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path) as f:
+        return json.load(f)
+
+def parse_w1_slave(lines):
+    # Liefert die Temperatur in °C oder None, wenn die CRC-Prüfung fehlgeschlagen ist
+    # oder die Zeile abgeschnitten bzw. verstümmelt ankam; beides fängt die Wiederholung ab
+    if len(lines) < 2 or not lines[0].strip().endswith('YES'):
+        return None
+    equals_pos = lines[1].find('t=')
+    if equals_pos == -1:
+        return None
+    try:
+        raw = int(lines[1][equals_pos + 2:])
+    except ValueError:
+        return None
+    if raw == POWER_ON_RESET_VALUE:
+        return None
+    return round(raw / 1000.0, 2)
+
+def read_lines(path):
+    with open(path, 'r') as f:
+        return f.readlines()
+
+def read_temperature(device_file, retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+    # Begrenzte Anzahl Versuche statt endloser Schleife bei wackeligem Sensor
+    with read_seconds.time(method='w1_slave'):
+        for attempt in range(retries):
+            try:
+                # Das Lesen von w1_slave wartet im Kernel auf die Wandlung (ca. 750 ms)
+                lines = run_blocking(read_lines, device_file)
+            except OSError as e:
+                read_errors_total.inc(method='w1_slave')
+                raise SensorReadError(f"{device_file} nicht lesbar: {e}")
+            temperature = parse_w1_slave(lines)
+            if temperature is not None:
+                return temperature
+            if attempt + 1 < retries:
+                crc_retries_total.inc()
+                time.sleep(retry_delay)
+    read_errors_total.inc(method='w1_slave')
+    raise SensorReadError(f"Keine gültige Messung nach {retries} Versuchen ({device_file})")
+
+def read_converted(temperature_file):
+    # 'temperature' nach einer Bus-Wandlung: Milligrad ohne CRC-Zeile, leer solange noch gewandelt wird
+    try:
+        with open(temperature_file, 'r') as f:
+            content = f.read().strip()
+    except OSError as e:
+        raise SensorReadError(f"{temperature_file} nicht lesbar: {e}")
+    try:
+        raw = int(content)
+    except ValueError:
+        raw = None
+    if raw is None or raw == POWER_ON_RESET_VALUE:
+        raise SensorReadError(f"Keine gültige Messung in {temperature_file}")
+    return round(raw / 1000.0, 2)
+
+def bulk_read_state(bus_master):
+    with open(os.path.join(bus_master, 'therm_bulk_read'), 'r') as f:
+        return f.read().strip()
+
+
+class SensorRegistry:
+    # Alle DS18B20 am 1-Wire-Bus mit Namen aus sensors.json. Nicht eingetragene Sensoren heißen
+    # wie ihre Geräte-ID; ist nur ein Sensor angeschlossen, schreibt er die bisherige Reihe 'temperature'.
+    def __init__(self, base_dir=W1_BASE_DIR, config_path=SENSOR_CONFIG):
+        self.base_dir = base_dir
+        self.config_path = config_path
+        self.sensors = {}
+        self.bus_masters = []
+        self._executor = None
+
+    def discover(self):
+        names = load_sensor_names(self.config_path)
+        device_ids = find_sensors(self.base_dir)
+        self.sensors = {}
+        for device_id in device_ids:
+            default = storage.DEFAULT_SENSOR if len(device_ids) == 1 else device_id
+            self.sensors[names.get(device_id, default)] = device_id
+        # Bus-Master mit 'therm_bulk_read' können alle Sensoren gleichzeitig wandeln lassen (Kernel >= 5.10)
+        self.bus_masters = [os.path.join(self.base_dir, name) for name in sorted(os.listdir(self.base_dir))
+                            if name.startswith('w1_bus_master')
+                            and os.path.exists(os.path.join(self.base_dir, name, 'therm_bulk_read'))] \
+            if device_ids else []
+        for name, device_id in self.sensors.items():
+            print(f"DS18B20 sensor '{name}' found at: {os.path.join(self.base_dir, device_id)}")
+        return self.sensors
+
+    @property
+    def primary(self):
+        # Sensor für die Temperatur-Anzeige auf dem Dashboard
+        if storage.DEFAULT_SENSOR in self.sensors or not self.sensors:
+            return storage.DEFAULT_SENSOR
+        return sorted(self.sensors)[0]
+
+    def device_path(self, device_id, filename):
+        return os.path.join(self.base_dir, device_id, filename)
+
+    def read_all(self):
+        # Liest alle Sensoren in etwa einer Wandlungszeit; liefert ({Name: °C}, {Name: Fehlertext})
+        if not self.sensors:
+            self.discover()
+            if not self.sensors:
+                raise SensorReadError("No DS18B20 sensor found.")
+        values, errors = None, None
+        if self.bus_masters:
+            try:
+                with read_seconds.time(method='bulk'):
+                    values, errors = self._read_bulk()
+            except OSError as e:
+                print(f"Bus-Wandlung nicht möglich, lese Sensoren einzeln: {e}")
+                self.bus_masters = []
+        if values is None:
+            values, errors = self._read_parallel()
+        if errors:
+            # Beim nächsten Mal neu suchen, falls Sensoren abgesteckt oder umbenannt wurden
+            self.sensors = {}
+        if not values:
+            raise SensorReadError('; '.join(errors.values()))
+        return values, errors
+
+    def _read_bulk(self):
+        # Auslösen, Warten und Lesen der Wandlung in einem Stück über run_blocking (gevent: echter Thread);
+        # die Nachlese fehlgeschlagener Sensoren verteilt _read_parallel selbst
+        values, retry = run_blocking(self._convert_bulk)
+        errors = {}
+        if retry:
+            # Sensoren ohne gültigen Wert klassisch mit CRC-Prüfung nachlesen, gemeinsam statt nacheinander
+            retried, errors = self._read_parallel(retry)
+            values.update(retried)
+        return values, errors
+
+    def _convert_bulk(self):
+        for master in self.bus_masters:
+            with open(os.path.join(master, 'therm_bulk_read'), 'w') as f:
+                f.write('trigger\n')
+        # -1: mindestens ein Sensor wandelt noch, 1: fertig, 0: nichts ausstehend
+        deadline = time.monotonic() + CONVERSION_TIME * 2
+        pending = list(self.bus_masters)
+        while pending and time.monotonic() < deadline:
+            time.sleep(BULK_POLL_INTERVAL)
+            pending = [master for master in pending if bulk_read_state(master) == '-1']
+
+        values, retry = {}, {}
+        for name, device_id in self.sensors.items():
+            try:
+                values[name] = read_converted(self.device_path(device_id, 'temperature'))
+            except SensorReadError:
+                read_errors_total.inc(method='bulk')
+                retry[name] = device_id
+        return values, retry
+
+    def _read_parallel(self, sensors=None):
+        # Ohne Bus-Wandlung (oder für deren Ausfälle): ein Thread pro Sensor, damit die Wartezeiten sich überlappen
+        sensors = self.sensors if sensors is None else sensors
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='w1')
+        futures = {name: self._executor.submit(read_temperature, self.device_path(device_id, 'w1_slave'))
+                   for name, device_id in sensors.items()}
+        values, errors = {}, {}
+        for name, future in futures.items():
+            try:
+                values[name] = future.result()
+            except SensorReadError as e:
+                errors[name] = str(e)
+        return values, errors
+
+
+class TemperatureSampler:
+    # Hintergrund-Thread, der alle Sensoren regelmäßig liest. Anfragen lesen nur die zuletzt
+    # gemessenen Werte aus latest() und warten nie auf den 1-Wire-Bus.
+    def __init__(self, registry=None, interval=SAMPLE_INTERVAL, max_backoff=MAX_BACKOFF, on_reading=None):
+        self.registry = registry or SensorRegistry()
+        self.interval = interval
+        self.max_backoff = max_backoff
+        # on_reading(Messzeit in ms, {Name: °C}) nach jeder erfolgreichen Messung
+        self.on_reading = on_reading
+        self.errors = 0
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def latest(self, sensor=None):
+        # Letzter Wert eines Sensors (Standard: der Dashboard-Sensor) mit Alter und Veraltet-Flag
+        sensor = sensor or self.registry.primary
+        with self._lock:
+            value, timestamp, error = self._latest.get(sensor, (None, None, None))
+        age = time.time() - timestamp if timestamp is not None else None
+        return {
+            'sensor': sensor,
+            'value': value,
+            'timestamp': timestamp,
+            'age': round(age, 1) if age is not None else None,
+            'stale': age is None or age > self.interval * STALE_INTERVALS,
+            'error': error,
+        }
+
+    def latest_all(self):
+        with self._lock:
+            sensors = sorted(self._latest)
+        return {sensor: self.latest(sensor) for sensor in sensors}
+
+    def _store(self, values, errors):
+        now = time.time()
+        with self._lock:
+            for sensor, value in values.items():
+                self._latest[sensor] = (value, now, None)
+            for sensor, error in errors.items():
+                value, timestamp, _ = self._latest.get(sensor, (None, None, None))
+                self._latest[sensor] = (value, timestamp, error)
+
+    def _worker(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                timestamp = storage.now_ms()
+                values, errors = self.registry.read_all()
+                self._store(values, errors)
+                self.errors = 0
+                delay = self.interval
+                if self.on_reading:
+                    self.on_reading(timestamp, values)
+            except SensorReadError as e:
+                self.errors += 1
+                # Exponentielles Zurückweichen, damit ein defekter Sensor den Bus nicht dauerhaft belegt
+                delay = min(self.interval * 2 ** self.errors, self.max_backoff)
+                self._store({}, {sensor: str(e) for sensor in self._latest or [self.registry.primary]})
+                print(f"Fehler beim Lesen der DS18B20 ({self.errors}. Mal), nächster Versuch in {delay:.0f} s: {e}")
+            except Exception as e:
+                print(f"Fehler im Temperatur-Sampler: {e}")
+            # Intervall ab Beginn der Messung, die Wandlungszeit verschiebt den Takt nicht
+            self._stop.wait(max(delay - (time.monotonic() - started), 0))
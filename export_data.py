@@ -0,0 +1,137 @@
+import argparse
+import datetime
+import itertools
+import struct
+import sys
+import numpy as np
+import storage
+import timeseries
+
+# Massenexport der Messwerte für die Auswertung am PC. Die Zeilen werden blockweise
+# aus der Datenbank geholt und sofort geschrieben, der Speicherbedarf hängt nur von
+# CHUNK_ROWS ab, nicht von der Länge des Zeitraums.
+EXPORT_FORMATS = ['csv', 'bin', 'parquet']
+CHUNK_ROWS = 50000
+# Binärformat: Kopf, dann Blöcke aus uint32 n, n int64-Zeitstempel (ms) und n float32-Werten;
+# ein Block mit n = 0 beendet die Datei. Alles little-endian.
+BINARY_MAGIC = b'GBXCOL1\n'
+CSV_HEADER = 'timestamp_ms,time,value\n'
+MIMETYPES = {
+    'csv': 'text/csv',
+    'bin': 'application/octet-stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+def iter_chunks(conn, sensor, since_ms, until_ms=None, resolution='raw', chunk_rows=CHUNK_ROWS):
+    # (ts, Werte) als NumPy-Spalten, höchstens chunk_rows Zeilen pro Block
+    cursor = timeseries.execute_points(conn.cursor(), sensor, since_ms, resolution, until_ms)
+    while True:
+        points = np.fromiter(itertools.islice(cursor, chunk_rows), dtype=timeseries.POINT_DTYPE)
+        if not len(points):
+            break
+        yield timeseries.to_columns(points)
+
+def csv_chunks(chunks):
+    yield CSV_HEADER.encode()
+    for ts, values in chunks:
+        # Uhrzeit in UTC, vektorisiert über datetime64 statt datetime pro Zeile
+        times = np.datetime_as_string(ts.astype('datetime64[ms]'), unit='s')
+        lines = [f"{t},{time}Z,{value:.3f}" for t, time, value in zip(ts.tolist(), times.tolist(), values.tolist())]
+        yield ('\n'.join(lines) + '\n').encode()
+
+def binary_chunks(chunks):
+    yield BINARY_MAGIC
+    for ts, values in chunks:
+        yield struct.pack('<I', len(ts)) + timeseries.pack_columns(ts, values)
+    yield struct.pack('<I', 0)
+
+def read_binary(data):
+    # Gegenstück zu binary_chunks, z.B. für die Auswertung mit NumPy
+    if not data.startswith(BINARY_MAGIC):
+        raise ValueError("Keine Growbox-Exportdatei")
+    offset = len(BINARY_MAGIC)
+    ts_parts, value_parts = [], []
+    while True:
+        (count,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if count == 0:
+            break
+        ts_parts.append(np.frombuffer(data, timeseries.TS_DTYPE, count, offset))
+        offset += count * timeseries.TS_DTYPE.itemsize
+        value_parts.append(np.frombuffer(data, timeseries.VALUE_DTYPE, count, offset))
+        offset += count * timeseries.VALUE_DTYPE.itemsize
+    if not ts_parts:
+        return np.empty(0, timeseries.TS_DTYPE), np.empty(0, timeseries.VALUE_DTYPE)
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+def write_parquet(chunks, destination):
+    # pyarrow ist optional ('pip3 install pyarrow'), jeder Block wird eine Row Group
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([('ts', pa.timestamp('ms', tz='UTC')), ('value', pa.float32())])
+    rows = 0
+    with pq.ParquetWriter(destination, schema, compression='zstd') as writer:
+        for ts, values in chunks:
+            writer.write_table(pa.table([pa.array(ts, pa.timestamp('ms', tz='UTC')), pa.array(values)], schema=schema))
+            rows += len(ts)
+    return rows
+
+def parquet_available():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+def export(conn, output, export_format, sensor, since_ms, until_ms=None, resolution='raw'):
+    chunks = iter_chunks(conn, sensor, since_ms, until_ms, resolution)
+    if export_format == 'parquet':
+        return write_parquet(chunks, output)
+    rows = 0
+    def counted(chunks):
+        nonlocal rows
+        for ts, values in chunks:
+            rows += len(ts)
+            yield ts, values
+    writer = csv_chunks if export_format == 'csv' else binary_chunks
+    for block in writer(counted(chunks)):
+        output.write(block)
+    return rows
+
+def parse_time(value):
+    # ISO-Datum/-Zeit (Ortszeit) oder Epoch-Millisekunden
+    if value.isdigit():
+        return int(value)
+    return storage.to_ms(datetime.datetime.fromisoformat(value))
+
+def main():
+    parser = argparse.ArgumentParser(description="Messwerte als CSV, Binär-Spalten oder Parquet exportieren.")
+    parser.add_argument('--sensor', default=storage.DEFAULT_SENSOR)
+    parser.add_argument('--days', type=float, default=30.0, help="Zeitraum bis jetzt, falls --since fehlt")
+    parser.add_argument('--since', help="Beginn als ISO-Zeit oder Epoch-ms")
+    parser.add_argument('--until', help="Ende (exklusiv) als ISO-Zeit oder Epoch-ms")
+    parser.add_argument('--resolution', choices=timeseries.TIER_NAMES, default='raw')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--db', help="Pfad zur SQLite-Datenbank")
+    parser.add_argument('--output', '-o', help="Zieldatei, ohne Angabe stdout (nicht bei parquet)")
+    args = parser.parse_args()
+
+    if args.db:
+        storage.DB_NAME = args.db
+    if args.format == 'parquet' and not args.output:
+        parser.error("parquet braucht --output")
+    since_ms = parse_time(args.since) if args.since else storage.now_ms() - int(args.days * 24 * 60 * 60 * 1000)
+    until_ms = parse_time(args.until) if args.until else None
+
+    with storage.connection() as conn:
+        if args.format == 'parquet':
+            rows = export(conn, args.output, args.format, args.sensor, since_ms, until_ms, args.resolution)
+        elif args.output:
+            with open(args.output, 'wb') as f:
+                rows = export(conn, f, args.format, args.sensor, since_ms, until_ms, args.resolution)
+        else:
+            rows = export(conn, sys.stdout.buffer, args.format, args.sensor, since_ms, until_ms, args.resolution)
+    print(f"{rows} Zeilen exportiert.", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
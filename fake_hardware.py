@@ -0,0 +1,138 @@
+import json
+import os
+import random
+import sys
+import types
+import ds18b20
+import hal
+
+# Nachgebaute Hardware für benchmark.py auf einem normalen Linux-Rechner. Anders als GROWBOX_HAL=simulated
+# laufen damit die echten Hardware-Pfade: hal öffnet "Picamera2", ds18b20 liest einen sysfs-Baum
+# mit w1_slave/temperature/therm_bulk_read, Ads1115Adc spricht über "smbus" mit einem ADS1115 auf Registerebene.
+# install() muss vor dem ersten Zugriff auf die Hardware aufgerufen werden.
+FAKE_SENSORS = {
+    '28-00000bench01': ('temperature', 23.5),
+    '28-00000bench02': ('root_zone', 21.0),
+    '28-00000bench03': ('reservoir', 19.5),
+}
+# ADS1115: Register und Messbereich bei PGA ±6,144 V (Standard der Adafruit-Bibliothek bei Gain 2/3)
+ADS_CONVERSION_REGISTER = 0x00
+ADS_CONFIG_REGISTER = 0x01
+ADS_FULL_SCALE = 6.144
+SEED = 1
+
+
+class FakePicamera2(hal.SimulatedCamera):
+    # Teil der Picamera2-API, den Kamera-Dienst, Stream und Fotos benutzen; Frames wie die Simulation.
+    # Ohne start_encoder, damit der H.264-Modus wie auf einem Pi 5 auf ffmpeg ausweicht.
+    def __init__(self, camera_num=0):
+        super().__init__()
+        self.camera_num = camera_num
+
+
+def write_w1_tree(base_dir, sensors=FAKE_SENSORS, seed=SEED):
+    # Verzeichnisse wie unter /sys/bus/w1/devices mit Bus-Master, der Bus-Wandlungen kann
+    rng = random.Random(seed)
+    names = {}
+    for device_id, (name, celsius) in sensors.items():
+        device_dir = os.path.join(base_dir, device_id)
+        os.makedirs(device_dir, exist_ok=True)
+        millis = int(round(celsius + rng.gauss(0, 0.1), 4) * 1000)
+        with open(os.path.join(device_dir, 'w1_slave'), 'w') as f:
+            f.write(f"72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n72 01 4b 46 7f ff 0e 10 57 t={millis}\n")
+        with open(os.path.join(device_dir, 'temperature'), 'w') as f:
+            f.write(f"{millis}\n")
+        names[device_id] = name
+    master_dir = os.path.join(base_dir, 'w1_bus_master1')
+    os.makedirs(master_dir, exist_ok=True)
+    with open(os.path.join(master_dir, 'therm_bulk_read'), 'w') as f:
+        f.write("1\n")
+    return names
+
+
+class FakeSMBus:
+    # ADS1115 an einer Adresse: Konfiguration schreiben wählt den Kanal, das Ergebnisregister liefert
+    # die Spannung des Kanals (Mittelwerte aus hal.SIMULATED_CHANNELS plus Rauschen) als int16
+    def __init__(self, bus_number=hal.I2C_BUS_NUMBER, seed=SEED):
+        self.bus_number = bus_number
+        self.channel = 0
+        self.config = 0x8583
+        self.transactions = 0
+        self._rng = random.Random(seed)
+
+    def write_i2c_block_data(self, address, register, data):
+        self.transactions += 1
+        if register == ADS_CONFIG_REGISTER:
+            self.config = (data[0] << 8) | data[1]
+            # MUX-Bits 14..12: 100..111 = AIN0..AIN3 gegen GND
+            self.channel = ((self.config >> 12) & 0x7) - 4 if (self.config >> 12) & 0x4 else 0
+
+    def read_i2c_block_data(self, address, register, length):
+        self.transactions += 1
+        if register == ADS_CONVERSION_REGISTER:
+            mean, drift, noise = hal.SIMULATED_CHANNELS[self.channel]
+            code = int((mean + self._rng.gauss(0, noise)) / ADS_FULL_SCALE * 32767)
+            code = max(min(code, 32767), -32768) & 0xFFFF
+            return [code >> 8, code & 0xFF][:length]
+        return [self.config >> 8, self.config & 0xFF][:length]
+
+    def close(self):
+        pass
+
+
+class FakeAds1115:
+    # Stellvertreter für adafruit_ads1x15.ads1115.ADS1115 auf einem FakeSMBus
+    def __init__(self, bus, address=hal.ADS1115_ADDRESS):
+        self.bus = bus
+        self.address = address
+        self.data_rate = 128
+        self.mode = 'single'
+
+    def read(self, pin):
+        config = 0x8000 | ((4 + pin) << 12) | 0x0183
+        self.bus.write_i2c_block_data(self.address, ADS_CONFIG_REGISTER, [config >> 8, config & 0xFF])
+        high, low = self.bus.read_i2c_block_data(self.address, ADS_CONVERSION_REGISTER, 2)
+        code = (high << 8) | low
+        return code - 0x10000 if code & 0x8000 else code
+
+
+class FakeAnalogIn:
+    def __init__(self, ads, pin):
+        self.ads = ads
+        self.pin = pin
+
+    @property
+    def value(self):
+        return self.ads.read(self.pin)
+
+    @property
+    def voltage(self):
+        return self.value * ADS_FULL_SCALE / 32767
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+def install(work_dir):
+    # Ersetzt picamera2, smbus und adafruit_ads1x15 in sys.modules und lenkt 1-Wire,
+    # Sensornamen und Kamera-Sperre in work_dir um. Gilt nur für den aufrufenden Prozess.
+    w1_dir = os.path.join(work_dir, 'w1_devices')
+    names = write_w1_tree(w1_dir)
+    ds18b20.W1_BASE_DIR = w1_dir
+    ds18b20.SENSOR_CONFIG = os.path.join(work_dir, 'sensors.json')
+    with open(ds18b20.SENSOR_CONFIG, 'w') as f:
+        json.dump(names, f)
+    hal.CAMERA_LOCK_FILE = os.path.join(work_dir, 'camera.lock')
+    os.environ[hal.HAL_ENV] = 'hardware'
+
+    sys.modules['picamera2'] = _module('picamera2', Picamera2=FakePicamera2)
+    sys.modules['smbus'] = _module('smbus', SMBus=FakeSMBus)
+    ads1x15 = _module('adafruit_ads1x15.ads1x15', Mode=types.SimpleNamespace(CONTINUOUS=0, SINGLE=1))
+    ads1115 = _module('adafruit_ads1x15.ads1115', ADS1115=FakeAds1115, P0=0, P1=1, P2=2, P3=3)
+    analog_in = _module('adafruit_ads1x15.analog_in', AnalogIn=FakeAnalogIn)
+    package = _module('adafruit_ads1x15', ads1x15=ads1x15, ads1115=ads1115, analog_in=analog_in)
+    package.__path__ = []
+    sys.modules.update({'adafruit_ads1x15': package, 'adafruit_ads1x15.ads1x15': ads1x15,
+                        'adafruit_ads1x15.ads1115': ads1115, 'adafruit_ads1x15.analog_in': analog_in})
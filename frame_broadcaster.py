@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import deque
+
+# Zeitfenster (Sekunden), über das die FPS-Zähler gemittelt werden
+FPS_WINDOW = 5.0
+
+class RateCounter:
+    def __init__(self, window=FPS_WINDOW):
+        self.window = window
+        self.total = 0
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.total += 1
+            self._times.append(now)
+            self._expire(now)
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if len(self._times) < 2:
+                return 0.0
+            return (len(self._times) - 1) / max(now - self._times[0], 1e-6)
+
+
+class Subscriber:
+    def __init__(self, broadcaster, client_id, name):
+        self.broadcaster = broadcaster
+        self.client_id = client_id
+        self.name = name
+        self.connected_at = time.time()
+        self.last_seq = 0
+        self.dropped = 0
+        self.delivered = RateCounter()
+
+    def wait_frame(self, timeout=None):
+        # Blockiert bis ein neuerer Frame als der zuletzt gelieferte vorliegt.
+        # Langsame Clients bekommen immer den neuesten Frame, Zwischenframes verfallen.
+        frame, seq = self.broadcaster.wait_for_frame(self.last_seq, timeout)
+        if frame is None:
+            return None
+        if self.last_seq and seq > self.last_seq + 1:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.delivered.tick()
+        return frame
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+    def stats(self):
+        return {
+            'id': self.client_id,
+            'name': self.name,
+            'connected_seconds': round(time.time() - self.connected_at, 1),
+            'fps': round(self.delivered.rate(), 2),
+            'frames': self.delivered.total,
+            'dropped': self.dropped,
+        }
+
+
+class FrameBroadcaster:
+    # Ein Kamera-Thread veröffentlicht Frames, beliebig viele Clients warten per Condition
+    # auf die nächste Sequenznummer. Der Produzent wartet nie auf Clients.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._subscribers = {}
+        self._next_client_id = 1
+        self._closed = False
+        self.published = RateCounter()
+
+    def publish(self, frame):
+        with self._condition:
+            self._frame = frame
+            self._seq += 1
+            self.published.tick()
+            self._condition.notify_all()
+
+    def wait_for_frame(self, last_seq, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > last_seq or self._closed, timeout):
+                return None, last_seq
+            if self._seq <= last_seq:
+                return None, last_seq
+            return self._frame, self._seq
+
+    def latest(self):
+        with self._condition:
+            return self._frame, self._seq
+
+    def subscribe(self, name=''):
+        with self._condition:
+            subscriber = Subscriber(self, self._next_client_id, name)
+            self._next_client_id += 1
+            self._subscribers[subscriber.client_id] = subscriber
+            # Weckt einen pausierten Kamera-Thread (siehe wait_for_subscribers)
+            self._condition.notify_all()
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._condition:
+            self._subscribers.pop(subscriber.client_id, None)
+
+    def subscriber_count(self):
+        with self._condition:
+            return len(self._subscribers)
+
+    def wait_for_subscribers(self, timeout=None):
+        # Für den Produzenten: blockiert, solange niemand zuschaut
+        with self._condition:
+            return self._condition.wait_for(lambda: self._subscribers or self._closed, timeout) and not self._closed
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            subscribers = list(self._subscribers.values())
+            seq = self._seq
+        clients = [subscriber.stats() for subscriber in subscribers]
+        return {
+            'frame_seq': seq,
+            'capture_fps': round(self.published.rate(), 2),
+            'clients': len(clients),
+            'total_client_fps': round(sum(client['fps'] for client in clients), 2),
+            'per_client': clients,
+        }
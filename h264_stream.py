@@ -0,0 +1,287 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from cooperative import run_blocking
+
+# Sparsamer Live-Modus neben MJPEG: die lores-Frames werden genau einmal zu H.264 kodiert und als
+# kurze fMP4-Segmente mit HLS-Playlist abgelegt. Jeder Zuschauer lädt dieselben Dateien, statt
+# einen eigenen JPEG-Strom zu bekommen (ca. 80 kB/s statt 1-2 MB/s pro Zuschauer).
+HLS_DIR = os.path.join(tempfile.gettempdir(), "growbox_hls")
+PLAYLIST_NAME = "live.m3u8"
+INIT_NAME = "init.mp4"
+SEGMENT_PATTERN = "segment_%05d.m4s"
+H264_FPS = 15
+H264_BITRATE = 600000
+# Ein Keyframe pro Segment, damit jedes Segment für sich abspielbar ist
+SEGMENT_SECONDS = 1
+PLAYLIST_SEGMENTS = 6
+# Ohne Abruf der Playlist so lange gilt ein Zuschauer als weg; ohne Zuschauer ruht der Encoder
+VIEWER_TIMEOUT = 15
+IDLE_POLL_INTERVAL = 1.0
+# So lange wartet der erste Abruf der Playlist auf das erste fertige Segment
+START_TIMEOUT = 10
+SOFTWARE_CODEC = "libx264"
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+def hls_output_args(directory):
+    return [
+        "-f", "hls",
+        "-hls_time", str(SEGMENT_SECONDS),
+        "-hls_list_size", str(PLAYLIST_SEGMENTS),
+        "-hls_flags", "delete_segments+independent_segments+omit_endlist",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", INIT_NAME,
+        "-hls_segment_filename", os.path.join(directory, SEGMENT_PATTERN),
+        os.path.join(directory, PLAYLIST_NAME),
+    ]
+
+def software_command(directory, width, height, pixel_format, fps=H264_FPS, bitrate=H264_BITRATE):
+    # Rohe Frames über stdin; ultrafast/zerolatency hält die CPU-Last auf dem Pi klein
+    return [
+        "ffmpeg", "-y", "-loglevel", "warning",
+        "-f", "rawvideo", "-pix_fmt", pixel_format, "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+        "-c:v", SOFTWARE_CODEC, "-preset", "ultrafast", "-tune", "zerolatency",
+        "-pix_fmt", "yuv420p", "-b:v", str(bitrate), "-maxrate", str(bitrate), "-bufsize", str(bitrate),
+        "-g", str(fps * SEGMENT_SECONDS), "-keyint_min", str(fps * SEGMENT_SECONDS), "-sc_threshold", "0",
+    ] + hls_output_args(directory)
+
+def raw_format(frame):
+    # lores kommt je nach Modell als YUV420 (2D, Höhe * 1.5) oder als BGR/XBGR
+    if frame.ndim == 2:
+        return frame.shape[1], frame.shape[0] * 2 // 3, "yuv420p"
+    if frame.shape[2] == 4:
+        return frame.shape[1], frame.shape[0], "bgra"
+    return frame.shape[1], frame.shape[0], "bgr24"
+
+
+class H264Streamer:
+    # Startet den Encoder beim ersten Abruf der Playlist und stoppt ihn, wenn VIEWER_TIMEOUT lang
+    # niemand mehr abruft. Mit der echten Kamera kodiert der Hardware-Encoder von Picamera2,
+    # sonst (Simulation, Pi 5, Fehler) ein ffmpeg-Prozess mit libx264 aus capture_array('lores').
+    def __init__(self, camera, directory=HLS_DIR, fps=H264_FPS, bitrate=H264_BITRATE):
+        self.camera = camera
+        self.directory = directory
+        self.fps = fps
+        self.bitrate = bitrate
+        self.mode = None
+        self.starts = 0
+        self.frames_encoded = 0
+        self.last_error = None
+        self._viewers = {}
+        self._lock = threading.Lock()
+        # ffmpeg-Ausgabe neben dem Segment-Verzeichnis, das bei jedem Start geleert wird
+        self.log_path = directory + ".log"
+        self._process = None
+        self._encoder = None
+        self._feeder = None
+        self._running = threading.Event()
+        # Gesetzt, sobald der letzte Encoder samt ffmpeg ganz beendet ist; erst dann darf _start das
+        # Verzeichnis leeren, sonst schreibt das alte ffmpeg noch hinein
+        self._stopped = threading.Event()
+        self._stopped.set()
+        # Gesetzt, sobald die erste Playlist des laufenden Encoders geschrieben ist (oder er aufgibt)
+        self._ready = threading.Event()
+        self._closed = threading.Event()
+        self._watchdog = None
+
+    def hardware_available(self):
+        if not hasattr(self.camera, "start_encoder"):
+            return False
+        try:
+            import picamera2.encoders # nur auf dem Pi vorhanden
+        except ImportError:
+            return False
+        return True
+
+    def available(self):
+        return self.hardware_available() or ffmpeg_available()
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    def playlist_path(self):
+        return os.path.join(self.directory, PLAYLIST_NAME)
+
+    def touch(self, viewer):
+        # Bei jedem Abruf der Playlist; startet den Encoder, falls er ruht
+        with self._lock:
+            self._viewers[viewer] = time.monotonic()
+            if self._running.is_set() or self._closed.is_set():
+                return
+        # Ein gerade gestoppter Encoder wird außerhalb des Locks abgewartet, sein Feeder braucht ihn noch
+        self._stopped.wait()
+        with self._lock:
+            if not self._running.is_set() and not self._closed.is_set() and self._stopped.is_set():
+                self._start()
+
+    def wait_ready(self, timeout=START_TIMEOUT):
+        if not self._running.is_set():
+            return False
+        self._ready.wait(timeout)
+        return self._ready.is_set() and self._running.is_set()
+
+    def viewer_count(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for seen in self._viewers.values() if now - seen < VIEWER_TIMEOUT)
+
+    def _clear_directory(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+    def _start(self):
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch_viewers, daemon=True)
+            self._watchdog.start()
+        self._clear_directory()
+        self._ready.clear()
+        self.starts += 1
+        if self.hardware_available():
+            try:
+                self._start_hardware()
+                self.mode = "hardware"
+                self._running.set()
+                threading.Thread(target=self._await_playlist, daemon=True).start()
+                print("H.264-Stream gestartet (Hardware-Encoder).")
+                return
+            except Exception as e:
+                # z.B. Pi 5 ohne H.264-Hardware: weiter mit ffmpeg
+                print(f"Hardware-Encoder nicht verfügbar ({e}), nutze {SOFTWARE_CODEC}.")
+        if not ffmpeg_available():
+            self.last_error = "FFmpeg ist nicht installiert. Bitte 'sudo apt-get install ffmpeg' ausführen."
+            print(self.last_error)
+            return
+        self.mode = "software"
+        self._running.set()
+        self._feeder = threading.Thread(target=self._feed_software, daemon=True)
+        self._feeder.start()
+        print(f"H.264-Stream gestartet ({SOFTWARE_CODEC}).")
+
+    def _start_hardware(self):
+        from picamera2.encoders import H264Encoder
+        from picamera2.outputs import FfmpegOutput
+        # Der Encoder liefert H.264 mit Keyframe pro Segment, ffmpeg verpackt nur (-c:v copy) in fMP4
+        self._encoder = H264Encoder(bitrate=self.bitrate, repeat=True, iperiod=self.fps * SEGMENT_SECONDS)
+        output = FfmpegOutput(" ".join(hls_output_args(self.directory)))
+        self.camera.start_encoder(self._encoder, output, name="lores")
+
+    def _await_playlist(self):
+        # Hardware-Modus: ffmpeg läuft in Picamera2, also hier auf die erste Playlist achten
+        while self._running.is_set() and not os.path.exists(self.playlist_path()):
+            self._closed.wait(0.1)
+        self._ready.set()
+
+    def _feed_software(self):
+        # Eigener Thread: Frames im Takt von fps holen und roh an ffmpeg geben. Nach _stop_encoder()
+        # kann ein touch() schon den nächsten Feeder gestartet haben; dieser hier endet dann trotzdem.
+        current = threading.current_thread()
+        process = None
+        owner = False
+        log = open(self.log_path, 'w')
+        try:
+            while self._running.is_set() and self._feeder is current:
+                started = time.monotonic()
+                frame = run_blocking(self.camera.capture_array, "lores")
+                if process is None:
+                    width, height, pixel_format = raw_format(frame)
+                    command = software_command(self.directory, width, height, pixel_format, self.fps, self.bitrate)
+                    print(f"Starte ffmpeg: {' '.join(command)}")
+                    process = self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=log)
+                process.stdin.write(frame.tobytes())
+                self.frames_encoded += 1
+                if not self._ready.is_set() and os.path.exists(self.playlist_path()):
+                    self._ready.set()
+                remaining = 1.0 / self.fps - (time.monotonic() - started)
+                if remaining > 0:
+                    self._closed.wait(remaining)
+        except (BrokenPipeError, OSError) as e:
+            with open(self.log_path) as f:
+                stderr_tail = f.read()[-2000:]
+            self.last_error = f"ffmpeg beendet: {e} {stderr_tail}".strip()
+            print(f"Fehler im H.264-Stream: {self.last_error}")
+        finally:
+            with self._lock:
+                # Nur der aktuelle Feeder darf den Stream als beendet markieren
+                if self._feeder is current:
+                    owner = True
+                    self._running.clear()
+                    self._stopped.clear()
+                    self._feeder = None
+            if owner:
+                self._ready.set() # wartende Abrufe nicht bis START_TIMEOUT hängen lassen
+            if process:
+                self._end_process(process)
+            log.close()
+            if owner:
+                self._stopped.set()
+
+    def _end_process(self, process):
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if self._process is process:
+            self._process = None
+
+    def _stop_encoder(self):
+        with self._lock:
+            if not self._running.is_set():
+                return
+            self._running.clear()
+            self._stopped.clear()
+            if self.mode == "hardware" and self._encoder is not None:
+                self.camera.stop_encoder(self._encoder)
+                self._encoder = None
+            # Unter dem Lock austauschen: ein touch() danach startet einen neuen Feeder, der erhalten bleibt
+            feeder, self._feeder = self._feeder, None
+        if feeder:
+            feeder.join()
+        self._ready.set()
+        self._stopped.set()
+        print("Keine H.264-Zuschauer mehr, Encoder gestoppt.")
+
+    def _watch_viewers(self):
+        while not self._closed.wait(IDLE_POLL_INTERVAL):
+            if self._running.is_set() and not self.viewer_count():
+                self._stop_encoder()
+
+    def stop(self):
+        self._closed.set()
+        self._stop_encoder()
+
+    def stats(self):
+        segments = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                try:
+                    if entry.name.endswith(".m4s"):
+                        segments.append(entry.stat().st_size)
+                except FileNotFoundError:
+                    pass # von ffmpeg gerade gelöscht
+        segment_bytes = sum(segments)
+        return {
+            'available': self.available(),
+            'running': self.running,
+            'mode': self.mode,
+            'viewers': self.viewer_count(),
+            'starts': self.starts,
+            'fps': self.fps,
+            'bitrate': self.bitrate,
+            'frames_encoded': self.frames_encoded,
+            'segments': len(segments),
+            # Tatsächliche Datenrate pro Zuschauer aus den vorhandenen Segmenten
+            'bytes_per_second': round(segment_bytes / (len(segments) * SEGMENT_SECONDS)) if segments else 0,
+            'last_error': self.last_error,
+        }
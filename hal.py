@@ -0,0 +1,319 @@
+import math
+import os
+import random
+import threading
+import time
+import ds18b20
+import storage
+
+# Hardware-Abstraktion: Kamera, 1-Wire und ADC werden erst bei der ersten Benutzung geladen.
+# Simuliert wird nur mit ausdrücklichem GROWBOX_HAL=simulated. Bei 'auto' (Standard, wie 'hardware') ist
+# fehlende Hardware ein Fehler: sonst schriebe ein Pi, dessen 1-Wire-Modul spät lädt oder dessen ADS1115
+# abgesteckt ist, erfundene Werte unter den echten Sensornamen in die Datenbank.
+HAL_ENV = 'GROWBOX_HAL'
+HAL_MODES = ['auto', 'hardware', 'simulated']
+
+# Sperrdatei, damit nur ein Prozess die Kamera öffnet (z.B. nicht zusätzlich der Reloader des Dev-Servers)
+CAMERA_LOCK_FILE = '/tmp/growbox_camera.lock'
+I2C_BUS_NUMBER = 4
+ADS1115_ADDRESS = 0x48
+
+# Simulierte Sensoren: Name -> (Tagesmittel °C, Tagesschwankung °C)
+SIMULATED_SENSORS = {
+    storage.DEFAULT_SENSOR: (23.0, 3.0),
+    'root_zone': (21.0, 1.5),
+    'reservoir': (19.5, 0.8),
+}
+# Simulierte ADC-Kanäle: Kanal -> (Mittelwert V, Drift V, Rauschen V); pH-Sonde an A0, EC-Sonde an A1
+SIMULATED_CHANNELS = {
+    0: (2.63, 0.05, 0.004),
+    1: (1.20, 0.10, 0.006),
+    2: (0.0, 0.0, 0.001),
+    3: (0.0, 0.0, 0.001),
+}
+DS18B20_RESOLUTION = 0.0625
+
+_instances = {}
+_lock = threading.Lock()
+_camera_lock_file = None
+
+def hal_mode():
+    mode = os.environ.get(HAL_ENV, 'auto')
+    if mode not in HAL_MODES:
+        raise ValueError(f"Unbekannter Wert {HAL_ENV}='{mode}', erlaubt: {', '.join(HAL_MODES)}")
+    return mode
+
+def _shared(name, factory):
+    # Ein Backend pro Prozess, erzeugt beim ersten Zugriff
+    with _lock:
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+def _unavailable(kind, error):
+    raise RuntimeError(f"{kind} nicht verfügbar ({error}). Zum Testen ohne Hardware: {HAL_ENV}=simulated") from error
+
+def diurnal(mean, amplitude, now=None):
+    # Tagesgang mit Maximum am frühen Nachmittag
+    now = now if now is not None else time.time()
+    hour = time.localtime(now).tm_hour + time.localtime(now).tm_min / 60.0
+    return mean + amplitude * math.sin(2 * math.pi * (hour - 8.0) / 24.0)
+
+
+# --- Kamera ---
+
+def open_camera():
+    # Neues Kamera-Objekt (Picamera2 oder Simulation); der Aufrufer ist für stop()/close() zuständig
+    if hal_mode() != 'simulated':
+        try:
+            from picamera2 import Picamera2
+            return Picamera2()
+        except Exception as e:
+            _unavailable("Kamera", e)
+    return SimulatedCamera()
+
+def camera():
+    # Prozessweit genau ein Kamera-Objekt, das sich alle Nutzer im Prozess teilen
+    return _shared('camera', _open_exclusive_camera)
+
+def _open_exclusive_camera():
+    global _camera_lock_file
+    import fcntl
+    # 'a+' statt 'w': ein zweiter Prozess darf die PID des Besitzers nicht schon beim Öffnen löschen
+    try:
+        lock_file = open(CAMERA_LOCK_FILE, 'a+')
+    except OSError as e:
+        raise RuntimeError(f"Kamera-Sperrdatei {CAMERA_LOCK_FILE} nicht nutzbar: {e}") from e
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.seek(0)
+        owner = lock_file.read().strip() or '?'
+        lock_file.close()
+        raise RuntimeError(f"Kamera wird bereits von einem anderen Prozess benutzt (PID {owner}), z.B. der Web-App ({CAMERA_LOCK_FILE})")
+    except OSError as e:
+        lock_file.close()
+        raise RuntimeError(f"Kamera-Sperrdatei {CAMERA_LOCK_FILE} nicht nutzbar: {e}") from e
+    # Erst mit der Sperre gehört die Datei uns: alte PID ersetzen. Die Sperre gilt, solange die Datei
+    # offen ist, also bis zum Ende des Prozesses
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _camera_lock_file = lock_file
+    return open_camera()
+
+
+class SimulatedCamera:
+    # Ersatz für Picamera2 zum Testen ohne Kamera: liefert bewegte BGR-Testbilder
+    # und bietet die Teile der Picamera2-API, die Stream und Fotoaufnahme benutzen.
+    def __init__(self, size=(640, 480), fps=30, main_size=(1280, 720)):
+        self.fps = fps
+        self.started = False
+        self.sizes = {'main': main_size, 'lores': size}
+        self._bases = {}
+        self._frame_index = 0
+        self._last_capture = 0.0
+        self._capture_lock = threading.Lock()
+
+    def _base(self, name):
+        # Testbild (Farbverlauf) pro Stream-Größe, einmal erzeugt
+        import numpy as np
+        size = self.sizes.get(name, self.sizes['main'])
+        if size not in self._bases:
+            width, height = size
+            x = np.linspace(0, 255, width, dtype=np.uint8)
+            y = np.linspace(0, 255, height, dtype=np.uint8)
+            self._bases[size] = np.dstack([
+                np.tile(x, (height, 1)),
+                np.tile(y[:, None], (1, width)),
+                np.full((height, width), 96, dtype=np.uint8),
+            ])
+        return self._bases[size]
+
+    def create_video_configuration(self, **kwargs):
+        return kwargs
+
+    def create_still_configuration(self, **kwargs):
+        return kwargs
+
+    def configure(self, config):
+        if isinstance(config, dict):
+            for name in ('main', 'lores'):
+                if config.get(name) and config[name].get('size'):
+                    self.sizes[name] = tuple(config[name]['size'])
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def release(self):
+        self.started = False
+
+    close = release
+    release_camera = release
+
+    def capture_array(self, name="main"):
+        import numpy as np
+        # Taktet wie eine echte Kamera mit der eingestellten Bildrate; alle Streams kommen aus demselben Frame-Takt
+        with self._capture_lock:
+            wait = self._last_capture + 1.0 / self.fps - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_capture = time.monotonic()
+            self._frame_index += 1
+            index = self._frame_index
+        base = self._base(name)
+        frame = np.roll(base, index * 4 * base.shape[1] // 640, axis=1)
+        # Etwas Rauschen, damit der JPEG-Encoder realistisch arbeitet
+        noise = np.random.randint(0, 16, size=frame.shape[:2], dtype=np.uint8)
+        frame[:, :, 2] = frame[:, :, 2] + noise
+        return frame
+
+    def capture_request(self):
+        return SimulatedRequest(self)
+
+    def capture_file(self, path, name="main"):
+        import cv2
+        cv2.imwrite(path, self.capture_array(name))
+
+
+class SimulatedRequest:
+    # Wie picamera2.CompletedRequest: Frames aller Streams desselben Zeitpunkts, bis release()
+    def __init__(self, camera):
+        self.camera = camera
+        self.frame = camera.capture_array("main")
+
+    def make_array(self, name="main"):
+        import cv2
+        if name == "main":
+            return self.frame.copy()
+        width, height = self.camera.sizes[name]
+        return cv2.resize(self.frame, (width, height), interpolation=cv2.INTER_AREA)
+
+    def save(self, name, path):
+        import cv2
+        cv2.imwrite(path, self.make_array(name))
+
+    def release(self):
+        self.frame = None
+
+
+# --- 1-Wire-Temperatursensoren ---
+
+def temperature_registry():
+    return _shared('w1', _create_temperature_registry)
+
+def _create_temperature_registry():
+    if hal_mode() != 'simulated':
+        # Auch ohne gefundene Sensoren die echte Registry: read_all() sucht erneut und meldet
+        # 'No DS18B20 sensor found', bis das 1-Wire-Modul geladen ist
+        registry = ds18b20.SensorRegistry(ds18b20.W1_BASE_DIR, ds18b20.SENSOR_CONFIG)
+        registry.discover()
+        return registry
+    return SimulatedSensorRegistry()
+
+
+class SimulatedSensorRegistry:
+    # Gleiche Schnittstelle wie ds18b20.SensorRegistry: Tagesgang plus Rauschen,
+    # in 1/16 °C gerundet wie ein DS18B20 mit 12 Bit, und eine Wandlungszeit
+    def __init__(self, sensors=None, conversion_time=ds18b20.CONVERSION_TIME):
+        self.profiles = sensors or SIMULATED_SENSORS
+        self.conversion_time = conversion_time
+        self.sensors = {name: f"28-sim{index:08x}" for index, name in enumerate(self.profiles)}
+
+    def discover(self):
+        return self.sensors
+
+    @property
+    def primary(self):
+        if storage.DEFAULT_SENSOR in self.sensors:
+            return storage.DEFAULT_SENSOR
+        return sorted(self.sensors)[0]
+
+    def read_all(self):
+        if self.conversion_time:
+            time.sleep(self.conversion_time)
+        values = {}
+        for name, (mean, amplitude) in self.profiles.items():
+            value = diurnal(mean, amplitude) + random.gauss(0, 0.05)
+            values[name] = round(round(value / DS18B20_RESOLUTION) * DS18B20_RESOLUTION, 2)
+        return values, {}
+
+
+# --- ADC (ADS1115 für pH und EC) ---
+
+def adc():
+    return _shared('adc', _create_adc)
+
+def _create_adc():
+    if hal_mode() != 'simulated':
+        try:
+            return Ads1115Adc()
+        except Exception as e:
+            _unavailable("ADS1115", e)
+    return SimulatedAdc()
+
+
+class Ads1115Adc:
+    # ADS1115 am I2C-Bus 4; Bibliotheken werden erst hier geladen
+    def __init__(self, bus_number=I2C_BUS_NUMBER, address=ADS1115_ADDRESS):
+        import smbus
+        import adafruit_ads1x15.ads1115 as ADS
+        from adafruit_ads1x15.analog_in import AnalogIn
+        self.bus = smbus.SMBus(bus_number)
+        self.ads = ADS.ADS1115(self.bus, address=address)
+        self.channels = [AnalogIn(self.ads, pin) for pin in (ADS.P0, ADS.P1, ADS.P2, ADS.P3)]
+        self.data_rate = self.ads.data_rate
+
+    def configure(self, data_rate, continuous=True):
+        # Im Dauerbetrieb wandelt der ADS1115 selbst im Takt der Datenrate, gelesen wird nur das Ergebnisregister
+        from adafruit_ads1x15.ads1x15 import Mode
+        self.ads.data_rate = data_rate
+        self.ads.mode = Mode.CONTINUOUS if continuous else Mode.SINGLE
+        self.data_rate = data_rate
+
+    def read_voltage(self, channel):
+        return self.channels[channel].voltage
+
+    def read_block(self, channel, count):
+        # count Wandlungen eines Kanals im Takt der Datenrate; schneller lesen würde nur Duplikate liefern
+        import numpy as np
+        values = np.empty(count)
+        period = 1.0 / self.data_rate
+        deadline = time.monotonic()
+        for i in range(count):
+            values[i] = self.channels[channel].voltage
+            deadline += period
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        return values
+
+
+class SimulatedAdc:
+    # Spannungen mit langsamer Drift und Messrauschen im Bereich echter pH-/EC-Sonden,
+    # dazu vereinzelte Ausreißer wie durch Störungen auf der Leitung
+    SPIKE_PROBABILITY = 0.01
+
+    def __init__(self, channels=None):
+        self.channels = channels or SIMULATED_CHANNELS
+        self.data_rate = 128
+
+    def configure(self, data_rate, continuous=True):
+        self.data_rate = data_rate
+
+    def read_voltage(self, channel):
+        mean, drift, noise = self.channels[channel]
+        return round(diurnal(mean, drift) + random.gauss(0, noise), 5)
+
+    def read_block(self, channel, count):
+        import numpy as np
+        mean, drift, noise = self.channels[channel]
+        time.sleep(count / self.data_rate)
+        values = diurnal(mean, drift) + np.random.normal(0, noise, count)
+        spikes = np.random.random(count) < self.SPIKE_PROBABILITY
+        values[spikes] += np.random.choice([-1.0, 1.0], spikes.sum()) * 0.5
+        return values
@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from collections import deque
+import storage
+
+# Live-Messwerte für das Dashboard per Server-Sent Events.
+# Ein Thread holt neue Messwerte aus der Datenbank und legt jedes Ereignis genau einmal
+# serialisiert im EventHub ab; die Clients warten nur auf neue Sequenznummern.
+HISTORY_SIZE = 500
+POLL_INTERVAL = 2.0
+IDLE_POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+# Browser verbinden sich nach so vielen ms neu, wenn die Verbindung abreißt
+RETRY_MS = 5000
+
+def format_event(seq, event, payload):
+    return f"id: {seq}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+class EventHub:
+    # Wie FrameBroadcaster, aber mit kurzer Historie: ein Client, der kurz weg war
+    # (Last-Event-ID), bekommt die verpassten Ereignisse nachgeliefert.
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._events = deque(maxlen=history_size)
+        self._seq = 0
+        self._subscribers = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.published = 0
+
+    def publish(self, event, data):
+        payload = json.dumps(data, separators=(',', ':'))
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq, format_event(self._seq, event, payload)))
+            self.published += 1
+            self._condition.notify_all()
+        return self._seq
+
+    @property
+    def seq(self):
+        with self._condition:
+            return self._seq
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def events_after(self, last_seq, timeout):
+        # Liefert (neue Sequenznummer, [kodierte Ereignisse]); None als Liste, wenn Ereignisse
+        # aus der Historie gefallen sind und der Client neu laden muss
+        with self._condition:
+            if self._seq <= last_seq and not self._closed:
+                self._condition.wait(timeout)
+            if self._seq <= last_seq:
+                return last_seq, []
+            if not self._events or self._events[0][0] > last_seq + 1:
+                return self._seq, None
+            return self._seq, [message for seq, message in self._events if seq > last_seq]
+
+    def subscribe(self):
+        with self._condition:
+            self._subscribers += 1
+            self._condition.notify_all()
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def subscriber_count(self):
+        with self._condition:
+            return self._subscribers
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        return {'seq': self.seq, 'published': self.published, 'clients': self.subscriber_count()}
+
+
+class ReadingWatcher:
+    # Fragt nur bei verbundenen Clients alle POLL_INTERVAL Sekunden nach neuen Messwerten,
+    # unabhängig davon, wie viele Clients es sind. Neue Werte schreibt sensor_logger.py.
+    def __init__(self, hub, poll_interval=POLL_INTERVAL):
+        self.hub = hub
+        self.poll_interval = poll_interval
+        self.polls = 0
+        self._last_ts = {}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def poll(self):
+        # Neue Zeilen je Sensor über den Primärschlüssel (sensor_id, ts)
+        with storage.connection() as conn:
+            sensors = conn.execute("SELECT id, name FROM sensors").fetchall()
+            new_readings = []
+            for sensor_id, name in sensors:
+                if name not in self._last_ts:
+                    row = conn.execute("SELECT MAX(ts) FROM readings WHERE sensor_id = ?", (sensor_id,)).fetchone()
+                    self._last_ts[name] = row[0] or 0
+                    continue
+                rows = conn.execute("SELECT ts, value FROM readings WHERE sensor_id = ? AND ts > ? ORDER BY ts ASC",
+                                    (sensor_id, self._last_ts[name])).fetchall()
+                if rows:
+                    self._last_ts[name] = rows[-1][0]
+                    new_readings.extend((ts, name, value) for ts, value in rows)
+        self.polls += 1
+        for ts, name, value in sorted(new_readings):
+            self.hub.publish('reading', {'sensor': name, 'ts': ts, 'value': value})
+        return len(new_readings)
+
+    def _worker(self):
+        while not self.hub.closed:
+            if not self.hub.subscriber_count():
+                # Ohne Clients nicht abfragen; beim nächsten Client ab dem dann neuesten Wert
+                self._last_ts.clear()
+                time.sleep(IDLE_POLL_INTERVAL)
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Fehler beim Abfragen neuer Messwerte: {e}")
+            time.sleep(self.poll_interval)
+
+
+def stream(hub, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL):
+    # Generator für die SSE-Antwort eines Clients
+    hub.subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        last_seq = last_event_id if last_event_id is not None else hub.seq
+        if last_seq > hub.seq:
+            # Server wurde neu gestartet, alte IDs gelten nicht mehr
+            last_seq = hub.seq
+        while not hub.closed:
+            last_seq, messages = hub.events_after(last_seq, heartbeat)
+            if messages is None:
+                yield format_event(last_seq, 'reset', '{}')
+            elif messages:
+                yield b''.join(messages)
+            else:
+                # Kommentarzeile hält Proxys und NAT offen und erkennt getrennte Clients
+                yield b": keepalive\n\n"
+    finally:
+        hub.unsubscribe()
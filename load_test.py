@@ -0,0 +1,172 @@
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Lasttest gegen einen laufenden Growbox-Monitor (z.B. 'GROWBOX_HAL=simulated python3 serve.py'):
+# MJPEG-Zuschauer, SSE-Clients und parallele API-Aufrufe gleichzeitig, danach eine Auswertung.
+API_PATHS = [
+    '/api/temperature_latest',
+    '/api/temperature_data?hours=24&timestamps=ms',
+    '/api/temperature_data?hours=168&timestamps=ms',
+    '/api/stream_stats',
+]
+FRAME_BOUNDARY = b'--frame\r\n'
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LoadTest:
+    def __init__(self, url, viewers, sse_clients, api_workers, duration):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.viewers = viewers
+        self.sse_clients = sse_clients
+        self.api_workers = api_workers
+        self.duration = duration
+        self.frames = [0] * viewers
+        self.frame_bytes = [0] * viewers
+        self.sse_events = [0] * sse_clients
+        self.latencies = []
+        self.errors = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _error(self, kind, error):
+        with self._lock:
+            self.errors.append(f"{kind}: {error}")
+
+    def viewer(self, index):
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+            conn.request('GET', '/video_feed')
+            response = conn.getresponse()
+            tail = b''
+            while not self._stop.is_set():
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+                data = tail + chunk
+                self.frames[index] += data.count(FRAME_BOUNDARY)
+                self.frame_bytes[index] += len(chunk)
+                tail = data[-len(FRAME_BOUNDARY):]
+            conn.close()
+        except Exception as e:
+            self._error('video_feed', e)
+
+    def sse_client(self, index):
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            conn.request('GET', '/api/events')
+            response = conn.getresponse()
+            while not self._stop.is_set():
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+                self.sse_events[index] += chunk.count(b'\nevent: ')
+            conn.close()
+        except Exception as e:
+            self._error('events', e)
+
+    def api_worker(self, index):
+        # Eine Keep-Alive-Verbindung pro Worker, die Pfade reihum
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        request_number = index
+        while not self._stop.is_set():
+            path = API_PATHS[request_number % len(API_PATHS)]
+            request_number += 1
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    self._error(path, f"HTTP {response.status}")
+                    continue
+            except Exception as e:
+                self._error(path, e)
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+                continue
+            with self._lock:
+                self.latencies.append((path, (time.perf_counter() - started) * 1000))
+        conn.close()
+
+    def run(self):
+        threads = [threading.Thread(target=self.viewer, args=(i,), daemon=True) for i in range(self.viewers)]
+        threads += [threading.Thread(target=self.sse_client, args=(i,), daemon=True) for i in range(self.sse_clients)]
+        threads += [threading.Thread(target=self.api_worker, args=(i,), daemon=True) for i in range(self.api_workers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(self.duration)
+        self._stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        return self.result()
+
+    def result(self):
+        fps = [frames / self.duration for frames in self.frames]
+        latencies = [ms for path, ms in self.latencies]
+        per_path = {}
+        for path, ms in self.latencies:
+            per_path.setdefault(path, []).append(ms)
+        return {
+            'duration': self.duration,
+            'viewers': self.viewers,
+            'sse_clients': self.sse_clients,
+            'api_workers': self.api_workers,
+            'viewer_fps_min': round(min(fps), 2) if fps else None,
+            'viewer_fps_mean': round(statistics.fmean(fps), 2) if fps else None,
+            'stream_mbit_s': round(sum(self.frame_bytes) * 8 / self.duration / 1e6, 2),
+            'sse_events': sum(self.sse_events),
+            'api_requests': len(latencies),
+            'api_rps': round(len(latencies) / self.duration, 1),
+            'api_p50_ms': round(percentile(latencies, 0.5), 1),
+            'api_p95_ms': round(percentile(latencies, 0.95), 1),
+            'api_p99_ms': round(percentile(latencies, 0.99), 1),
+            'api_p95_ms_by_path': {path: round(percentile(values, 0.95), 1) for path, values in per_path.items()},
+            'errors': len(self.errors),
+            'error_samples': self.errors[:5],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest für Stream, Live-Ereignisse und API des Growbox-Monitors.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--viewers', type=int, nargs='+', default=[1, 5, 10, 20],
+                        help="Anzahl MJPEG-Zuschauer, mehrere Werte = mehrere Durchläufe")
+    parser.add_argument('--sse-clients', type=int, default=5)
+    parser.add_argument('--api-workers', type=int, default=8, help="Parallele API-Clients")
+    parser.add_argument('--duration', type=float, default=20.0, help="Sekunden pro Durchlauf")
+    parser.add_argument('--json', help="Ergebnisse zusätzlich als JSON speichern")
+    args = parser.parse_args()
+
+    results = []
+    for viewers in args.viewers:
+        print(f"Durchlauf: {viewers} Zuschauer, {args.sse_clients} SSE-Clients, {args.api_workers} API-Clients, "
+              f"{args.duration:g} s...")
+        result = LoadTest(args.url, viewers, args.sse_clients, args.api_workers, args.duration).run()
+        results.append(result)
+        print(f"  Stream: {result['viewer_fps_mean']} FPS im Mittel, min. {result['viewer_fps_min']} FPS, "
+              f"{result['stream_mbit_s']} Mbit/s gesamt")
+        print(f"  API: {result['api_rps']} Requests/s, p50 {result['api_p50_ms']} ms, p95 {result['api_p95_ms']} ms, "
+              f"p99 {result['api_p99_ms']} ms")
+        print(f"  SSE: {result['sse_events']} Ereignisse, Fehler: {result['errors']}")
+        for sample in result['error_samples']:
+            print(f"    {sample}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Ergebnisse gespeichert in {args.json}")
+
+if __name__ == '__main__':
+    main()
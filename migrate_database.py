@@ -0,0 +1,48 @@
+import argparse
+import os
+import sqlite3
+import storage
+
+# Stellt eine bestehende growbox_data.db auf das kompakte Schema (INTEGER-Zeitstempel in ms) um.
+# Kann gefahrlos wiederholt werden, z.B. nach einem Abbruch.
+
+def file_size(path):
+    total = 0
+    for suffix in ('', '-wal'):
+        if os.path.exists(path + suffix):
+            total += os.path.getsize(path + suffix)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Migriert growbox_data.db auf das Schema mit INTEGER-Zeitstempeln.")
+    parser.add_argument('--db', default=storage.DB_NAME, help="Pfad zur Datenbank")
+    parser.add_argument('--batch-size', type=int, default=storage.CONVERSION_BATCH_SIZE,
+                        help="Zeilen pro Transaktion")
+    parser.add_argument('--no-vacuum', action='store_true', help="Datei anschließend nicht verkleinern")
+    args = parser.parse_args()
+
+    size_before = file_size(args.db)
+    conn = None
+    try:
+        conn = storage.open_connection(args.db)
+        version = storage.migrate(conn)
+        converted = storage.convert_legacy_temperatures(conn, args.batch_size)
+        print(f"Schema-Version {version}, {converted} Messwerte umgestellt.")
+
+        if converted and not args.no_vacuum:
+            print("Verkleinere Datenbankdatei (VACUUM)...")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.Error as e:
+        print(f"Fehler bei der Migration: {e}")
+        return 1
+    finally:
+        if conn:
+            conn.close()
+
+    size_after = file_size(args.db)
+    print(f"Dateigröße: {size_before / 1024:.0f} KB -> {size_after / 1024:.0f} KB")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
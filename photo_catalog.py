@@ -0,0 +1,121 @@
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+import storage
+
+# Dateinamen von camera_picture.py: growbox_photo_%Y%m%d_%H%M%S.jpg
+PHOTO_NAME_PATTERN = re.compile(r'growbox_photo_(\d{8})_(\d{6})\.jpg$')
+PHOTO_TIME_FORMAT = "%Y%m%d_%H%M%S"
+BACKFILL_BATCH_SIZE = 500
+PHOTO_COLUMNS = ['id', 'path', 'taken_at', 'size', 'brightness', 'thumbnail']
+
+def photo_taken_at(path):
+    # Aufnahmezeit (Epoch-ms) aus dem Dateinamen, sonst aus der Änderungszeit
+    match = PHOTO_NAME_PATTERN.search(os.path.basename(path))
+    if match:
+        taken = datetime.datetime.strptime(f"{match.group(1)}_{match.group(2)}", PHOTO_TIME_FORMAT)
+        return storage.to_ms(taken)
+    return int(os.path.getmtime(path) * 1000)
+
+def mean_brightness(path):
+    # Mittlere Helligkeit (0-255) aus einem auf 1/8 verkleinert dekodierten Graustufenbild
+    import cv2 # erst hier laden, der Katalog selbst braucht kein OpenCV
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    return round(float(image.mean()), 2)
+
+def photo_from_row(row):
+    return dict(zip(PHOTO_COLUMNS, row))
+
+def add_photo(conn, path, taken_at=None, size=None, brightness=None):
+    path = os.path.abspath(path)
+    if taken_at is None:
+        taken_at = photo_taken_at(path)
+    if size is None:
+        size = os.path.getsize(path)
+    conn.execute("INSERT OR IGNORE INTO photos (path, taken_at, size, brightness) VALUES (?, ?, ?, ?)",
+                 (path, taken_at, size, brightness))
+
+def has_photos(conn):
+    return conn.execute("SELECT 1 FROM photos LIMIT 1").fetchone() is not None
+
+def photo_files(conn, start_ms=None, end_ms=None):
+    # Zeitraum-Abfrage über den Index auf taken_at; (Pfad, Größe) für Frames und Segment-Schlüssel
+    cursor = conn.execute("SELECT path, size FROM photos WHERE taken_at >= ? AND taken_at <= ? ORDER BY taken_at ASC",
+                          (start_ms if start_ms is not None else 0,
+                           end_ms if end_ms is not None else 2 ** 62))
+    return [(row[0], row[1]) for row in cursor]
+
+def photo_page(conn, limit, before=None):
+    # Keyset-Pagination, neueste zuerst; before = (taken_at, id) des letzten Fotos der Vorseite
+    columns = ', '.join(PHOTO_COLUMNS)
+    if before is None:
+        cursor = conn.execute(f"SELECT {columns} FROM photos ORDER BY taken_at DESC, id DESC LIMIT ?", (limit,))
+    else:
+        cursor = conn.execute(f"SELECT {columns} FROM photos WHERE (taken_at, id) < (?, ?) "
+                              f"ORDER BY taken_at DESC, id DESC LIMIT ?", (*before, limit))
+    return [photo_from_row(row) for row in cursor]
+
+def get_photo(conn, photo_id):
+    row = conn.execute(f"SELECT {', '.join(PHOTO_COLUMNS)} FROM photos WHERE id = ?", (photo_id,)).fetchone()
+    return photo_from_row(row) if row else None
+
+def catalog_photo(path, brightness=None):
+    # Für camera_picture.py: ein neues Foto direkt nach der Aufnahme eintragen
+    try:
+        if brightness is None:
+            brightness = mean_brightness(path)
+        with storage.connection() as conn:
+            add_photo(conn, path, brightness=brightness)
+        return True
+    except (sqlite3.Error, OSError) as e:
+        print(f"Fehler beim Eintragen des Fotos in den Katalog: {e}")
+        return False
+
+def backfill(photo_dir, with_brightness=True, batch_size=BACKFILL_BATCH_SIZE):
+    # Trägt alle Fotos aus photo_dir ein, die noch nicht im Katalog stehen. Kann wiederholt werden.
+    with storage.connection() as conn:
+        known = {row[0] for row in conn.execute("SELECT path FROM photos")}
+
+    added = 0
+    batch = []
+
+    def flush():
+        # Helligkeit vor der Schreibtransaktion berechnen, damit der Logger nicht warten muss
+        rows = [(path, size, mean_brightness(path) if with_brightness else None) for path, size in batch]
+        with storage.connection() as conn:
+            for path, size, brightness in rows:
+                add_photo(conn, path, size=size, brightness=brightness)
+        batch.clear()
+
+    with os.scandir(photo_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.jpg'):
+                continue
+            path = os.path.abspath(entry.path)
+            if path in known:
+                continue
+            batch.append((path, entry.stat().st_size))
+            added += 1
+            if len(batch) >= batch_size:
+                flush()
+                print(f"{added} Fotos eingetragen...")
+    if batch:
+        flush()
+    return added
+
+def main():
+    parser = argparse.ArgumentParser(description="Trägt vorhandene Fotos in den Foto-Katalog ein.")
+    parser.add_argument('photo_dir', nargs='?', default="/home/pi/growbox_photos", help="Verzeichnis mit den Fotos")
+    parser.add_argument('--skip-brightness', action='store_true',
+                        help="Helligkeit nicht berechnen (schneller, kein JPEG-Dekodieren)")
+    args = parser.parse_args()
+
+    added = backfill(args.photo_dir, with_brightness=not args.skip_brightness)
+    print(f"{added} neue Fotos aus {args.photo_dir} in den Katalog übernommen.")
+
+if __name__ == '__main__':
+    main()
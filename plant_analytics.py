@@ -0,0 +1,183 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import photo_catalog
+import storage
+from cooperative import run_blocking
+
+# Kennzahlen aus dem Kamerabild als Messreihen in 'readings', neben Temperatur, pH und EC.
+# Dadurch gelten Verdichtung, Graph-API, Export und Aufräumen automatisch auch für sie.
+CANOPY_SENSOR = 'canopy'        # Anteil grüner Pixel in %, nur bei Licht
+LUMINANCE_SENSOR = 'luminance'  # mittlere Helligkeit 0-255
+LIGHTS_SENSOR = 'lights'        # 1 = Licht an, 0 = aus
+ANALYTICS_SENSORS = [CANOPY_SENSOR, LUMINANCE_SENSOR, LIGHTS_SENSOR]
+
+ANALYTICS_INTERVAL = 60
+# Jedes 4. Pixel in jeder Richtung reicht für Flächenanteile und Mittelwerte
+SUBSAMPLE = 4
+# Grün im HSV-Raum von OpenCV (Farbton 0-180)
+GREEN_HUE = (35, 90)
+MIN_SATURATION = 60
+MIN_VALUE = 40
+# Hysterese, damit Dämmerung oder Schatten nicht ständig umschalten
+LIGHTS_ON_LUMINANCE = 70
+LIGHTS_OFF_LUMINANCE = 45
+BACKFILL_BATCH_SIZE = 200
+
+def to_bgr(frame):
+    # lores kommt je nach Modell als YUV420 (2D, Höhe * 1.5) statt als BGR
+    import cv2
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_YUV420p2BGR)
+    if frame.shape[2] == 4:
+        return frame[:, :, :3]
+    return frame
+
+def lights_on(luminance, previous=None):
+    if previous is None:
+        return luminance >= (LIGHTS_ON_LUMINANCE + LIGHTS_OFF_LUMINANCE) / 2
+    if previous:
+        return luminance >= LIGHTS_OFF_LUMINANCE
+    return luminance >= LIGHTS_ON_LUMINANCE
+
+def frame_metrics(frame, previous_lights=None, subsample=SUBSAMPLE):
+    # Alles vektorisiert auf dem verkleinerten Frame, keine Schleife über Pixel
+    import cv2
+    small = np.ascontiguousarray(to_bgr(frame)[::subsample, ::subsample])
+    luminance = float(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).mean())
+    lights = lights_on(luminance, previous_lights)
+    metrics = {LUMINANCE_SENSOR: round(luminance, 2), LIGHTS_SENSOR: 1.0 if lights else 0.0}
+    if lights:
+        # Im Dunkeln (oder unter IR) ist Grün nicht zu erkennen, dann keine Blattfläche
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        green = cv2.inRange(hsv, (GREEN_HUE[0], MIN_SATURATION, MIN_VALUE), (GREEN_HUE[1], 255, 255))
+        metrics[CANOPY_SENSOR] = round(100.0 * np.count_nonzero(green) / green.size, 2)
+    return metrics
+
+def store_metrics(conn, ts, metrics):
+    for sensor, value in metrics.items():
+        storage.insert_reading(conn, sensor, ts, value)
+
+
+class FrameAnalyzer:
+    # Hintergrund-Thread im Kamera-Dienst: alle interval Sekunden ein lores-Frame auswerten
+    # und speichern, unabhängig davon, ob jemand den Stream ansieht
+    def __init__(self, camera, interval=ANALYTICS_INTERVAL, on_metrics=None):
+        self.camera = camera
+        self.interval = interval
+        # on_metrics(Zeitstempel in ms, {Sensor: Wert})
+        self.on_metrics = on_metrics
+        self.analyzed = 0
+        self.analyze_ms = 0.0
+        self._latest = {}
+        self._lights = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def latest(self):
+        with self._lock:
+            return dict(self._latest)
+
+    def analyze(self):
+        frame = run_blocking(self.camera.capture_array, "lores")
+        ts = storage.now_ms()
+        started = time.perf_counter()
+        metrics = run_blocking(frame_metrics, frame, self._lights)
+        self.analyze_ms = round((time.perf_counter() - started) * 1000, 2)
+        self._lights = bool(metrics[LIGHTS_SENSOR])
+        with storage.connection() as conn:
+            run_blocking(store_metrics, conn, ts, metrics)
+        with self._lock:
+            self._latest = dict(metrics, timestamp=ts)
+        self.analyzed += 1
+        if self.on_metrics:
+            self.on_metrics(ts, metrics)
+        return metrics
+
+    def _worker(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.analyze()
+            except Exception as e:
+                print(f"Fehler bei der Bildauswertung: {e}")
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def stats(self):
+        return {'interval': self.interval, 'analyzed': self.analyzed, 'analyze_ms': self.analyze_ms,
+                'latest': self.latest()}
+
+
+def photo_metrics(item):
+    # Läuft im Worker-Prozess: JPEG auf 1/4 verkleinert dekodieren, das entspricht etwa dem lores-Frame
+    import cv2
+    taken_at, path = item
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        return taken_at, None
+    return taken_at, frame_metrics(image, subsample=2)
+
+def backfill(since_ms=0, workers=None, batch_size=BACKFILL_BATCH_SIZE):
+    # Alle katalogisierten Fotos ohne Kennzahlen auswerten; mehrfach ausführbar
+    with storage.connection() as conn:
+        photos = conn.execute("SELECT taken_at, path FROM photos WHERE taken_at >= ? ORDER BY taken_at ASC",
+                              (since_ms,)).fetchall()
+        done = {row[0] for row in conn.execute(
+            "SELECT ts FROM readings WHERE sensor_id = (SELECT id FROM sensors WHERE name = ?) AND ts >= ?",
+            (LUMINANCE_SENSOR, since_ms))}
+    pending = [(taken_at, path) for taken_at, path in photos if taken_at not in done]
+    print(f"{len(pending)} von {len(photos)} Fotos auszuwerten ({workers or os.cpu_count()} Prozesse).")
+
+    processed = 0
+    batch = []
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for taken_at, metrics in pool.map(photo_metrics, pending, chunksize=16):
+            if metrics is not None:
+                batch.append((taken_at, metrics))
+            processed += 1
+            if len(batch) >= batch_size:
+                with storage.connection() as conn:
+                    for ts, values in batch:
+                        store_metrics(conn, ts, values)
+                batch.clear()
+                print(f"{processed} Fotos ausgewertet...")
+    if batch:
+        with storage.connection() as conn:
+            for ts, values in batch:
+                store_metrics(conn, ts, values)
+    elapsed = time.monotonic() - started
+    print(f"{processed} Fotos in {elapsed:.1f} s ausgewertet ({processed / elapsed if elapsed else 0:.1f} Fotos/s).")
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description="Blattfläche, Helligkeit und Licht an/aus aus vorhandenen Fotos nachtragen.")
+    parser.add_argument('photo_dir', nargs='?', help="Fotos aus diesem Verzeichnis vorher in den Katalog übernehmen")
+    parser.add_argument('--days', type=float, help="Nur Fotos der letzten N Tage")
+    parser.add_argument('--workers', type=int, help="Anzahl Prozesse (Standard: alle CPU-Kerne)")
+    parser.add_argument('--db', help="Pfad zur SQLite-Datenbank")
+    args = parser.parse_args()
+
+    if args.db:
+        storage.DB_NAME = args.db
+    if args.photo_dir:
+        added = photo_catalog.backfill(args.photo_dir, with_brightness=False)
+        print(f"{added} neue Fotos aus {args.photo_dir} in den Katalog übernommen.")
+    since_ms = storage.now_ms() - int(args.days * 24 * 60 * 60 * 1000) if args.days else 0
+    backfill(since_ms, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+# Brotli ist optional ('pip3 install brotli'), gzip gibt es immer
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_SIZE = 64
+# Auch ohne neue Messwerte verschiebt sich das Zeitfenster; spätestens dann neu berechnen
+MAX_AGE = 60.0
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+lookups_total = metrics.counter('response_cache_lookups_total', "Abfragen des Antwort-Caches", ['result'])
+
+def choose_encoding(accept_encodings):
+    # Bevorzugt Brotli (kleiner), sonst gzip, sonst unkomprimiert
+    accepted = {value for value, quality in accept_encodings if quality > 0}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+class CachedBody:
+    # Fertig serialisierte Antwort mit ETag; komprimierte Varianten entstehen einmal bei Bedarf
+    def __init__(self, body, mimetype='application/json', headers=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.created = time.monotonic()
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        if encoding is None or len(self.body) < MIN_COMPRESS_SIZE:
+            return self.body, None
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'br':
+                    self._encoded[encoding] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, GZIP_LEVEL)
+            return self._encoded[encoding], encoding
+
+
+class ResponseCache:
+    # LRU-Cache für API-Antworten. Ein Eintrag gilt, solange die Version (z.B. Zeitstempel des
+    # neuesten Messwerts) gleich ist und er nicht älter als max_age ist.
+    def __init__(self, size=CACHE_SIZE, max_age=MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or time.monotonic() - entry[1].created > self.max_age:
+                self.misses += 1
+                lookups_total.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            lookups_total.inc(result='hit')
+            return entry[1]
+
+    def put(self, key, version, body, mimetype='application/json', headers=None):
+        cached = CachedBody(body, mimetype, headers)
+        with self._lock:
+            self._entries[key] = (version, cached)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
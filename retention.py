@@ -0,0 +1,256 @@
+import argparse
+import glob
+import json
+import os
+import time
+import storage
+import timeseries
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from timelapse_jobs import FINISHED_STATES
+
+# Aufräumen nach festen Regeln, gedacht für einen täglichen Lauf (systemd-Timer, siehe bashscript):
+# alte Rohdaten und feine Verdichtungsstufen löschen, ältere Fotos ausdünnen, alte Zeitraffer
+# entfernen und die frei gewordenen Datenbankseiten per inkrementellem VACUUM zurückgeben.
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'retention.json')
+REPORT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'retention_report.json')
+DEFAULT_POLICY = {
+    # Aufbewahrung in Tagen pro Stufe (Namen wie in timeseries.TIER_NAMES), None = für immer
+    'readings': {'raw': 30, 'minute': 180, 'hour': None, 'day': None},
+    # [ab Alter in Tagen, ein Foto pro Intervall in Minuten]; bis zum ersten Alter bleiben alle
+    'photos': [[14, 60], [60, 1440]],
+    # Fertige Zeitraffer-Videos und -Aufträge, None = für immer
+    'timelapse_days': 180,
+    # Zwischengespeicherte Tages-Segmente, die so lange nicht benutzt wurden
+    'segment_days': 30,
+    # Höchstens so viele freie Seiten pro Lauf zurückgeben, None = alle
+    'vacuum_pages': None,
+}
+DAY_MS = 24 * 60 * 60 * 1000
+# Kurze Transaktionen, damit Logger und Webserver nie lange warten
+DELETE_BATCH_SIZE = 5000
+PHOTO_BATCH_SIZE = 500
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+def load_policy(path=POLICY_FILE):
+    # Einträge der Datei ersetzen die Standardwerte, 'readings' wird pro Stufe ergänzt
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if os.path.exists(path):
+        with open(path) as f:
+            custom = json.load(f)
+        policy['readings'].update(custom.pop('readings', {}))
+        policy.update(custom)
+    unknown = set(policy['readings']) - set(timeseries.TIER_NAMES)
+    if unknown:
+        raise ValueError(f"Unbekannte Stufen in der Aufbewahrung: {', '.join(sorted(unknown))}")
+    return policy
+
+def database_space(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return {
+        'pages': conn.execute("PRAGMA page_count").fetchone()[0],
+        'free_pages': conn.execute("PRAGMA freelist_count").fetchone()[0],
+        'page_size': page_size,
+    }
+
+def delete_in_batches(sql, params, batch_size=DELETE_BATCH_SIZE):
+    # sql muss höchstens batch_size Zeilen löschen; wiederholen, bis nichts mehr übrig ist
+    deleted = 0
+    while True:
+        with storage.connection() as conn:
+            count = conn.execute(sql, (*params, batch_size)).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+def prune_readings(policy, now_ms):
+    # Rollups entstehen per Trigger beim Einfügen, Löschen der Rohdaten ändert sie nicht
+    with storage.connection() as conn:
+        sensor_ids = [row[0] for row in conn.execute("SELECT id FROM sensors")]
+    deleted = {}
+    for name, table, bucket_ms in timeseries.TIERS:
+        days = policy['readings'].get(name)
+        if days is None:
+            continue
+        column = 'ts' if bucket_ms is None else 'bucket'
+        cutoff = now_ms - int(days * DAY_MS)
+        # Pro Sensor über den Primärschlüssel (sensor_id, ts), immer die ältesten Zeilen zuerst
+        sql = (f"DELETE FROM {table} WHERE sensor_id = ? AND {column} IN "
+               f"(SELECT {column} FROM {table} WHERE sensor_id = ? AND {column} < ? ORDER BY {column} LIMIT ?)")
+        deleted[name] = sum(delete_in_batches(sql, (sensor_id, sensor_id, cutoff)) for sensor_id in sensor_ids)
+    return deleted
+
+def thinning_victims(conn, start_ms, end_ms, interval_ms):
+    # Pro Intervall bleibt das hellste Foto (nachts sind alle dunkel), bei Gleichstand das früheste
+    return conn.execute('''
+        SELECT id, path, thumbnail FROM (
+            SELECT id, path, thumbnail, ROW_NUMBER() OVER (
+                PARTITION BY taken_at / ? ORDER BY brightness DESC, taken_at ASC, id ASC) AS rank
+            FROM photos WHERE taken_at >= ? AND taken_at < ?
+        ) WHERE rank > 1
+    ''', (interval_ms, start_ms, end_ms)).fetchall()
+
+def remove_file(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+def remove_thumbnails(cache, digest):
+    # Alle Größen und Formate direkt adressieren, ohne das Verzeichnis zu durchsuchen
+    if cache is None or not digest:
+        return 0
+    return sum(remove_file(cache.path(digest, size, ext))
+               for size in THUMBNAIL_SIZES for ext, mimetype, quality in THUMBNAIL_FORMATS)
+
+def thin_photos(policy, now_ms, thumbnail_dir=None):
+    # Bänder von alt nach jung: [Alter, Intervall] gilt bis zum Alter des nächsten Bands
+    bands = sorted(policy['photos'], reverse=True)
+    cache = ThumbnailCache(thumbnail_dir) if thumbnail_dir else None
+    deleted = 0
+    freed = 0
+    older_than_ms = 0
+    for days, minutes in bands:
+        start_ms = older_than_ms
+        end_ms = now_ms - int(days * DAY_MS)
+        older_than_ms = end_ms
+        with storage.connection() as conn:
+            victims = thinning_victims(conn, start_ms, end_ms, int(minutes * 60 * 1000))
+        for offset in range(0, len(victims), PHOTO_BATCH_SIZE):
+            batch = victims[offset:offset + PHOTO_BATCH_SIZE]
+            # Erst die Dateien, dann die Katalogzeilen: bricht der Lauf ab, findet der nächste die Zeilen wieder
+            for photo_id, path, digest in batch:
+                freed += remove_file(path)
+            with storage.connection() as conn:
+                shared = {row[0] for row in conn.execute(
+                    f"SELECT DISTINCT thumbnail FROM photos WHERE thumbnail IN ({','.join('?' * len(batch))}) "
+                    f"AND id NOT IN ({','.join('?' * len(batch))})",
+                    [digest for photo_id, path, digest in batch] + [photo_id for photo_id, path, digest in batch])}
+                conn.executemany("DELETE FROM photos WHERE id = ?", [(photo_id,) for photo_id, path, digest in batch])
+            # Vorschaubilder sind nach Inhalt benannt und könnten von einem gleichen Foto mitbenutzt werden
+            for photo_id, path, digest in batch:
+                if digest not in shared:
+                    freed += remove_thumbnails(cache, digest)
+            deleted += len(batch)
+    return deleted, freed
+
+def prune_timelapses(policy, now_ms, timelapse_dir):
+    deleted = 0
+    freed = 0
+    if not timelapse_dir or not os.path.isdir(timelapse_dir):
+        return deleted, freed
+    if policy['timelapse_days'] is not None:
+        cutoff_ms = now_ms - int(policy['timelapse_days'] * DAY_MS)
+        with storage.connection() as conn:
+            jobs = conn.execute(f"SELECT id, output FROM timelapse_jobs WHERE status IN ({','.join('?' * len(FINISHED_STATES))}) "
+                                "AND finished_at < ?", (*FINISHED_STATES, cutoff_ms)).fetchall()
+        for job_id, output in jobs:
+            if output:
+                freed += remove_file(os.path.join(timelapse_dir, output))
+        with storage.connection() as conn:
+            conn.executemany("DELETE FROM timelapse_jobs WHERE id = ?", [(job_id,) for job_id, output in jobs])
+        deleted += len(jobs)
+        # Videos ohne Auftrag (vor der Warteschlange erstellt) nach ihrer Änderungszeit
+        for path in glob.glob(os.path.join(timelapse_dir, '*.mp4')):
+            if os.path.getmtime(path) * 1000 < cutoff_ms:
+                freed += remove_file(path)
+                deleted += 1
+    if policy['segment_days'] is not None:
+        cutoff = now_ms / 1000 - policy['segment_days'] * DAY_MS / 1000
+        for path in glob.glob(os.path.join(timelapse_dir, '.segments', '*.mp4')):
+            if os.path.getmtime(path) < cutoff:
+                freed += remove_file(path)
+    return deleted, freed
+
+def incremental_vacuum(policy):
+    with storage.connection() as conn:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        before = database_space(conn)
+        if mode == 2:
+            pages = policy['vacuum_pages']
+            # execute() des sqlite3-Moduls gibt nur eine Seite frei, executescript() läuft bis zum Ende
+            conn.commit()
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages) if pages else 0});")
+        # WAL-Datei zurücksetzen, sonst bleibt der Platz dort belegt
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        after = database_space(conn)
+    reclaimed = (before['pages'] - after['pages']) * after['page_size']
+    return AUTO_VACUUM_MODES.get(mode, str(mode)), before, after, reclaimed
+
+def convert_vacuum():
+    # Einmalig für bestehende Datenbanken: auto_vacuum gilt erst nach einem vollen VACUUM.
+    # Braucht kurz bis zum doppelten Platz der Datenbank und sperrt Schreiber für die Dauer.
+    with storage.connection() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        started = time.monotonic()
+        conn.execute("VACUUM")
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    print(f"VACUUM in {time.monotonic() - started:.1f} s, auto_vacuum = {AUTO_VACUUM_MODES.get(mode, mode)}.")
+
+def run(policy=None, photo_dir=None, timelapse_dir=None, thumbnail_dir=None, now_ms=None):
+    policy = policy or load_policy()
+    now_ms = now_ms or storage.now_ms()
+    started = time.monotonic()
+    report = {'started_at': now_ms}
+
+    report['readings_deleted'] = prune_readings(policy, now_ms)
+    report['photos_deleted'], photo_bytes = thin_photos(policy, now_ms, thumbnail_dir)
+    report['timelapses_deleted'], timelapse_bytes = prune_timelapses(policy, now_ms, timelapse_dir)
+    report['file_bytes_freed'] = photo_bytes + timelapse_bytes
+    mode, before, after, reclaimed = incremental_vacuum(policy)
+    report['auto_vacuum'] = mode
+    report['db_bytes_before'] = before['pages'] * before['page_size']
+    report['db_bytes_after'] = after['pages'] * after['page_size']
+    report['db_bytes_reclaimed'] = reclaimed
+    report['db_free_bytes'] = after['free_pages'] * after['page_size']
+    if photo_dir and os.path.isdir(photo_dir):
+        usage = os.statvfs(photo_dir)
+        report['disk_free_bytes'] = usage.f_bavail * usage.f_frsize
+    report['duration'] = round(time.monotonic() - started, 2)
+    return report
+
+def save_report(report, path=REPORT_FILE):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def load_report(path=REPORT_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def print_report(report):
+    readings = ', '.join(f"{name}: {count}" for name, count in report['readings_deleted'].items())
+    print(f"Messwerte gelöscht ({readings}), Fotos gelöscht: {report['photos_deleted']}, "
+          f"Zeitraffer gelöscht: {report['timelapses_deleted']}, Dateien: {report['file_bytes_freed'] / 1e6:.1f} MB frei")
+    print(f"Datenbank: {report['db_bytes_before'] / 1e6:.1f} MB -> {report['db_bytes_after'] / 1e6:.1f} MB "
+          f"({report['db_bytes_reclaimed'] / 1e6:.1f} MB zurückgegeben, auto_vacuum {report['auto_vacuum']})")
+    if report['auto_vacuum'] != 'incremental' and report['db_free_bytes']:
+        print(f"Hinweis: {report['db_free_bytes'] / 1e6:.1f} MB frei in der Datenbank, aber kein inkrementelles VACUUM. "
+              f"Einmalig 'python3 retention.py --convert-vacuum' ausführen.")
+    print(f"Dauer: {report['duration']} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Alte Messwerte, Fotos und Zeitraffer nach Regeln aufräumen.")
+    parser.add_argument('--photo-dir', default="/home/pi/growbox_photos")
+    parser.add_argument('--timelapse-dir', default="/home/pi/growbox_timelapses")
+    parser.add_argument('--thumbnail-dir', default="/home/pi/growbox_thumbnails")
+    parser.add_argument('--db', help="Pfad zur SQLite-Datenbank")
+    parser.add_argument('--policy', default=POLICY_FILE, help="JSON-Datei mit eigenen Regeln")
+    parser.add_argument('--convert-vacuum', action='store_true',
+                        help="Bestehende Datenbank einmalig auf inkrementelles VACUUM umstellen")
+    args = parser.parse_args()
+
+    if args.db:
+        storage.DB_NAME = args.db
+    if args.convert_vacuum:
+        convert_vacuum()
+        return
+    report = run(load_policy(args.policy), args.photo_dir, args.timelapse_dir, args.thumbnail_dir)
+    save_report(report)
+    print_report(report)
+
+if __name__ == '__main__':
+    main()
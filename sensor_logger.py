@@ -0,0 +1,178 @@
+import argparse
+import signal
+import sqlite3
+import statistics
+import threading
+import time
+from collections import deque
+import analog_sensors
+import ds18b20
+import hal
+import storage
+
+# Schlanker Dauerprozess für die Messwert-Aufzeichnung (ersetzt den Cronjob mit log_temperature.py).
+# Lädt nur die Sensor-Treiber, NumPy und SQLite, kein Flask, OpenCV oder Kamera.
+SAMPLE_INTERVAL = 60.0
+FLUSH_INTERVAL = 300.0
+# Bei Schreibfehlern wird weiter gepuffert, aber höchstens so viele Messwerte
+MAX_BUFFER = 10000
+STATS_INTERVAL = 3600.0
+STATS_WINDOW = 1000
+
+def summarize(values):
+    # Mittel, 95-%-Quantil und Maximum in ms
+    if not values:
+        return "keine Daten"
+    ordered = sorted(values)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+    return f"mittel {statistics.fmean(ordered):.1f} ms, p95 {p95:.1f} ms, max {ordered[-1]:.1f} ms"
+
+
+class SensorLogger:
+    def __init__(self, registry, interval=SAMPLE_INTERVAL, flush_interval=FLUSH_INTERVAL,
+                 stats_interval=STATS_INTERVAL):
+        self.registry = registry
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        self.buffer = []
+        self.stored = 0
+        self.dropped = 0
+        self.missed_ticks = 0
+        # Abweichung des Messbeginns vom Zeitplan und Dauer der Schreibtransaktionen
+        self.jitter_ms = deque(maxlen=STATS_WINDOW)
+        self.read_ms = deque(maxlen=STATS_WINDOW)
+        self.write_ms = deque(maxlen=STATS_WINDOW)
+        # Messwerte kommen auch aus dem pH/EC-Thread
+        self._buffer_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self, *args):
+        self._stop.set()
+
+    def sample(self):
+        timestamp = storage.now_ms()
+        started = time.monotonic()
+        try:
+            values, errors = self.registry.read_all()
+        except ds18b20.SensorReadError as e:
+            print(f"Kein Temperaturwert gelesen: {e}")
+            return
+        self.read_ms.append((time.monotonic() - started) * 1000)
+        for sensor, error in errors.items():
+            print(f"Fehler beim Lesen von '{sensor}': {error}")
+        self.add_readings(timestamp, values)
+
+    def add_readings(self, timestamp, values):
+        with self._buffer_lock:
+            for sensor, value in values.items():
+                self.buffer.append((sensor, timestamp, value))
+            self._trim_buffer()
+
+    def _trim_buffer(self):
+        # Nur mit _buffer_lock aufrufen; verwirft die ältesten Messwerte über MAX_BUFFER
+        if len(self.buffer) > MAX_BUFFER:
+            self.dropped += len(self.buffer) - MAX_BUFFER
+            del self.buffer[:len(self.buffer) - MAX_BUFFER]
+
+    def flush(self):
+        # Alle gepufferten Messwerte in einer Transaktion schreiben
+        with self._buffer_lock:
+            batch, self.buffer = self.buffer, []
+        if not batch:
+            return True
+        started = time.monotonic()
+        try:
+            with storage.connection() as conn:
+                for sensor, timestamp, value in batch:
+                    storage.insert_reading(conn, sensor, timestamp, value)
+        except sqlite3.Error as e:
+            print(f"Fehler beim Speichern von {len(batch)} Messwerten, neuer Versuch beim nächsten Flush: {e}")
+            with self._buffer_lock:
+                # Während des Schreibversuchs können neue Werte dazugekommen sein
+                self.buffer[:0] = batch
+                self._trim_buffer()
+            return False
+        self.write_ms.append((time.monotonic() - started) * 1000)
+        self.stored += len(batch)
+        return True
+
+    def report(self):
+        print(f"Logger: {self.stored} gespeichert, {len(self.buffer)} gepuffert, {self.dropped} verworfen, "
+              f"{self.missed_ticks} Takte ausgelassen")
+        print(f"  Jitter: {summarize(self.jitter_ms)}")
+        print(f"  Sensor lesen: {summarize(self.read_ms)}")
+        print(f"  Schreiben: {summarize(self.write_ms)}")
+
+    def run(self):
+        start = time.monotonic()
+        next_sample = start
+        next_flush = start + self.flush_interval
+        next_report = start + self.stats_interval
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= next_sample:
+                    self.jitter_ms.append((now - next_sample) * 1000)
+                    self.sample()
+                    next_sample += self.interval
+                    # Hängt der Bus länger als ein Intervall, Takte auslassen statt nachzuholen
+                    now = time.monotonic()
+                    if now >= next_sample:
+                        skipped = int((now - next_sample) // self.interval) + 1
+                        self.missed_ticks += skipped
+                        next_sample += skipped * self.interval
+                if now >= next_flush:
+                    self.flush()
+                    next_flush = now + self.flush_interval
+                if now >= next_report:
+                    self.report()
+                    next_report = now + self.stats_interval
+                self._stop.wait(max(min(next_sample, next_flush, next_report) - time.monotonic(), 0))
+        finally:
+            # Beim Beenden (SIGTERM von systemd, Strg+C) nichts verlieren
+            self.flush()
+            self.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zeichnet die Temperatursensoren als Dauerprozess auf.")
+    parser.add_argument('--interval', type=float, default=SAMPLE_INTERVAL, help="Sekunden zwischen zwei Messungen")
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL,
+                        help="Sekunden zwischen zwei Schreibvorgängen in die Datenbank")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help="Sekunden zwischen zwei Berichten zu Jitter und Schreibdauer")
+    parser.add_argument('--analog-interval', type=float, default=SAMPLE_INTERVAL,
+                        help="Sekunden zwischen zwei gespeicherten pH/EC-Werten (0 = pH/EC nicht messen)")
+    parser.add_argument('--data-rate', type=int, default=analog_sensors.DATA_RATE,
+                        help="Wandlungen pro Sekunde des ADS1115 im Dauerbetrieb")
+    parser.add_argument('--db', default=storage.DB_NAME, help="Pfad zur SQLite-Datenbank")
+    parser.add_argument('--w1-dir', help="1-Wire-Geräteverzeichnis im sysfs (Standard: Auswahl über hal.py)")
+    parser.add_argument('--sensor-config', default=ds18b20.SENSOR_CONFIG, help="Namen der Sensoren (JSON)")
+    args = parser.parse_args()
+
+    storage.DB_NAME = args.db
+    ds18b20.SENSOR_CONFIG = args.sensor_config
+    if args.w1_dir:
+        registry = ds18b20.SensorRegistry(args.w1_dir, args.sensor_config)
+        registry.discover()
+    else:
+        # Echte Sensoren, Simulation nur mit GROWBOX_HAL=simulated
+        registry = hal.temperature_registry()
+    logger = SensorLogger(registry, args.interval, args.flush_interval, args.stats_interval)
+    if args.analog_interval > 0:
+        # pH/EC laufen kontinuierlich gefiltert im eigenen Thread, gespeichert wird nur im Takt von --analog-interval
+        try:
+            acquisition = analog_sensors.AnalogAcquisition(data_rate=args.data_rate, store_interval=args.analog_interval,
+                                                           on_values=logger.add_readings)
+            acquisition.start()
+        except RuntimeError as e:
+            # Ohne ADS1115 nur die Temperaturen aufzeichnen statt gar nichts
+            print(f"pH/EC werden nicht gemessen: {e}")
+    signal.signal(signal.SIGTERM, logger.stop)
+    signal.signal(signal.SIGINT, logger.stop)
+    print(f"Sensor-Logger gestartet: alle {args.interval:g} s messen, alle {args.flush_interval:g} s schreiben.")
+    logger.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import argparse
+
+# Produktiv-Start der Web-App: ein Prozess, Kamera und Hintergrunddienste genau einmal.
+# Mit gevent belegt jeder MJPEG-/SSE-Zuschauer nur ein Greenlet statt eines Threads. Kamera, cv2,
+# sqlite und 1-Wire laufen dann über cooperative.run_blocking() in echten Threads, sonst stünde der Hub;
+# ohne gevent läuft der Werkzeug-Server mit Threads, aber ohne Reloader und Debugger.
+SERVERS = ['auto', 'gevent', 'threaded']
+
+def main():
+    parser = argparse.ArgumentParser(description="Startet den Growbox-Monitor für den Dauerbetrieb.")
+    parser.add_argument('--server', choices=SERVERS, default='auto',
+                        help="gevent (empfohlen, 'pip3 install gevent') oder threaded; auto wählt gevent, falls installiert")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--photo-dir', help="Verzeichnis der Fotos")
+    parser.add_argument('--timelapse-dir', help="Verzeichnis der Zeitraffer-Videos")
+    parser.add_argument('--thumbnail-dir', help="Verzeichnis der Vorschaubilder")
+    parser.add_argument('--hls-dir', help="Verzeichnis für die H.264-Segmente, je Instanz ein eigenes (wird geleert)")
+    parser.add_argument('--db', help="Pfad zur SQLite-Datenbank")
+    parser.add_argument('--photo-interval', type=int, help="Sekunden zwischen zwei Fotos, 0 = keine Fotos (Standard 300)")
+    parser.add_argument('--analytics-interval', type=float,
+                        help="Sekunden zwischen zwei Bildauswertungen (Blattfläche, Licht), 0 = aus (Standard 60)")
+    parser.add_argument('--access-log', action='store_true', help="Jeden Request protokollieren")
+    args = parser.parse_args()
+
+    server = args.server
+    if server in ('auto', 'gevent'):
+        try:
+            # Muss vor allen anderen Imports passieren, damit Sockets, Sleeps und Locks kooperativ werden.
+            # Threads bleiben gepatcht: Stream- und SSE-Greenlets warten auf dieselben Conditions wie
+            # Kamera-Schleife und Sampler, mit echten Threads (thread=False) würde jedes Warten den Hub blockieren.
+            from gevent import monkey
+            monkey.patch_all()
+            server = 'gevent'
+        except ImportError:
+            if server == 'gevent':
+                raise
+            print("gevent ist nicht installiert, verwende den Thread-Server.")
+            server = 'threaded'
+
+    import app as growbox
+    application = growbox.create_app(args.photo_dir, args.timelapse_dir, args.thumbnail_dir, args.db,
+                                     args.photo_interval, args.analytics_interval, args.hls_dir)
+    print(f"Growbox-Monitor läuft auf http://{args.host}:{args.port} ({server}).")
+
+    if server == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        http_server = WSGIServer((args.host, args.port), application, log='default' if args.access_log else None)
+        http_server.serve_forever()
+    else:
+        import logging
+        from werkzeug.serving import run_simple
+        if not args.access_log:
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        run_simple(args.host, args.port, application, threaded=True, use_reloader=False, use_debugger=False)
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,22 @@
 import sqlite3
 import os
+import storage
 
-DB_NAME = 'growbox_data.db' # Name deiner Datenbankdatei
+DB_NAME = storage.DB_NAME # Name deiner Datenbankdatei
 
 def setup_database():
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+        conn = storage.open_connection(DB_NAME)
 
-        # Tabelle für Temperaturdaten erstellen
-        # timestamp: Speichert das Datum und die Uhrzeit der Messung (TEXT für ISO format)
-        # value: Speichert den Temperaturwert (REAL für Fließkommazahl)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS temperatures (
-                timestamp TEXT PRIMARY KEY,
-                value REAL
-            )
-        ''')
-        conn.commit()
-        print(f"Datenbank '{DB_NAME}' und Tabelle 'temperatures' erfolgreich eingerichtet.")
+        # Tabellen, Verdichtungen und Trigger über die Migrationen in storage.py anlegen
+        version = storage.migrate(conn)
+        # Daten aus der alten TEXT-Tabelle übernehmen (große Datenbanken besser mit migrate_database.py)
+        converted = storage.convert_legacy_temperatures(conn)
+        if converted:
+            print(f"{converted} Messwerte in das neue Schema übernommen.")
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        print(f"Datenbank '{DB_NAME}' eingerichtet (Schema-Version {version}, Journal-Modus {journal_mode}).")
 
     except sqlite3.Error as e:
         print(f"Fehler beim Einrichten der Datenbank: {e}")
@@ -28,4 +25,4 @@ def setup_database():
             conn.close()
 
 if __name__ == '__main__':
-    setup_database()
\ No newline at end of file
+    setup_database()
@@ -0,0 +1,341 @@
+import sqlite3
+import datetime
+import time
+import threading
+import queue
+from contextlib import contextmanager
+
+DB_NAME = 'growbox_data.db' # Name deiner Datenbankdatei
+
+# Pragmas für jede Verbindung: WAL erlaubt gleichzeitiges Lesen (Webserver) und Schreiben (Logger),
+# synchronous=NORMAL reicht im WAL-Modus und spart fsyncs auf der SD-Karte.
+# auto_vacuum wirkt nur bei neuen Datenbanken und muss vor allem anderen kommen; bestehende
+# stellt 'python3 retention.py --convert-vacuum' einmalig um (retention.py gibt freie Seiten zurück).
+PRAGMAS = [
+    ("auto_vacuum", "INCREMENTAL"),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -8000),        # ~8 MB Page-Cache pro Verbindung
+    ("mmap_size", 64 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),       # Millisekunden warten statt sofort 'database is locked'
+]
+POOL_SIZE = 4
+# sqlite3 hält pro Verbindung einen Cache vorbereiteter Statements
+STATEMENT_CACHE_SIZE = 128
+
+# Verdichtungsstufen der alten TEXT-Tabelle 'temperatures' (Schema-Version 2):
+# Tabelle -> SQL-Ausdruck für den Bucket-Beginn aus dem ISO-Zeitstempel.
+LEGACY_ROLLUP_TABLES = [
+    ('temperatures_minute', "substr({ts}, 1, 16) || ':00'"),
+    ('temperatures_hour', "substr({ts}, 1, 13) || ':00:00'"),
+    ('temperatures_day', "substr({ts}, 1, 10) || 'T00:00:00'"),
+]
+
+# Verdichtungsstufen der Tabelle 'readings' (ab Schema-Version 3): Tabelle -> Bucket-Länge in ms.
+# Tages-Buckets beginnen um Mitternacht UTC.
+ROLLUP_TABLES = [
+    ('readings_minute', 60 * 1000),
+    ('readings_hour', 60 * 60 * 1000),
+    ('readings_day', 24 * 60 * 60 * 1000),
+]
+
+# Sensorname für den bisherigen einzelnen DS18B20
+DEFAULT_SENSOR = 'temperature'
+CONVERSION_BATCH_SIZE = 5000
+
+def open_connection(db_name=None):
+    conn = sqlite3.connect(db_name or DB_NAME, timeout=5.0, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+# --- Schema-Migrationen ---
+# Jede Migration bringt die Datenbank genau eine Version weiter (PRAGMA user_version).
+
+def migration_create_temperatures(cursor):
+    # Die alte TEXT-Tabelle nur noch für Datenbanken, die schon Tabellen haben; eine neue Datei
+    # bekommt gleich 'readings', statt die Tabelle anzulegen und beim Umstellen wieder zu löschen
+    if cursor.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is None:
+        return
+    # timestamp: Speichert das Datum und die Uhrzeit der Messung (TEXT für ISO format)
+    # value: Speichert den Temperaturwert (REAL für Fließkommazahl)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS temperatures (
+            timestamp TEXT PRIMARY KEY,
+            value REAL
+        )
+    ''')
+
+def migration_create_rollups(cursor):
+    if not has_legacy_table(cursor):
+        return
+    for table, bucket_expr in LEGACY_ROLLUP_TABLES:
+        # min/max/Summe/Anzahl pro Bucket, der Mittelwert ergibt sich aus sum_value / count
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT PRIMARY KEY,
+                min_value REAL,
+                max_value REAL,
+                sum_value REAL,
+                count INTEGER
+            )
+        ''')
+
+        # Trigger hält die Verdichtung bei jedem neuen Messwert aktuell,
+        # egal welches Skript in die Tabelle 'temperatures' schreibt
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert
+            AFTER INSERT ON temperatures
+            WHEN NEW.value IS NOT NULL
+            BEGIN
+                INSERT INTO {table} (bucket, min_value, max_value, sum_value, count)
+                VALUES ({bucket_expr.format(ts='NEW.timestamp')}, NEW.value, NEW.value, NEW.value, 1)
+                ON CONFLICT(bucket) DO UPDATE SET
+                    min_value = min(min_value, excluded.min_value),
+                    max_value = max(max_value, excluded.max_value),
+                    sum_value = sum_value + excluded.sum_value,
+                    count = count + 1;
+            END
+        ''')
+
+        # Bereits vorhandene Messwerte einmalig verdichten
+        cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+        if cursor.fetchone() is None:
+            bucket = bucket_expr.format(ts='timestamp')
+            cursor.execute(f'''
+                INSERT INTO {table} (bucket, min_value, max_value, sum_value, count)
+                SELECT {bucket}, MIN(value), MAX(value), SUM(value), COUNT(value)
+                FROM temperatures
+                WHERE value IS NOT NULL
+                GROUP BY {bucket}
+            ''')
+
+def migration_create_readings(cursor):
+    # Kompaktes Schema: Sensor-ID + Epoch-Millisekunden als INTEGER-Schlüssel.
+    # WITHOUT ROWID legt die Zeilen direkt im Primärschlüssel-Baum (sensor_id, ts) ab,
+    # Bereichsabfragen pro Sensor lesen also nur zusammenhängende Seiten.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS readings (
+            sensor_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            value REAL,
+            PRIMARY KEY (sensor_id, ts)
+        ) WITHOUT ROWID
+    ''')
+
+    for table, bucket_ms in ROLLUP_TABLES:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                sensor_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                min_value REAL,
+                max_value REAL,
+                sum_value REAL,
+                count INTEGER,
+                PRIMARY KEY (sensor_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert
+            AFTER INSERT ON readings
+            WHEN NEW.value IS NOT NULL
+            BEGIN
+                INSERT INTO {table} (sensor_id, bucket, min_value, max_value, sum_value, count)
+                VALUES (NEW.sensor_id, NEW.ts - NEW.ts % {bucket_ms}, NEW.value, NEW.value, NEW.value, 1)
+                ON CONFLICT(sensor_id, bucket) DO UPDATE SET
+                    min_value = min(min_value, excluded.min_value),
+                    max_value = max(max_value, excluded.max_value),
+                    sum_value = sum_value + excluded.sum_value,
+                    count = count + 1;
+            END
+        ''')
+
+def migration_create_timelapse_jobs(cursor):
+    # Warteschlange für Zeitraffer-Aufträge, überlebt Neustarts des Webservers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS timelapse_jobs (
+            id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            started_at INTEGER,
+            finished_at INTEGER,
+            frames INTEGER,
+            progress REAL NOT NULL DEFAULT 0,
+            output TEXT NOT NULL,
+            message TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS timelapse_jobs_status ON timelapse_jobs (status, id)")
+
+def migration_add_timelapse_options(cursor):
+    # Zeitraum, Schrittweite/Zieldauer und Auflösung eines Auftrags als JSON
+    cursor.execute("ALTER TABLE timelapse_jobs ADD COLUMN options TEXT NOT NULL DEFAULT '{}'")
+
+def migration_create_photos(cursor):
+    # Katalog der Fotos, damit niemand mehr PHOTO_DIR durchsuchen muss
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS photos (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            taken_at INTEGER NOT NULL,
+            size INTEGER,
+            brightness REAL,
+            thumbnail TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS photos_taken_at ON photos (taken_at)")
+
+MIGRATIONS = [
+    migration_create_temperatures,
+    migration_create_rollups,
+    migration_create_readings,
+    migration_create_timelapse_jobs,
+    migration_add_timelapse_options,
+    migration_create_photos,
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    version = schema_version(conn)
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+            print(f"Datenbank-Migration auf Version {target} ({migration.__name__}) ausgeführt.")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+# --- Verbindungs-Pool ---
+
+class ConnectionPool:
+    def __init__(self, db_name=None, size=POOL_SIZE):
+        self.db_name = db_name or DB_NAME
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = open_connection(self.db_name)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool = ConnectionPool()
+            # Beim ersten Zugriff das Schema auf den aktuellen Stand bringen
+            with pool.connection() as conn:
+                migrate(conn)
+                if has_legacy_table(conn):
+                    if conn.execute("SELECT 1 FROM temperatures LIMIT 1").fetchone() is None:
+                        convert_legacy_temperatures(conn)
+                    else:
+                        print("Hinweis: Alte Tabelle 'temperatures' enthält noch Daten, bitte 'python3 migrate_database.py' ausführen.")
+            _pool = pool
+    return _pool
+
+def connection():
+    return get_pool().connection()
+
+# --- Messwerte ---
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def to_ms(dt):
+    # Naive datetime-Objekte (datetime.now()) werden als Ortszeit interpretiert
+    return int(dt.timestamp() * 1000)
+
+def ms_to_iso(ts):
+    return datetime.datetime.fromtimestamp(ts / 1000).isoformat(timespec='seconds')
+
+def ensure_sensor(conn, name):
+    conn.execute("INSERT OR IGNORE INTO sensors (name) VALUES (?)", (name,))
+
+def insert_reading(conn, sensor, ts, value):
+    ensure_sensor(conn, sensor)
+    conn.execute("INSERT OR IGNORE INTO readings (sensor_id, ts, value) "
+                 "VALUES ((SELECT id FROM sensors WHERE name = ?), ?, ?)", (sensor, ts, value))
+
+def latest_reading(conn, sensor):
+    # (ts, value) des neuesten Messwerts oder None; nutzt den Primärschlüssel (sensor_id, ts)
+    return conn.execute("SELECT ts, value FROM readings WHERE sensor_id = (SELECT id FROM sensors WHERE name = ?) "
+                        "ORDER BY ts DESC LIMIT 1", (sensor,)).fetchone()
+
+def insert_temperature(conn, timestamp, value):
+    # Kompatibilität: ISO-Zeitstempel des alten Schemas
+    insert_reading(conn, DEFAULT_SENSOR, to_ms(datetime.datetime.fromisoformat(timestamp)), value)
+
+# --- Umstellung der alten TEXT-Tabelle 'temperatures' auf 'readings' ---
+
+def has_legacy_table(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'temperatures'").fetchone()
+    return row is not None
+
+def convert_legacy_temperatures(conn, batch_size=CONVERSION_BATCH_SIZE):
+    # Kopiert die alten Zeilen in Batches (je eine Transaktion), damit Logger und Webserver
+    # zwischendurch weiterschreiben bzw. -lesen können. Ein Abbruch kann einfach wiederholt werden.
+    if not has_legacy_table(conn):
+        return 0
+
+    with conn:
+        ensure_sensor(conn, DEFAULT_SENSOR)
+    converted = 0
+    last_timestamp = ''
+    while True:
+        rows = conn.execute("SELECT timestamp, value FROM temperatures WHERE timestamp > ? ORDER BY timestamp ASC LIMIT ?",
+                            (last_timestamp, batch_size)).fetchall()
+        if not rows:
+            break
+        batch = [(DEFAULT_SENSOR, to_ms(datetime.datetime.fromisoformat(ts)), value) for ts, value in rows]
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO readings (sensor_id, ts, value) "
+                             "VALUES ((SELECT id FROM sensors WHERE name = ?), ?, ?)", batch)
+        converted += len(rows)
+        last_timestamp = rows[-1][0]
+        print(f"{converted} Messwerte umgestellt (bis {last_timestamp}).")
+
+    # Alte Tabelle, Verdichtungen und Trigger erst entfernen, wenn alles kopiert ist
+    with conn:
+        for table, bucket_expr in LEGACY_ROLLUP_TABLES:
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_insert")
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute("DROP TABLE temperatures")
+    return converted
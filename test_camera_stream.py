@@ -0,0 +1,63 @@
+import threading
+import hal
+from camera_stream import CameraStreamer, AdaptiveStreamSettings, STREAM_LEVELS, client_level
+from frame_broadcaster import FrameBroadcaster
+
+# Fan-out ohne Kamera: SimulatedCamera liefert die Frames, CameraStreamer kodiert sie einmal für alle Clients
+
+def start_streamer(fps=100):
+    camera = hal.SimulatedCamera(fps=fps)
+    broadcaster = FrameBroadcaster()
+    # Feste Stufe 0, damit die Anpassung an die Client-Zahl die FPS nicht drosselt
+    streamer = CameraStreamer(camera, broadcaster, AdaptiveStreamSettings(fixed_level=0))
+    thread = threading.Thread(target=streamer.run, daemon=True)
+    thread.start()
+    return streamer, broadcaster, thread
+
+def test_client_level_rises_with_clients():
+    assert [client_level(clients) for clients in (1, 2, 4, 8, 20)] == [0, 1, 2, 3, 3]
+
+def test_settings_step_down_when_encoding_is_too_slow():
+    settings = AdaptiveStreamSettings(budget=0.5)
+    settings.record_encode_time(0.1) # 0,1 s * 20 FPS = 2 CPU-Sekunden pro Sekunde
+    levels = [settings.update(1)['level'] for _ in range(len(STREAM_LEVELS))]
+    assert levels[0] == 1
+    assert levels[-1] == len(STREAM_LEVELS) - 1
+
+def test_fixed_level_ignores_clients():
+    settings = AdaptiveStreamSettings(fixed_level=0)
+    assert settings.update(20)['level'] == 0
+
+def test_streamer_fans_out_jpeg_frames():
+    streamer, broadcaster, thread = start_streamer()
+    try:
+        subscribers = [broadcaster.subscribe(f"client {i}") for i in range(4)]
+        for subscriber in subscribers:
+            frames = [subscriber.wait_frame(timeout=5) for _ in range(3)]
+            assert all(frame is not None and frame.startswith(b'\xff\xd8') for frame in frames)
+        assert broadcaster.subscriber_count() == 4
+        # Jeder Frame wird nur einmal kodiert, egal wie viele Clients zuschauen
+        assert streamer.frames_encoded == broadcaster.stats()['frame_seq']
+    finally:
+        streamer.stop()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+
+def test_streamer_pauses_without_subscribers():
+    streamer, broadcaster, thread = start_streamer()
+    try:
+        subscriber = broadcaster.subscribe()
+        assert subscriber.wait_frame(timeout=5) is not None
+        subscriber.close()
+        # Nach dem letzten Client erreicht der Streamer spätestens nach einem Leerlauf-Intervall die Pause
+        for _ in range(30):
+            if streamer.paused:
+                break
+            threading.Event().wait(0.1)
+        assert streamer.paused
+        encoded = streamer.frames_encoded
+        threading.Event().wait(0.2)
+        assert streamer.frames_encoded == encoded
+    finally:
+        streamer.stop()
+        thread.join(timeout=5)
@@ -0,0 +1,174 @@
+import json
+import os
+import time
+import pytest
+import ds18b20
+import storage
+from fake_hardware import FAKE_SENSORS, write_w1_tree
+
+# Gegen nachgebaute w1_slave-Dateien bzw. einen sysfs-Baum (fake_hardware.write_w1_tree) statt /sys/bus/w1/devices
+CRC_OK = "72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n"
+CRC_FAILED = "72 01 4b 46 7f ff 0e 10 57 : crc=57 NO\n"
+
+def test_parse_w1_slave_valid():
+    assert ds18b20.parse_w1_slave([CRC_OK, "72 01 4b 46 7f ff 0e 10 57 t=23125\n"]) == 23.12
+
+def test_parse_w1_slave_negative():
+    assert ds18b20.parse_w1_slave([CRC_OK, "5e ff 4b 46 7f ff 0e 10 57 t=-10125\n"]) == -10.12
+
+@pytest.mark.parametrize('lines', [
+    [CRC_FAILED, "72 01 4b 46 7f ff 0e 10 57 t=23125\n"],
+    [CRC_OK, "72 01 4b 46 7f ff 0e 10 57 t=85000\n"],
+    [CRC_OK, "72 01 4b 46 7f ff 0e 10 57\n"],
+    [CRC_OK, "72 01 4b 46 7f ff 0e 10 57 t=\n"],
+    [CRC_OK, "72 01 4b 46 7f ff 0e 10 57 t=23x\n"],
+    [CRC_OK],
+    [],
+])
+def test_parse_w1_slave_invalid(lines):
+    assert ds18b20.parse_w1_slave(lines) is None
+
+def test_read_temperature_retries_then_fails(tmp_path):
+    device_file = tmp_path / 'w1_slave'
+    device_file.write_text(CRC_FAILED + "72 01 4b 46 7f ff 0e 10 57 t=23125\n")
+    with pytest.raises(ds18b20.SensorReadError):
+        ds18b20.read_temperature(str(device_file), retries=2, retry_delay=0)
+
+def test_read_temperature_from_file(tmp_path):
+    device_file = tmp_path / 'w1_slave'
+    device_file.write_text(CRC_OK + "72 01 4b 46 7f ff 0e 10 57 t=21500\n")
+    assert ds18b20.read_temperature(str(device_file), retries=1, retry_delay=0) == 21.5
+
+
+@pytest.mark.parametrize('content', ["", "85000\n", "garbled\n"])
+def test_read_converted_invalid(tmp_path, content):
+    temperature_file = tmp_path / 'temperature'
+    temperature_file.write_text(content)
+    with pytest.raises(ds18b20.SensorReadError):
+        ds18b20.read_converted(str(temperature_file))
+
+def registry_for(tmp_path, sensors=FAKE_SENSORS, names=True):
+    base_dir = tmp_path / 'devices'
+    sensor_names = write_w1_tree(str(base_dir), sensors)
+    config_path = tmp_path / 'sensors.json'
+    if names:
+        config_path.write_text(json.dumps(sensor_names))
+    return ds18b20.SensorRegistry(str(base_dir), str(config_path))
+
+def test_registry_discovers_named_sensors_and_bus_master(tmp_path):
+    registry = registry_for(tmp_path)
+    assert registry.discover() == {name: device_id for device_id, (name, _) in FAKE_SENSORS.items()}
+    assert [os.path.basename(master) for master in registry.bus_masters] == ['w1_bus_master1']
+    assert registry.primary == storage.DEFAULT_SENSOR
+
+def test_registry_single_unnamed_sensor_is_default(tmp_path):
+    registry = registry_for(tmp_path, {'28-00000single': ('ignored', 20.0)}, names=False)
+    assert registry.discover() == {storage.DEFAULT_SENSOR: '28-00000single'}
+
+def test_registry_reads_all_sensors_with_bulk_conversion(tmp_path):
+    registry = registry_for(tmp_path)
+    registry.discover()
+    values, errors = registry.read_all()
+    assert errors == {}
+    for device_id, (name, celsius) in FAKE_SENSORS.items():
+        assert values[name] == pytest.approx(celsius, abs=0.5)
+
+def test_registry_falls_back_to_w1_slave_for_bad_conversion(tmp_path):
+    registry = registry_for(tmp_path)
+    registry.discover()
+    device_id = next(iter(FAKE_SENSORS))
+    name = FAKE_SENSORS[device_id][0]
+    (tmp_path / 'devices' / device_id / 'temperature').write_text("")
+    values, errors = registry.read_all()
+    assert errors == {}
+    assert values[name] == pytest.approx(FAKE_SENSORS[device_id][1], abs=0.5)
+
+def test_registry_rereads_failed_conversions_in_parallel(tmp_path, monkeypatch):
+    registry = registry_for(tmp_path)
+    registry.discover()
+    for device_id in FAKE_SENSORS:
+        (tmp_path / 'devices' / device_id / 'temperature').write_text("")
+
+    def slow_read(device_file):
+        # Wie eine echte Einzelwandlung: der Aufruf blockiert
+        time.sleep(0.3)
+        return 20.0
+
+    monkeypatch.setattr(ds18b20, 'read_temperature', slow_read)
+    started = time.monotonic()
+    values, errors = registry.read_all()
+    # Nacheinander wären es 3 * 0,3 s
+    assert time.monotonic() - started < 0.3 * len(FAKE_SENSORS)
+    assert errors == {}
+    assert len(values) == len(FAKE_SENSORS)
+
+def test_registry_reports_broken_sensor_and_keeps_others(tmp_path):
+    # Ohne Bus-Master einzeln gelesen; der defekte Sensor scheitert nach allen Wiederholungen
+    registry = registry_for(tmp_path)
+    registry.discover()
+    registry.bus_masters = []
+    device_id = next(iter(FAKE_SENSORS))
+    name = FAKE_SENSORS[device_id][0]
+    (tmp_path / 'devices' / device_id / 'w1_slave').write_text(CRC_FAILED)
+    values, errors = registry.read_all()
+    assert set(errors) == {name}
+    assert set(values) == {other for other, _ in FAKE_SENSORS.values()} - {name}
+
+def test_registry_without_sensors_raises(tmp_path):
+    (tmp_path / 'devices').mkdir()
+    registry = ds18b20.SensorRegistry(str(tmp_path / 'devices'), str(tmp_path / 'sensors.json'))
+    with pytest.raises(ds18b20.SensorReadError):
+        registry.read_all()
+
+
+class FakeRegistry:
+    # Liefert nacheinander die vorgegebenen Ergebnisse von read_all(); Exceptions werden geworfen
+    primary = 'temperature'
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def read_all(self):
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_sampler_serves_latest_value_and_reports_readings():
+    readings = []
+    sampler = ds18b20.TemperatureSampler(FakeRegistry([({'temperature': 22.5}, {})]), interval=0.05,
+                                         on_reading=lambda ts, values: readings.append(values))
+    sampler.start()
+    try:
+        assert wait_for(lambda: sampler.latest()['value'] is not None)
+    finally:
+        sampler.stop()
+    latest = sampler.latest()
+    assert latest['value'] == 22.5
+    assert latest['error'] is None
+    assert not latest['stale']
+    assert readings[0] == {'temperature': 22.5}
+
+def test_sampler_keeps_last_value_on_error_and_backs_off():
+    sampler = ds18b20.TemperatureSampler(
+        FakeRegistry([({'temperature': 22.5}, {}), ds18b20.SensorReadError("kaputt")]),
+        interval=0.05, max_backoff=0.2)
+    sampler.start()
+    try:
+        assert wait_for(lambda: sampler.errors >= 1)
+    finally:
+        sampler.stop()
+    latest = sampler.latest()
+    assert latest['value'] == 22.5
+    assert latest['error'] == "kaputt"
+
+def test_sampler_without_reading_is_stale():
+    sampler = ds18b20.TemperatureSampler(FakeRegistry([({}, {})]))
+    assert sampler.latest()['stale']
+    assert sampler.latest()['value'] is None
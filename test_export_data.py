@@ -0,0 +1,49 @@
+import io
+import numpy as np
+import pytest
+import export_data
+import storage
+import timeseries
+
+START = 1_700_000_000_000
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.open_connection(str(tmp_path / 'growbox.db'))
+    storage.migrate(conn)
+    with conn:
+        for i in range(250):
+            storage.insert_reading(conn, storage.DEFAULT_SENSOR, START + i * 1000, 20.0 + i / 8)
+    yield conn
+    conn.close()
+
+def test_iter_chunks_respects_chunk_rows_and_range(conn):
+    chunks = list(export_data.iter_chunks(conn, storage.DEFAULT_SENSOR, START + 10_000, START + 110_000, chunk_rows=40))
+    assert [len(ts) for ts, values in chunks] == [40, 40, 20]
+    assert chunks[0][0][0] == START + 10_000 and chunks[-1][0][-1] == START + 109_000
+    assert chunks[0][1].dtype == timeseries.VALUE_DTYPE
+
+def test_binary_round_trip(conn):
+    chunks = export_data.iter_chunks(conn, storage.DEFAULT_SENSOR, START, chunk_rows=100)
+    ts, values = export_data.read_binary(b''.join(export_data.binary_chunks(chunks)))
+    assert len(ts) == 250
+    assert np.array_equal(ts, START + np.arange(250) * 1000)
+    np.testing.assert_allclose(values, 20.0 + np.arange(250) / 8)
+
+def test_binary_round_trip_empty():
+    ts, values = export_data.read_binary(b''.join(export_data.binary_chunks(iter([]))))
+    assert len(ts) == 0 and len(values) == 0
+
+def test_read_binary_rejects_other_files():
+    with pytest.raises(ValueError):
+        export_data.read_binary(b'timestamp_ms,time,value\n')
+
+def test_export_csv_counts_rows(conn):
+    output = io.BytesIO()
+    assert export_data.export(conn, output, 'csv', storage.DEFAULT_SENSOR, START, START + 3000) == 3
+    assert output.getvalue().decode().splitlines() == [
+        export_data.CSV_HEADER.strip(),
+        f"{START},2023-11-14T22:13:20Z,20.000",
+        f"{START + 1000},2023-11-14T22:13:21Z,20.125",
+        f"{START + 2000},2023-11-14T22:13:22Z,20.250",
+    ]
@@ -0,0 +1,43 @@
+import threading
+from frame_broadcaster import FrameBroadcaster, RateCounter
+
+# Ein Produzent, beliebig viele Clients: jeder wartet auf eine neuere Sequenznummer
+
+def test_publish_wakes_all_subscribers():
+    broadcaster = FrameBroadcaster()
+    subscribers = [broadcaster.subscribe(f"client {i}") for i in range(3)]
+    broadcaster.publish(b'frame 1')
+    assert [subscriber.wait_frame(timeout=1) for subscriber in subscribers] == [b'frame 1'] * 3
+    # Ohne neuen Frame kommt nach dem Timeout nichts
+    assert subscribers[0].wait_frame(timeout=0.05) is None
+
+def test_slow_subscriber_gets_latest_frame():
+    broadcaster = FrameBroadcaster()
+    subscriber = broadcaster.subscribe()
+    for i in range(1, 6):
+        broadcaster.publish(f'frame {i}'.encode())
+    assert subscriber.wait_frame(timeout=1) == b'frame 5'
+    broadcaster.publish(b'frame 6')
+    broadcaster.publish(b'frame 7')
+    assert subscriber.wait_frame(timeout=1) == b'frame 7'
+    assert subscriber.dropped == 1
+
+def test_close_releases_waiting_subscribers():
+    broadcaster = FrameBroadcaster()
+    subscriber = broadcaster.subscribe()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(subscriber.wait_frame(timeout=5)))
+    waiter.start()
+    broadcaster.close()
+    waiter.join(timeout=1)
+    assert not waiter.is_alive()
+    assert result == [None]
+
+def test_rate_counter_window():
+    counter = RateCounter(window=5.0)
+    for now in (0.0, 1.0, 2.0):
+        counter.tick(now)
+    assert counter.rate(2.0) == 1.0
+    # Ältere Zeitpunkte fallen aus dem Fenster
+    assert counter.rate(10.0) == 0.0
+    assert counter.total == 3
@@ -0,0 +1,83 @@
+import datetime
+import pytest
+import photo_catalog
+import storage
+import timelapse_render
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Der Katalog arbeitet über storage.connection(), also ein eigener Pool auf einer tmp-Datenbank
+    monkeypatch.setattr(storage, 'DB_NAME', str(tmp_path / 'growbox.db'))
+    monkeypatch.setattr(storage, '_pool', None)
+    with storage.connection() as conn:
+        yield conn
+    storage.get_pool().close_all()
+
+def write_photos(directory, names):
+    directory.mkdir(exist_ok=True)
+    for name in names:
+        (directory / name).write_bytes(b'jpeg')
+
+def test_photo_taken_at_from_file_name():
+    expected = storage.to_ms(datetime.datetime(2024, 1, 2, 10, 30, 5))
+    assert photo_catalog.photo_taken_at("/photos/growbox_photo_20240102_103005.jpg") == expected
+
+def test_backfill_is_repeatable(db, tmp_path):
+    photo_dir = tmp_path / 'photos'
+    write_photos(photo_dir, ["growbox_photo_20240101_100000.jpg", "growbox_photo_20240102_100000.jpg", "notizen.txt"])
+    assert photo_catalog.backfill(str(photo_dir), with_brightness=False, batch_size=1) == 2
+    write_photos(photo_dir, ["growbox_photo_20240103_100000.jpg"])
+    assert photo_catalog.backfill(str(photo_dir), with_brightness=False) == 1
+    assert db.execute("SELECT COUNT(*), SUM(size) FROM photos").fetchone() == (3, 12)
+
+def test_photo_files_range(db, tmp_path):
+    photo_dir = tmp_path / 'photos'
+    write_photos(photo_dir, [f"growbox_photo_2024010{day}_100000.jpg" for day in range(1, 5)])
+    photo_catalog.backfill(str(photo_dir), with_brightness=False)
+    start = storage.to_ms(datetime.datetime(2024, 1, 2))
+    end = storage.to_ms(datetime.datetime(2024, 1, 3, 23, 59, 59))
+    files = photo_catalog.photo_files(db, start, end)
+    assert [path.rsplit('/', 1)[1] for path, size in files] == \
+        ["growbox_photo_20240102_100000.jpg", "growbox_photo_20240103_100000.jpg"]
+    assert all(size == 4 for path, size in files)
+
+def test_select_photos_prefers_catalog(db, tmp_path):
+    photo_dir = tmp_path / 'photos'
+    write_photos(photo_dir, ["growbox_photo_20240101_100000.jpg", "growbox_photo_20240102_100000.jpg"])
+    options = timelapse_render.parse_options({'start': '2024-01-02'})
+    # Leerer Katalog: Verzeichnis-Scan ohne Größen
+    assert [size for path, size in timelapse_render.select_photos(str(photo_dir), options)] == [None]
+    photo_catalog.backfill(str(photo_dir), with_brightness=False)
+    assert [size for path, size in timelapse_render.select_photos(str(photo_dir), options)] == [4]
+
+def add_photos(conn, taken_ats):
+    for i, taken_at in enumerate(taken_ats):
+        photo_catalog.add_photo(conn, f"/photos/photo_{i}.jpg", taken_at=taken_at, size=4)
+    conn.commit()
+
+def test_photo_page_keyset_walks_all_photos_once(db):
+    # Gleiche Aufnahmezeiten: die id entscheidet, keine Seite überspringt oder wiederholt ein Foto
+    add_photos(db, [1000, 2000, 2000, 2000, 3000, 4000, 4000])
+    seen = []
+    before = None
+    while True:
+        page = photo_catalog.photo_page(db, 3, before)
+        if not page:
+            break
+        seen += [(photo['taken_at'], photo['id']) for photo in page]
+        before = (page[-1]['taken_at'], page[-1]['id'])
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen)) == 7
+
+def test_photos_api_cursor(db, monkeypatch):
+    import app
+    monkeypatch.setattr(app, '_services_started', True)
+    add_photos(db, [1000, 2000, 3000])
+    client = app.app.test_client()
+    first = client.get('/api/photos?limit=2').get_json()
+    assert [photo['taken_at'] for photo in first['photos']] == [3000, 2000]
+    assert first['next_cursor'] == f"2000:{first['photos'][-1]['id']}"
+    second = client.get(f"/api/photos?limit=2&cursor={first['next_cursor']}").get_json()
+    assert [photo['taken_at'] for photo in second['photos']] == [1000]
+    assert second['next_cursor'] is None
+    assert client.get('/api/photos?cursor=kaputt').status_code == 400
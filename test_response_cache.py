@@ -0,0 +1,77 @@
+import gzip
+import pytest
+import response_cache
+import storage
+
+BODY = b'{"labels":[],"values":[]}' * 100
+
+def test_get_hits_only_same_version():
+    cache = response_cache.ResponseCache()
+    cached = cache.put('24h', 1000, BODY)
+    assert cache.get('24h', 1000) is cached
+    assert cache.get('24h', 2000) is None
+    assert cache.get('48h', 1000) is None
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'misses': 2}
+
+def test_entries_expire_after_max_age(monkeypatch):
+    cache = response_cache.ResponseCache(max_age=60.0)
+    cached = cache.put('24h', 1000, BODY)
+    monkeypatch.setattr(cached, 'created', cached.created - 61.0)
+    assert cache.get('24h', 1000) is None
+
+def test_least_recently_used_entry_is_evicted():
+    cache = response_cache.ResponseCache(size=2)
+    cache.put('a', 1, b'a')
+    cache.put('b', 1, b'b')
+    cache.get('a', 1)
+    cache.put('c', 1, b'c')
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) is not None and cache.get('c', 1) is not None
+
+def test_etag_follows_body():
+    assert response_cache.CachedBody(BODY).etag == response_cache.CachedBody(BODY).etag
+    assert response_cache.CachedBody(BODY).etag != response_cache.CachedBody(BODY + b' ').etag
+
+def test_encoded_compresses_once_and_skips_small_bodies():
+    cached = response_cache.CachedBody(BODY)
+    body, encoding = cached.encoded('gzip')
+    assert encoding == 'gzip' and gzip.decompress(body) == BODY
+    assert cached.encoded('gzip')[0] is body
+    assert response_cache.CachedBody(b'{}').encoded('gzip') == (b'{}', None)
+
+def test_choose_encoding():
+    assert response_cache.choose_encoding([('gzip', 1), ('deflate', 1)]) == 'gzip'
+    assert response_cache.choose_encoding([('gzip', 0)]) is None
+    assert response_cache.choose_encoding([]) is None
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Nur die Flask-App gegen eine eigene Datenbank, ohne Kamera- und Sensor-Dienste
+    import app
+    monkeypatch.setattr(storage, 'DB_NAME', str(tmp_path / 'growbox.db'))
+    monkeypatch.setattr(storage, '_pool', None)
+    monkeypatch.setattr(app, '_services_started', True)
+    app.temperature_cache.clear()
+    with storage.connection() as conn:
+        now = storage.now_ms()
+        for i in range(100):
+            storage.insert_reading(conn, storage.DEFAULT_SENSOR, now - i * 60000, 20.0 + i % 5)
+    yield app.app.test_client()
+    storage.get_pool().close_all()
+
+def test_temperature_data_etag_and_304(client):
+    first = client.get('/api/temperature_data?hours=24', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+    second = client.get('/api/temperature_data?hours=24', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    # Ein neuer Messwert ergibt eine neue Antwort mit neuem ETag
+    with storage.connection() as conn:
+        storage.insert_reading(conn, storage.DEFAULT_SENSOR, storage.now_ms() + 1000, 30.0)
+    third = client.get('/api/temperature_data?hours=24', headers={'If-None-Match': etag})
+    assert third.status_code == 200
+    assert third.headers['ETag'] != etag
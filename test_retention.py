@@ -0,0 +1,57 @@
+import os
+import pytest
+import photo_catalog
+import retention
+import storage
+
+HOUR = 60 * 60 * 1000
+NOW = 1_700_000_000_000 - 1_700_000_000_000 % retention.DAY_MS
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # retention.py arbeitet über storage.connection(), also ein eigener Pool auf einer tmp-Datenbank
+    monkeypatch.setattr(storage, 'DB_NAME', str(tmp_path / 'growbox.db'))
+    monkeypatch.setattr(storage, '_pool', None)
+    with storage.connection() as conn:
+        yield conn
+    storage.get_pool().close_all()
+
+def add_photo(conn, tmp_path, taken_at, brightness):
+    path = tmp_path / f"photo_{taken_at}.jpg"
+    path.write_bytes(b'jpeg')
+    photo_catalog.add_photo(conn, str(path), taken_at=taken_at, brightness=brightness)
+    return str(path)
+
+def test_thinning_keeps_brightest_photo_per_interval(db, tmp_path):
+    # Zwei Stunden mit je drei Fotos; pro Stunde bleibt das hellste, bei Gleichstand das früheste
+    brightness = [10.0, 80.0, 30.0, 50.0, 50.0, 5.0]
+    paths = [add_photo(db, tmp_path, NOW + i * 20 * 60 * 1000, value) for i, value in enumerate(brightness)]
+    db.commit()
+    victims = retention.thinning_victims(db, NOW, NOW + 2 * HOUR, HOUR)
+    assert sorted(path for photo_id, path, digest in victims) == sorted([paths[0], paths[2], paths[4], paths[5]])
+    # Außerhalb des Bands bleibt alles
+    assert retention.thinning_victims(db, NOW + 2 * HOUR, NOW + 3 * HOUR, HOUR) == []
+
+def test_thin_photos_deletes_files_and_rows(db, tmp_path):
+    old = NOW - 20 * retention.DAY_MS
+    dark = add_photo(db, tmp_path, old, 1.0)
+    bright = add_photo(db, tmp_path, old + 60 * 1000, 90.0)
+    recent = add_photo(db, tmp_path, NOW - retention.DAY_MS, 1.0)
+    db.commit()
+    deleted, freed = retention.thin_photos({'photos': [[14, 60]]}, NOW)
+    assert (deleted, freed) == (1, 4)
+    assert not os.path.exists(dark) and os.path.exists(bright)
+    assert [row[0] for row in db.execute("SELECT path FROM photos ORDER BY taken_at")] == [bright, recent]
+
+def test_prune_readings_per_tier(db):
+    for sensor in ('temperature', 'ph'):
+        for hour in range(72):
+            storage.insert_reading(db, sensor, NOW - hour * HOUR, 20.0)
+    db.commit()
+    deleted = retention.prune_readings({'readings': {'raw': 1, 'minute': 2, 'hour': None}}, NOW)
+    # Älter als ein Tag: 47 Rohwerte pro Sensor; Minuten-Buckets älter als zwei Tage: 23 pro Sensor
+    assert deleted == {'raw': 94, 'minute': 46}
+    assert db.execute("SELECT MIN(ts) FROM readings").fetchone()[0] == NOW - 24 * HOUR
+    assert db.execute("SELECT MIN(bucket) FROM readings_minute").fetchone()[0] == NOW - 48 * HOUR
+    # Die Stunden-Stufe bleibt ganz, das Löschen der Rohdaten ändert die Rollups nicht
+    assert db.execute("SELECT COUNT(*) FROM readings_hour").fetchone()[0] == 144
@@ -0,0 +1,89 @@
+import datetime
+import sqlite3
+import pytest
+import storage
+
+# Schema-Migrationen und Verbindungs-Pool gegen Datenbanken im tmp-Verzeichnis
+
+def table_names(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def test_migrate_fresh_database(tmp_path):
+    conn = storage.open_connection(str(tmp_path / 'growbox.db'))
+    assert storage.migrate(conn) == len(storage.MIGRATIONS)
+    tables = table_names(conn)
+    assert {'sensors', 'readings', 'timelapse_jobs', 'photos'} <= tables
+    assert {table for table, bucket_ms in storage.ROLLUP_TABLES} <= tables
+    # Eine neue Datei bekommt die alte TEXT-Tabelle gar nicht erst
+    assert not storage.has_legacy_table(conn)
+    assert not {table for table, bucket_expr in storage.LEGACY_ROLLUP_TABLES} & tables
+    # Ein zweiter Lauf ändert nichts mehr
+    assert storage.migrate(conn) == len(storage.MIGRATIONS)
+    conn.close()
+
+def test_open_connection_pragmas(tmp_path):
+    conn = storage.open_connection(str(tmp_path / 'growbox.db'))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    conn.close()
+
+def test_pool_reuses_connections(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / 'growbox.db'), size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    pool.close_all()
+
+def test_pool_commits_and_rolls_back(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / 'growbox.db'))
+    with pool.connection() as conn:
+        storage.migrate(conn)
+        storage.insert_reading(conn, 'temperature', 1000, 20.0)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            storage.insert_reading(conn, 'temperature', 2000, 21.0)
+            raise RuntimeError("Abbruch")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT ts FROM readings").fetchall() == [(1000,)]
+    pool.close_all()
+
+def test_pool_closes_surplus_connections(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / 'growbox.db'), size=1)
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is not outer
+    # Nur die zuerst zurückgegebene Verbindung passt in den Pool, die andere ist geschlossen
+    with pool.connection() as conn:
+        assert conn is inner
+    with pytest.raises(sqlite3.ProgrammingError):
+        outer.execute("SELECT 1")
+    pool.close_all()
+
+def legacy_database(path, rows):
+    # Stand vor den Migrationen: nur die TEXT-Tabelle, user_version 0
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE temperatures (timestamp TEXT PRIMARY KEY, value REAL)")
+    conn.executemany("INSERT INTO temperatures VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def test_convert_legacy_temperatures(tmp_path):
+    path = str(tmp_path / 'growbox.db')
+    rows = [(f"2024-01-01T10:{minute:02d}:00", 20.0 + minute) for minute in range(7)]
+    legacy_database(path, rows)
+    conn = storage.open_connection(path)
+    storage.migrate(conn)
+    # Die alten Verdichtungen wurden beim Migrieren aus den vorhandenen Zeilen gefüllt
+    assert conn.execute("SELECT count FROM temperatures_hour").fetchall() == [(7,)]
+
+    assert storage.convert_legacy_temperatures(conn, batch_size=3) == 7
+    expected = [(storage.to_ms(datetime.datetime.fromisoformat(ts)), value) for ts, value in rows]
+    assert conn.execute("SELECT ts, value FROM readings ORDER BY ts").fetchall() == expected
+    assert conn.execute("SELECT min_value, max_value, count FROM readings_hour").fetchall() == [(20.0, 26.0, 7)]
+    tables = table_names(conn)
+    assert 'temperatures' not in tables
+    assert not {table for table, bucket_expr in storage.LEGACY_ROLLUP_TABLES} & tables
+    # Ohne alte Tabelle ist die Umstellung ein No-op
+    assert storage.convert_legacy_temperatures(conn) == 0
+    conn.close()
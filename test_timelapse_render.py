@@ -0,0 +1,74 @@
+import datetime
+import os
+import pytest
+import timelapse_render
+
+DAY = [("/photos/growbox_photo_20240101_100000.jpg", 1000), ("/photos/growbox_photo_20240101_110000.jpg", 1200)]
+
+def test_segment_key_is_stable_and_ignores_directory():
+    moved = [(path.replace('/photos/', '/backup/'), size) for path, size in DAY]
+    assert timelapse_render.segment_key(DAY) == timelapse_render.segment_key(list(DAY))
+    assert timelapse_render.segment_key(DAY) == timelapse_render.segment_key(moved)
+
+def test_segment_key_changes_with_photos_size_and_width():
+    key = timelapse_render.segment_key(DAY)
+    assert timelapse_render.segment_key(DAY[:1]) != key
+    assert timelapse_render.segment_key([DAY[0], (DAY[1][0], 1201)]) != key
+    assert timelapse_render.segment_key(DAY, width=1280) != key
+
+def test_segment_key_reads_size_only_when_missing(tmp_path):
+    photo = tmp_path / "growbox_photo_20240101_100000.jpg"
+    photo.write_bytes(b'x' * 1000)
+    assert timelapse_render.segment_key([(str(photo), None)]) == timelapse_render.segment_key([(str(photo), 1000)])
+
+def test_group_by_day():
+    photos = DAY + [("/photos/growbox_photo_20240102_080000.jpg", 900)]
+    assert [(day, len(group)) for day, group in timelapse_render.group_by_day(photos)] == [('20240101', 2), ('20240102', 1)]
+
+def test_parse_options_defaults():
+    assert timelapse_render.parse_options({}) == {'start': None, 'end': None, 'stride': 1, 'duration': None, 'width': None}
+
+def test_parse_options_range_and_numbers():
+    now = datetime.datetime(2024, 1, 10, 12, 0, 0)
+    options = timelapse_render.parse_options({'days': '2', 'end': '2024-01-09', 'stride': '3', 'width': '1280'}, now=now)
+    assert options['start'] == '2024-01-08T12:00:00'
+    # Ein reines Datum als Ende meint das Tagesende
+    assert options['end'] == '2024-01-09T23:59:59'
+    assert (options['stride'], options['width']) == (3, 1280)
+
+@pytest.mark.parametrize('values', [
+    {'days': '0'},
+    {'start': '2024-01-09', 'end': '2024-01-08'},
+    {'start': 'gestern'},
+    {'stride': '0'},
+    {'stride': '1.5'},
+    {'duration': '-1'},
+    {'width': '1281'},
+    {'width': str(timelapse_render.MAX_WIDTH + 2)},
+])
+def test_parse_options_rejects(values):
+    with pytest.raises(ValueError):
+        timelapse_render.parse_options(values)
+
+@pytest.mark.parametrize('frame_count, options, stride', [
+    (1000, {}, 1),
+    (1000, {'stride': 4}, 4),
+    # 1000 Frames in 10 s bei FRAMERATE 10: jedes zehnte
+    (1000, {'duration': 10}, 10),
+    (1001, {'duration': 10}, 11),
+    (1000, {'stride': 20, 'duration': 10}, 20),
+    (50, {'duration': 10}, 1),
+])
+def test_effective_stride(frame_count, options, stride):
+    assert timelapse_render.FRAMERATE == 10
+    assert timelapse_render.effective_stride(frame_count, options) == stride
+
+def test_scan_photos_filters_by_file_name(tmp_path):
+    for name in ["growbox_photo_20240101_100000.jpg", "growbox_photo_20240102_100000.jpg",
+                 "growbox_photo_20240103_100000.jpg", "anderes.jpg", "notizen.txt"]:
+        (tmp_path / name).write_bytes(b'jpeg')
+    options = timelapse_render.parse_options({'start': '2024-01-02', 'end': '2024-01-03T09:00'})
+    assert [os.path.basename(path) for path, size in timelapse_render.scan_photos(str(tmp_path), options)] == \
+        ["growbox_photo_20240102_100000.jpg"]
+    # Ohne Zeitraum auch Fotos ohne Zeitstempel im Namen
+    assert len(timelapse_render.scan_photos(str(tmp_path), timelapse_render.parse_options({}))) == 4
@@ -0,0 +1,76 @@
+import math
+import pytest
+import storage
+import timeseries
+
+# Gegen eine frische Datenbank im tmp-Verzeichnis, Schema über storage.migrate
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+NOW = 1_700_000_000_000 - 1_700_000_000_000 % HOUR
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.open_connection(str(tmp_path / 'growbox.db'))
+    storage.migrate(conn)
+    yield conn
+    conn.close()
+
+def insert_points(conn, timestamps, sensor=storage.DEFAULT_SENSOR, value=lambda ts: 20.0):
+    with conn:
+        for ts in timestamps:
+            storage.insert_reading(conn, sensor, ts, value(ts))
+
+def test_lttb_keeps_endpoints_and_threshold():
+    xs = list(range(1000))
+    ys = [math.sin(x / 20) for x in xs]
+    indices = timeseries.lttb_indices(xs, ys, 50)
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert indices == sorted(set(indices))
+
+def test_lttb_keeps_peak():
+    xs = list(range(100))
+    ys = [0.0] * 100
+    ys[37] = 10.0
+    assert 37 in timeseries.lttb_indices(xs, ys, 10)
+
+@pytest.mark.parametrize('threshold', [2, 100, 200])
+def test_lttb_returns_everything_below_three_or_above_length(threshold):
+    assert timeseries.lttb_indices(list(range(100)), [0.0] * 100, threshold) == list(range(100))
+
+def test_rollup_triggers_aggregate_per_bucket(conn):
+    insert_points(conn, [NOW, NOW + 20_000, NOW + MINUTE], value=lambda ts: 20.0 + ts % MINUTE / 10_000)
+    rows = conn.execute("SELECT bucket, min_value, max_value, sum_value, count FROM readings_minute "
+                        "ORDER BY bucket").fetchall()
+    assert rows == [(NOW, 20.0, 22.0, 42.0, 2), (NOW + MINUTE, 20.0, 20.0, 20.0, 1)]
+    assert conn.execute("SELECT bucket, count FROM readings_hour").fetchall() == [(NOW, 3)]
+
+def test_count_raw_points_stops_at_limit(conn):
+    insert_points(conn, [NOW + i * 1000 for i in range(50)])
+    cursor = conn.cursor()
+    assert timeseries.count_raw_points(cursor, storage.DEFAULT_SENSOR, NOW, 10) == 10
+    assert timeseries.count_raw_points(cursor, storage.DEFAULT_SENSOR, NOW + 45_000, 10) == 5
+
+def test_choose_tier_prefers_raw_when_it_fits(conn):
+    insert_points(conn, [NOW + i * MINUTE for i in range(60)])
+    assert timeseries.choose_tier(conn.cursor(), storage.DEFAULT_SENSOR, NOW, HOUR, 100) == 'raw'
+
+def test_choose_tier_escalates_when_raw_is_too_dense(conn):
+    # 3000 Rohwerte in 50 Minuten, Budget 100 * TIER_HEADROOM: Minuten-Buckets reichen
+    insert_points(conn, [NOW + i * 1000 for i in range(3000)])
+    cursor = conn.cursor()
+    assert timeseries.choose_tier(cursor, storage.DEFAULT_SENSOR, NOW, 50 * MINUTE, 100) == 'minute'
+    # Ein Jahr Zeitraum passt erst in Tages-Buckets
+    assert timeseries.choose_tier(cursor, storage.DEFAULT_SENSOR, NOW, 365 * 24 * HOUR, 100) == 'day'
+
+def test_tier_covers_after_retention(conn):
+    insert_points(conn, [NOW + i * MINUTE for i in range(180)])
+    cursor = conn.cursor()
+    assert timeseries.tier_covers(cursor, storage.DEFAULT_SENSOR, 'raw', NOW)
+    # Rohdaten der ersten zwei Stunden aufgeräumt, die Minuten-Buckets reichen weiter zurück
+    with conn:
+        conn.execute("DELETE FROM readings WHERE ts < ?", (NOW + 2 * HOUR,))
+    assert not timeseries.tier_covers(cursor, storage.DEFAULT_SENSOR, 'raw', NOW)
+    assert timeseries.tier_covers(cursor, storage.DEFAULT_SENSOR, 'raw', NOW + 2 * HOUR)
+    assert timeseries.choose_tier(cursor, storage.DEFAULT_SENSOR, NOW, 3 * HOUR, 500) == 'minute'
+    assert timeseries.tier_covers(cursor, storage.DEFAULT_SENSOR, 'day', NOW)
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import threading
+import storage
+from cooperative import run_blocking
+
+# Vorschaugrößen (Breite in Pixeln); das Original ist 1280x720
+THUMBNAIL_SIZES = {
+    'small': 160,
+    'medium': 640,
+}
+# Formate in Reihenfolge der Bevorzugung: (Endung, MIME-Typ, Qualität)
+THUMBNAIL_FORMATS = [
+    ('webp', 'image/webp', 75),
+    ('jpg', 'image/jpeg', 80),
+]
+# Diese Formate erzeugt der Hintergrund-Thread vorab, andere entstehen bei der ersten Anfrage
+PREGENERATED_FORMATS = ['jpg']
+BATCH_SIZE = 50
+IDLE_INTERVAL = 60.0
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def format_info(extension):
+    for ext, mimetype, quality in THUMBNAIL_FORMATS:
+        if ext == extension:
+            return ext, mimetype, quality
+    raise ValueError(f"Unbekanntes Vorschauformat '{extension}'")
+
+def best_format(accept_mimetypes):
+    # WebP nur an Browser, die es ausdrücklich nennen ('*/*' zählt nicht)
+    accepted = {value for value, quality in accept_mimetypes if quality > 0}
+    for ext, mimetype, quality in THUMBNAIL_FORMATS:
+        if mimetype in accepted:
+            return ext
+    return 'jpg'
+
+def encode_params(extension, quality):
+    import cv2
+    flag = cv2.IMWRITE_WEBP_QUALITY if extension == 'webp' else cv2.IMWRITE_JPEG_QUALITY
+    return [flag, quality]
+
+def decode_for_width(path, width):
+    import cv2 # OpenCV erst beim ersten Vorschaubild laden, nicht beim Start der App
+    # JPEG direkt verkleinert dekodieren (1/2, 1/4, 1/8), das spart den Großteil der Arbeit
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR)):
+        image = cv2.imread(path, flag)
+        if image is None:
+            return None
+        if image.shape[1] >= width or factor == 1:
+            break
+    if image.shape[1] > width:
+        height = round(image.shape[0] * width / image.shape[1])
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    return image
+
+
+class ThumbnailCache:
+    # Inhaltsadressierter Cache: <thumbnail_dir>/<hash[:2]>/<hash>_<Größe>.<Format>.
+    # Der Hash steht in photos.thumbnail und dient zugleich als ETag.
+    def __init__(self, thumbnail_dir):
+        self.thumbnail_dir = thumbnail_dir
+        os.makedirs(thumbnail_dir, exist_ok=True)
+
+    def path(self, digest, size, extension):
+        return os.path.join(self.thumbnail_dir, digest[:2], f"{digest}_{size}.{extension}")
+
+    def create(self, photo_path, digest, extensions):
+        import cv2
+        image = None
+        for size, width in THUMBNAIL_SIZES.items():
+            targets = [ext for ext in extensions if not os.path.exists(self.path(digest, size, ext))]
+            if not targets:
+                continue
+            # Vom Original nur so weit dekodieren wie für diese Größe nötig
+            image = decode_for_width(photo_path, width)
+            if image is None:
+                raise OSError(f"Foto {photo_path} konnte nicht gelesen werden")
+            for ext in targets:
+                ext, mimetype, quality = format_info(ext)
+                ret, encoded = cv2.imencode(f'.{ext}', image, encode_params(ext, quality))
+                if not ret:
+                    continue
+                target = self.path(digest, size, ext)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # Erst temporär schreiben, damit nie halbe Dateien ausgeliefert werden
+                with open(target + '.tmp', 'wb') as f:
+                    f.write(encoded.tobytes())
+                os.replace(target + '.tmp', target)
+
+    def ensure(self, photo_id, photo_path, digest, size, extension):
+        # Liefert den Pfad der Vorschau und erzeugt sie bei Bedarf sofort
+        if digest is None:
+            digest = run_blocking(content_hash, photo_path)
+            with storage.connection() as conn:
+                conn.execute("UPDATE photos SET thumbnail = ? WHERE id = ?", (digest, photo_id))
+        target = self.path(digest, size, extension)
+        if not os.path.exists(target):
+            run_blocking(self.create, photo_path, digest, [extension])
+        return target, digest
+
+
+class Thumbnailer:
+    # Hintergrund-Thread, der für alle katalogisierten Fotos ohne Vorschau die Varianten erzeugt.
+    # Neueste Fotos zuerst, damit die Galerie oben sofort vollständig ist.
+    def __init__(self, cache):
+        self.cache = cache
+        self.created = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _pending(self):
+        with storage.connection() as conn:
+            return conn.execute("SELECT id, path FROM photos WHERE thumbnail IS NULL ORDER BY taken_at DESC LIMIT ?",
+                                (BATCH_SIZE,)).fetchall()
+
+    def _worker(self):
+        while True:
+            try:
+                pending = self._pending()
+            except Exception as e:
+                print(f"Fehler im Thumbnailer: {e}")
+                pending = []
+            if not pending:
+                self._wakeup.wait(IDLE_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            for photo_id, photo_path in pending:
+                try:
+                    digest = run_blocking(content_hash, photo_path)
+                    run_blocking(self.cache.create, photo_path, digest, PREGENERATED_FORMATS)
+                    self.created += 1
+                except OSError as e:
+                    # Fehlende oder defekte Datei: leerer Hash, damit sie nicht endlos erneut versucht wird
+                    print(f"Keine Vorschau für {photo_path}: {e}")
+                    digest = ''
+                with storage.connection() as conn:
+                    conn.execute("UPDATE photos SET thumbnail = ? WHERE id = ?", (digest, photo_id))
@@ -0,0 +1,173 @@
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import metrics
+import storage
+from cooperative import run_blocking
+from timelapse_render import JobCancelled, SegmentCache, render_timelapse, select_photos
+
+# Zustände eines Zeitraffer-Auftrags
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+job_seconds = metrics.histogram('timelapse_job_seconds', "Gesamtdauer eines Zeitraffer-Auftrags")
+jobs_total = metrics.counter('timelapse_jobs_total', "Abgeschlossene Zeitraffer-Aufträge", ['status'])
+
+JOB_COLUMNS = ['id', 'status', 'created_at', 'started_at', 'finished_at', 'frames', 'progress', 'output', 'message', 'options']
+
+def job_from_row(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job['progress'] = round(job['progress'], 3)
+    job['options'] = json.loads(job['options'])
+    return job
+
+
+class TimelapseJobRunner:
+    # Ein Hintergrund-Thread arbeitet die Aufträge aus der Tabelle 'timelapse_jobs' nacheinander ab.
+    # Jeder Auftrag bekommt ein eigenes Arbeitsverzeichnis, sodass sich Aufträge nicht stören.
+    def __init__(self, photo_dir, timelapse_dir):
+        self.photo_dir = photo_dir
+        self.timelapse_dir = timelapse_dir
+        self.work_dir = os.path.join(timelapse_dir, '.work')
+        self.segment_cache = SegmentCache(os.path.join(timelapse_dir, '.segments'))
+        self._wakeup = threading.Event()
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        with storage.connection() as conn:
+            # Aufträge, die beim letzten Beenden noch liefen, neu einreihen
+            conn.execute("UPDATE timelapse_jobs SET status = ?, progress = 0 WHERE status = ?", (QUEUED, RUNNING))
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def submit(self, options=None):
+        # options: Ergebnis von timelapse_render.parse_options (Zeitraum, Schrittweite, Auflösung)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        with storage.connection() as conn:
+            cursor = conn.execute("INSERT INTO timelapse_jobs (status, created_at, output, options) VALUES (?, ?, '', ?)",
+                                  (QUEUED, storage.now_ms(), json.dumps(options or {})))
+            job_id = cursor.lastrowid
+            # Auftragsnummer im Dateinamen, damit gleichzeitige Aufträge sich nicht überschreiben
+            conn.execute("UPDATE timelapse_jobs SET output = ? WHERE id = ?", (f"timelapse_{timestamp}_{job_id}.mp4", job_id))
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with storage.connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM timelapse_jobs WHERE id = ?", (job_id,)).fetchone()
+        return job_from_row(row) if row else None
+
+    def list(self, limit=20):
+        with storage.connection() as conn:
+            rows = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM timelapse_jobs ORDER BY id DESC LIMIT ?",
+                                (limit,)).fetchall()
+        return [job_from_row(row) for row in rows]
+
+    def cancel(self, job_id):
+        with storage.connection() as conn:
+            cursor = conn.execute("UPDATE timelapse_jobs SET status = ?, finished_at = ?, message = ? WHERE id = ? AND status = ?",
+                                  (CANCELLED, storage.now_ms(), "Abgebrochen, bevor der Auftrag gestartet wurde.", job_id, QUEUED))
+            if cursor.rowcount:
+                return True
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        return True
+
+    def _update(self, job_id, **fields):
+        if fields.get('status') in FINISHED_STATES:
+            jobs_total.inc(status=fields['status'])
+        assignments = ', '.join(f"{key} = ?" for key in fields)
+        with storage.connection() as conn:
+            conn.execute(f"UPDATE timelapse_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _next_job(self):
+        while True:
+            with storage.connection() as conn:
+                row = conn.execute("SELECT id, output, options FROM timelapse_jobs WHERE status = ? ORDER BY id ASC LIMIT 1",
+                                   (QUEUED,)).fetchone()
+            if row is None:
+                return None, None
+
+            # Abbruch-Event vor dem Statuswechsel anlegen, damit cancel() den Auftrag nie verpasst
+            cancel_event = threading.Event()
+            with self._lock:
+                self._cancel_events[row[0]] = cancel_event
+            with storage.connection() as conn:
+                cursor = conn.execute("UPDATE timelapse_jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                                      (RUNNING, storage.now_ms(), row[0], QUEUED))
+                started = cursor.rowcount == 1
+            if started:
+                return row, cancel_event
+            with self._lock:
+                self._cancel_events.pop(row[0], None)
+
+    def _worker(self):
+        while True:
+            job, cancel_event = self._next_job()
+            if job is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            started = time.monotonic()
+            self._run_job(*job, cancel_event)
+            job_seconds.observe(time.monotonic() - started)
+
+    def _run_job(self, job_id, output_name, options_json, cancel_event):
+        options = json.loads(options_json)
+        job_dir = os.path.join(self.work_dir, f"job_{job_id}")
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(job_dir)
+
+        try:
+            # Vorab prüfen: ein FileNotFoundError später kann genauso ein gelöschtes Foto oder Segment sein
+            if shutil.which('ffmpeg') is None:
+                self._update(job_id, status=FAILED, finished_at=storage.now_ms(),
+                             message="FFmpeg ist nicht installiert. Bitte 'sudo apt-get install ffmpeg' ausführen.")
+                return
+
+            # Frame-Liste aus den Dateinamen im gewünschten Zeitraum, ohne Symlinks
+            photos = run_blocking(select_photos, self.photo_dir, options)
+            if not photos:
+                self._update(job_id, status=FAILED, finished_at=storage.now_ms(),
+                             message="Keine Fotos gefunden, um einen Zeitraffer zu erstellen.")
+                return
+
+            # Nur neue oder geänderte Tages-Segmente werden kodiert, der Rest kommt aus dem Cache
+            partial_video = os.path.join(job_dir, output_name)
+            frames = render_timelapse(photos, partial_video, job_dir, self.segment_cache,
+                                      lambda progress: self._update(job_id, progress=progress), cancel_event, options)
+            self._update(job_id, frames=frames)
+
+            # Erst das fertige Video in TIMELAPSE_DIR verschieben, damit nie halbe Dateien gelistet werden
+            os.replace(partial_video, os.path.join(self.timelapse_dir, output_name))
+            self._update(job_id, status=DONE, progress=1.0, finished_at=storage.now_ms(),
+                         message=f"Zeitraffer '{output_name}' erfolgreich erstellt!")
+            print(f"Zeitraffer-Auftrag {job_id} fertig: {output_name}")
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, finished_at=storage.now_ms(), message="Auftrag abgebrochen.")
+        except subprocess.CalledProcessError as e:
+            print(f"Fehler beim Erstellen des Zeitraffers: {e}")
+            print(f"ffmpeg stderr: {e.stderr}")
+            self._update(job_id, status=FAILED, finished_at=storage.now_ms(),
+                         message=f"Fehler beim Erstellen des Zeitraffers: {e.stderr}")
+        except Exception as e:
+            print(f"Fehler im Zeitraffer-Auftrag {job_id}: {e}")
+            self._update(job_id, status=FAILED, finished_at=storage.now_ms(), message=f"Fehler: {e}")
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+            shutil.rmtree(job_dir, ignore_errors=True)
@@ -0,0 +1,279 @@
+import datetime
+import hashlib
+import math
+import os
+import subprocess
+import time
+import metrics
+import photo_catalog
+import storage
+
+FRAMERATE = 10
+# Bei Änderungen an den Encoder-Einstellungen erhöhen, damit alte Segmente nicht mehr passen
+SEGMENT_FORMAT_VERSION = 1
+PHOTO_NAME_PATTERN = photo_catalog.PHOTO_NAME_PATTERN
+PHOTO_TIME_FORMAT = photo_catalog.PHOTO_TIME_FORMAT
+# So viele zuletzt benutzte Segmente pro Tag und Variante bleiben im Cache
+SEGMENTS_PER_DAY = 3
+
+# step: 'encode' (ein Tages-Segment) oder 'join' (Segmente per Stream-Copy aneinanderhängen)
+ffmpeg_seconds = metrics.histogram('ffmpeg_seconds', "Laufzeit eines ffmpeg-Aufrufs für Zeitraffer", ['step'])
+segments_total = metrics.counter('timelapse_segments_total', "Tages-Segmente je Zeitraffer, neu kodiert oder aus dem Cache", ['result'])
+MAX_WIDTH = 3840
+
+class JobCancelled(Exception):
+    pass
+
+def photo_day(photo_path):
+    # Aufnahmetag aus dem Dateinamen (camera_picture.py), sonst aus der Änderungszeit
+    match = PHOTO_NAME_PATTERN.search(os.path.basename(photo_path))
+    if match:
+        return match.group(1)
+    return datetime.datetime.fromtimestamp(os.path.getmtime(photo_path)).strftime("%Y%m%d")
+
+def group_by_day(photos):
+    days = {}
+    for photo in photos:
+        days.setdefault(photo_day(photo[0]), []).append(photo)
+    return sorted(days.items())
+
+def segment_key(photos, width=None):
+    # Schlüssel über die Menge der Quellfotos (Name, Größe) und das Segment-Format. Die Größe kommt
+    # aus dem Foto-Katalog, so muss auch bei komplett gecachten Segmenten kein Foto angefasst werden;
+    # nur beim Verzeichnis-Scan (Größe None) wird nachgesehen.
+    digest = hashlib.sha1(f"v{SEGMENT_FORMAT_VERSION}:{FRAMERATE}:{width}".encode())
+    for photo_path, size in photos:
+        if size is None:
+            size = os.path.getsize(photo_path)
+        digest.update(f"{os.path.basename(photo_path)}:{size}\n".encode())
+    return digest.hexdigest()[:16]
+
+def concat_line(path):
+    # Pfad für die Listen-Datei des concat-Demuxers quoten
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n"
+
+def write_image_list(photos, list_path):
+    frame_duration = 1.0 / FRAMERATE
+    with open(list_path, 'w') as f:
+        for photo_path, size in photos:
+            f.write(concat_line(photo_path))
+            f.write(f"duration {frame_duration:.6f}\n")
+        # Der concat-Demuxer übernimmt die Dauer des letzten Bildes nur, wenn es noch einmal folgt
+        f.write(concat_line(photos[-1][0]))
+
+def write_segment_list(segments, list_path):
+    with open(list_path, 'w') as f:
+        for segment_path in segments:
+            f.write(concat_line(segment_path))
+
+def encode_command(list_path, output_video, width=None):
+    command = [
+        "ffmpeg", "-y",
+        "-nostats", "-progress", "pipe:1", # Fortschritt zeilenweise als key=value auf stdout
+        "-f", "concat", "-safe", "0",
+        "-i", list_path,
+        "-r", str(FRAMERATE),
+    ]
+    if width:
+        # Höhe passend zum Seitenverhältnis, gerade für yuv420p
+        command += ["-vf", f"scale={width}:-2"]
+    return command + [
+        "-c:v", "libx264",
+        "-pix_fmt", "yuv420p",
+        "-crf", "23",
+        output_video
+    ]
+
+def join_command(list_path, output_video):
+    # Segmente haben identische Encoder-Einstellungen und werden nur aneinandergehängt
+    return [
+        "ffmpeg", "-y",
+        "-nostats", "-progress", "pipe:1",
+        "-f", "concat", "-safe", "0",
+        "-i", list_path,
+        "-c", "copy",
+        "-movflags", "+faststart",
+        output_video
+    ]
+
+# --- Auswahl der Frames ---
+
+def parse_datetime(value, end_of_day=False):
+    # 'YYYY-MM-DD' oder 'YYYY-MM-DDTHH:MM[:SS]'; ein reines Datum als Ende meint das Tagesende
+    parsed = datetime.datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed
+
+def parse_options(values, now=None):
+    # Prüft die Parameter eines Zeitraffer-Auftrags (Formular oder JSON), wirft ValueError
+    now = now or datetime.datetime.now()
+    options = {'start': None, 'end': None, 'stride': 1, 'duration': None, 'width': None}
+
+    if values.get('days'):
+        days = float(values['days'])
+        if days <= 0:
+            raise ValueError("'days' muss größer als 0 sein.")
+        options['start'] = (now - datetime.timedelta(days=days)).isoformat(timespec='seconds')
+    if values.get('start'):
+        options['start'] = parse_datetime(values['start']).isoformat(timespec='seconds')
+    if values.get('end'):
+        options['end'] = parse_datetime(values['end'], end_of_day=True).isoformat(timespec='seconds')
+    if options['start'] and options['end'] and options['start'] > options['end']:
+        raise ValueError("Der Beginn liegt nach dem Ende des Zeitraums.")
+
+    if values.get('stride'):
+        options['stride'] = int(values['stride'])
+        if options['stride'] < 1:
+            raise ValueError("'stride' muss mindestens 1 sein.")
+    if values.get('duration'):
+        options['duration'] = float(values['duration'])
+        if options['duration'] <= 0:
+            raise ValueError("'duration' muss größer als 0 sein.")
+    if values.get('width'):
+        options['width'] = int(values['width'])
+        if not 16 <= options['width'] <= MAX_WIDTH or options['width'] % 2:
+            raise ValueError(f"'width' muss gerade und zwischen 16 und {MAX_WIDTH} sein.")
+    return options
+
+def select_photos(photo_dir, options):
+    # Liste von (Pfad, Größe oder None), nach Aufnahmezeit sortiert.
+    # Bevorzugt der Foto-Katalog (Index auf der Aufnahmezeit), sonst Verzeichnis-Scan
+    start = options.get('start')
+    end = options.get('end')
+    with storage.connection() as conn:
+        if photo_catalog.has_photos(conn):
+            return photo_catalog.photo_files(conn,
+                                             storage.to_ms(datetime.datetime.fromisoformat(start)) if start else None,
+                                             storage.to_ms(datetime.datetime.fromisoformat(end)) if end else None)
+    print("Foto-Katalog ist leer, durchsuche PHOTO_DIR ('python3 photo_catalog.py' füllt den Katalog).")
+    return scan_photos(photo_dir, options)
+
+def scan_photos(photo_dir, options):
+    # Zeitraum direkt über die Dateinamen filtern, ohne die Fotos selbst anzufassen
+    start = options.get('start')
+    end = options.get('end')
+    low = datetime.datetime.fromisoformat(start).strftime(PHOTO_TIME_FORMAT) if start else None
+    high = datetime.datetime.fromisoformat(end).strftime(PHOTO_TIME_FORMAT) if end else None
+
+    photos = []
+    with os.scandir(photo_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.jpg'):
+                continue
+            match = PHOTO_NAME_PATTERN.search(entry.name)
+            if match is None:
+                # Fotos ohne Zeitstempel im Namen nur ohne Zeitraum-Filter
+                if low is None and high is None:
+                    photos.append((entry.path, None))
+                continue
+            taken = f"{match.group(1)}_{match.group(2)}"
+            if (low is None or taken >= low) and (high is None or taken <= high):
+                photos.append((entry.path, None))
+    return sorted(photos)
+
+def effective_stride(frame_count, options):
+    # Zieldauer in eine Schrittweite umrechnen; die größere von beiden gewinnt
+    stride = options.get('stride') or 1
+    duration = options.get('duration')
+    if duration:
+        stride = max(stride, math.ceil(frame_count / (duration * FRAMERATE)))
+    return stride
+
+def run_ffmpeg(command, total_frames, log_path, on_progress, cancel_event, step='encode'):
+    # Startet ffmpeg und wertet die '-progress'-Ausgabe aus; bei Abbruch wird ffmpeg beendet
+    print(f"Starte ffmpeg: {' '.join(command)}")
+    started = time.monotonic()
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log, text=True)
+        try:
+            for line in process.stdout:
+                if cancel_event.is_set():
+                    process.terminate()
+                    break
+                key, _, value = line.strip().partition('=')
+                if key == 'frame' and value.isdigit() and total_frames:
+                    on_progress(min(int(value) / total_frames, 1.0))
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            ffmpeg_seconds.observe(time.monotonic() - started, step=step)
+
+    if cancel_event.is_set():
+        raise JobCancelled()
+    if process.returncode != 0:
+        with open(log_path) as log:
+            stderr_tail = log.read()[-2000:]
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr_tail)
+
+
+class SegmentCache:
+    # Tages-Segmente als fertig kodierte MP4-Dateien: <Tag>_<Variante>_<Schlüssel>.mp4.
+    # Ändert sich die Fotomenge eines Tages, entsteht ein neuer Schlüssel und nur dieser Tag wird neu kodiert.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, day, variant, key):
+        return os.path.join(self.cache_dir, f"{day}_{variant}_{key}.mp4")
+
+    def touch(self, path):
+        # Änderungszeit als "zuletzt benutzt" für prune_day
+        os.utime(path)
+
+    def prune_day(self, day, variant):
+        # Nur die zuletzt benutzten Segmente eines Tages behalten (z.B. ganzer Tag und Teilbereich)
+        prefix = f"{day}_{variant}_"
+        paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                 if name.startswith(prefix) and name.endswith('.mp4')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[SEGMENTS_PER_DAY:]:
+            os.remove(path)
+
+
+def render_timelapse(photos, output_video, job_dir, cache, on_progress, cancel_event, options=None):
+    # Kodiert nur neue oder geänderte Tages-Segmente und hängt alle per Stream-Copy aneinander.
+    # Die Schrittweite gilt pro Tag, damit Segmente auch bei wanderndem Zeitraum gleich bleiben.
+    options = options or {}
+    stride = effective_stride(len(photos), options)
+    width = options.get('width')
+    variant = f"w{width}" if width else "orig"
+    days = [(day, day_photos[::stride]) for day, day_photos in group_by_day(photos)]
+
+    total_frames = sum(len(day_photos) for day, day_photos in days)
+    done_frames = 0
+    segments = []
+    encoded = 0
+
+    for day, day_photos in days:
+        key = segment_key(day_photos, width)
+        segment_path = cache.path(day, variant, key)
+        if os.path.exists(segment_path):
+            cache.touch(segment_path)
+            segments_total.inc(result='cached')
+        else:
+            list_path = os.path.join(job_dir, f"{day}.txt")
+            partial_path = os.path.join(job_dir, os.path.basename(segment_path))
+            write_image_list(day_photos, list_path)
+            offset = done_frames
+            run_ffmpeg(encode_command(list_path, partial_path, width), len(day_photos),
+                       os.path.join(job_dir, f"ffmpeg_{day}.log"),
+                       lambda progress: on_progress((offset + progress * len(day_photos)) / total_frames),
+                       cancel_event)
+            os.replace(partial_path, segment_path)
+            cache.prune_day(day, variant)
+            encoded += 1
+            segments_total.inc(result='encoded')
+        segments.append(segment_path)
+        done_frames += len(day_photos)
+        on_progress(done_frames / total_frames)
+
+    list_path = os.path.join(job_dir, 'segments.txt')
+    write_segment_list(segments, list_path)
+    run_ffmpeg(join_command(list_path, output_video), 0, os.path.join(job_dir, 'ffmpeg_join.log'),
+               on_progress, cancel_event, step='join')
+    print(f"Zeitraffer aus {len(segments)} Segmenten ({total_frames} Frames, Schrittweite {stride}) erstellt, "
+          f"davon {encoded} neu kodiert.")
+    return total_frames
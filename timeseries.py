@@ -0,0 +1,233 @@
+import datetime
+import math
+import numpy as np
+import metrics
+import storage
+
+# Verdichtungsstufen: (Name, Tabelle, Bucket-Länge in ms). 'raw' sind die Rohdaten,
+# die Tabellen passen zu ROLLUP_TABLES in storage.py.
+TIERS = [('raw', 'readings', None)] + [
+    (table.split('_', 1)[1], table, bucket_ms) for table, bucket_ms in storage.ROLLUP_TABLES
+]
+TIER_NAMES = [tier[0] for tier in TIERS]
+
+DEFAULT_MAX_POINTS = 500
+# Eine Stufe darf bis zu diesem Faktor mehr Punkte liefern als angefragt,
+# der Rest wird per LTTB reduziert. So bleibt die Abfrage immer beschränkt.
+TIER_HEADROOM = 4
+
+# Zeitstempel-Formate der API: ISO-Strings (bisheriges Format) oder Epoch-Millisekunden
+TIMESTAMP_FORMATS = ['iso', 'ms']
+
+SENSOR_ID = "(SELECT id FROM sensors WHERE name = ?)"
+
+# Spaltenformat für Binär-Antworten und Export: int64 ms und float32, beides little-endian
+POINT_DTYPE = np.dtype([('ts', '<i8'), ('value', '<f8')])
+TS_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f4')
+# Obergrenze für 'bis', wenn kein Ende angegeben ist
+MAX_TS = 2 ** 63 - 1
+
+# phase: 'version' (neuester Zeitstempel für den Cache), 'sql' (Stufe wählen und Zeilen holen), 'downsample' (LTTB)
+query_seconds = metrics.histogram('timeseries_query_seconds', "Zeit je Abfragephase der Graph-API", ['phase'])
+
+def count_raw_points(cursor, sensor, since_ms, limit):
+    # Zählt höchstens limit Zeilen: für die Stufenwahl reicht 'passt' oder 'zu viele',
+    # damit kostet die Probe auch bei einem Jahr Rohdaten nicht mehr als die Abfrage selbst
+    cursor.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM readings WHERE sensor_id = {SENSOR_ID} AND ts >= ? "
+                   "LIMIT ?)", (sensor, since_ms, limit))
+    return cursor.fetchone()[0]
+
+def oldest_point(cursor, sensor, tier):
+    name, table, bucket_ms = TIERS[TIER_NAMES.index(tier)]
+    column = 'ts' if bucket_ms is None else 'bucket'
+    cursor.execute(f"SELECT MIN({column}) FROM {table} WHERE sensor_id = {SENSOR_ID}", (sensor,))
+    return cursor.fetchone()[0]
+
+def tier_covers(cursor, sensor, tier, since_ms):
+    # Nach dem Aufräumen (retention.py) reicht eine feine Stufe nicht mehr so weit zurück wie die
+    # nächstgröbere; dann würde der Graph vorne abgeschnitten
+    index = TIER_NAMES.index(tier)
+    if index + 1 >= len(TIERS):
+        return True
+    oldest = oldest_point(cursor, sensor, tier)
+    coarser_oldest = oldest_point(cursor, sensor, TIER_NAMES[index + 1])
+    if oldest is None or coarser_oldest is None:
+        return True
+    return oldest <= max(since_ms, coarser_oldest) + TIERS[index + 1][2]
+
+def choose_tier(cursor, sensor, since_ms, window_ms, max_points):
+    # Feinste Stufe wählen, deren Punktzahl noch in das Budget passt und die den Zeitraum abdeckt
+    for name, table, bucket_ms in TIERS:
+        if bucket_ms is None:
+            expected = count_raw_points(cursor, sensor, since_ms, max_points * TIER_HEADROOM + 1)
+        else:
+            expected = math.ceil(window_ms / bucket_ms)
+        if expected <= max_points * TIER_HEADROOM and tier_covers(cursor, sensor, name, since_ms):
+            return name
+    return TIERS[-1][0]
+
+def fetch_series(cursor, sensor, since_ms, tier):
+    name, table, bucket_ms = TIERS[TIER_NAMES.index(tier)]
+    if bucket_ms is None:
+        cursor.execute(f"SELECT ts, value FROM readings WHERE sensor_id = {SENSOR_ID} AND ts >= ? ORDER BY ts ASC",
+                       (sensor, since_ms))
+        rows = cursor.fetchall()
+        return {
+            'labels': [row[0] for row in rows],
+            'values': [row[1] for row in rows],
+        }
+
+    # Der Bucket, in dem 'since' liegt, soll mit ausgeliefert werden
+    cursor.execute(f"SELECT bucket, sum_value / count, min_value, max_value FROM {table} "
+                   f"WHERE sensor_id = {SENSOR_ID} AND bucket >= ? ORDER BY bucket ASC",
+                   (sensor, since_ms - since_ms % bucket_ms))
+    rows = cursor.fetchall()
+    return {
+        'labels': [row[0] for row in rows],
+        'values': [round(row[1], 2) for row in rows],
+        'min': [row[2] for row in rows],
+        'max': [row[3] for row in rows],
+    }
+
+def execute_points(cursor, sensor, since_ms, tier, until_ms=None):
+    # Nur (ts, Wert) einer Stufe im Bereich [since, until), Zeilen werden vom Aufrufer abgeholt
+    name, table, bucket_ms = TIERS[TIER_NAMES.index(tier)]
+    until_ms = MAX_TS if until_ms is None else until_ms
+    if bucket_ms is None:
+        cursor.execute(f"SELECT ts, value FROM readings WHERE sensor_id = {SENSOR_ID} AND ts >= ? AND ts < ? "
+                       "ORDER BY ts ASC", (sensor, since_ms, until_ms))
+    else:
+        cursor.execute(f"SELECT bucket, sum_value / count FROM {table} "
+                       f"WHERE sensor_id = {SENSOR_ID} AND bucket >= ? AND bucket < ? ORDER BY bucket ASC",
+                       (sensor, since_ms - since_ms % bucket_ms, until_ms))
+    return cursor
+
+def to_columns(points):
+    return points['ts'], points['value'].astype(VALUE_DTYPE)
+
+def fetch_arrays(cursor, sensor, since_ms, tier, until_ms=None):
+    # Wie fetch_series, aber die Zeilen gehen direkt in NumPy-Spalten statt in Python-Listen
+    points = np.fromiter(execute_points(cursor, sensor, since_ms, tier, until_ms), dtype=POINT_DTYPE)
+    return to_columns(points)
+
+def pack_columns(ts, values):
+    # Binärformat: n int64-Zeitstempel (ms), danach n float32-Werte
+    return ts.astype(TS_DTYPE, copy=False).tobytes() + values.astype(VALUE_DTYPE, copy=False).tobytes()
+
+def lttb_indices(xs, ys, threshold):
+    # Largest-Triangle-Three-Buckets: wählt die Punkte, die den Kurvenverlauf am besten erhalten
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    indices = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(math.floor(i * bucket_size)) + 1
+        end = int(math.floor((i + 1) * bucket_size)) + 1
+
+        # Durchschnittspunkt des nächsten Buckets
+        next_start = end
+        next_end = min(int(math.floor((i + 2) * bucket_size)) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        best_area = -1.0
+        best_index = start
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best_area = area
+                best_index = j
+        indices.append(best_index)
+        a = best_index
+
+    indices.append(n - 1)
+    return indices
+
+def downsample(series, max_points):
+    if len(series['labels']) <= max_points:
+        return series
+    keep = lttb_indices(series['labels'], series['values'], max_points)
+    return {key: [values[i] for i in keep] for key, values in series.items()}
+
+def format_labels(series, timestamps):
+    if timestamps == 'iso':
+        series['labels'] = [storage.ms_to_iso(ts) for ts in series['labels']]
+    return series
+
+def query_temperature_series(cursor, hours, max_points=DEFAULT_MAX_POINTS, resolution=None,
+                             sensor=storage.DEFAULT_SENSOR, timestamps='iso'):
+    window_ms = hours * 60 * 60 * 1000
+    since_ms = storage.now_ms() - window_ms
+
+    with query_seconds.time(phase='sql'):
+        if resolution is None:
+            resolution = choose_tier(cursor, sensor, since_ms, window_ms, max_points)
+        series = fetch_series(cursor, sensor, since_ms, resolution)
+    with query_seconds.time(phase='downsample'):
+        series = downsample(series, max_points)
+    series = format_labels(series, timestamps)
+    series['resolution'] = resolution
+    return series
+
+def downsample_arrays(ts, values, max_points):
+    if len(ts) <= max_points:
+        return ts, values
+    keep = lttb_indices(ts.tolist(), values.tolist(), max_points)
+    return ts[keep], values[keep]
+
+def query_temperature_arrays(cursor, hours, max_points=DEFAULT_MAX_POINTS, resolution=None,
+                             sensor=storage.DEFAULT_SENSOR, after_ms=None):
+    # Wie query_temperature_series bzw. query_series_after, Ergebnis als (ts, Werte, Stufe)
+    with query_seconds.time(phase='sql'):
+        if after_ms is not None:
+            resolution = resolution or 'raw'
+            since_ms = after_ms + 1
+        else:
+            window_ms = hours * 60 * 60 * 1000
+            since_ms = storage.now_ms() - window_ms
+            if resolution is None:
+                resolution = choose_tier(cursor, sensor, since_ms, window_ms, max_points)
+        ts, values = fetch_arrays(cursor, sensor, since_ms, resolution)
+    with query_seconds.time(phase='downsample'):
+        ts, values = downsample_arrays(ts, values, max_points)
+    return ts, values, resolution
+
+def latest_ts(cursor, sensor=storage.DEFAULT_SENSOR):
+    # Zeitstempel des neuesten Messwerts, ein Schritt über den Primärschlüssel; dient als Cache-Version
+    with query_seconds.time(phase='version'):
+        cursor.execute(f"SELECT MAX(ts) FROM readings WHERE sensor_id = {SENSOR_ID}", (sensor,))
+        return cursor.fetchone()[0]
+
+def query_series_after(cursor, after_ms, max_points=DEFAULT_MAX_POINTS, resolution='raw',
+                       sensor=storage.DEFAULT_SENSOR, timestamps='iso'):
+    # Nur Punkte nach after_ms, für das Nachladen im Graphen. Bei verdichteten Stufen ist der
+    # Bucket, in dem after_ms liegt, wieder dabei, weil er sich seitdem noch geändert haben kann.
+    with query_seconds.time(phase='sql'):
+        series = fetch_series(cursor, sensor, after_ms + 1, resolution)
+    with query_seconds.time(phase='downsample'):
+        series = downsample(series, max_points)
+    series = format_labels(series, timestamps)
+    series['resolution'] = resolution
+    return series
+
+def sample_series(hours, timestamps='iso'):
+    # Beispielkurve, solange keine echten Messwerte vorhanden sind
+    labels = []
+    values = []
+    start_time = datetime.datetime.now() - datetime.timedelta(hours=hours)
+
+    num_points = (hours * 60) // 5
+
+    for i in range(num_points):
+        point_time = start_time + datetime.timedelta(minutes=i * 5)
+        labels.append(storage.to_ms(point_time) if timestamps == 'ms' else point_time.isoformat())
+
+        sample_temp = 22.0 + (i % 20 - 10) * 0.2 + (i % 5 - 2.5) * 0.5
+        values.append(round(sample_temp, 2))
+
+    return {'labels': labels, 'values': values}